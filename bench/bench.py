@@ -0,0 +1,464 @@
+#!/usr/bin/env python3
+
+# Benchmarks for gpml2svg, on synthetic pathways of 10 to 10,000 DataNodes.
+#
+# python3 bench/bench.py
+# python3 bench/bench.py --sizes 10 100 --scenario convert --repeat 5
+# python3 bench/bench.py --update-baseline
+#
+# gpml2pvjson, bridgedb, pvjs and svgo are replaced by the stand-ins in
+# bench/stand_ins, and the Wikidata Query Service by a local stand-in, so
+# what is measured is our own code plus the cost of starting the tools.
+# Every scenario runs in its own process, with its own empty caches.
+#
+# The results are compared with bench/baseline.json and the exit status is 1
+# when a scenario got slower or uses more memory than the tolerance allows.
+# Timings depend on the machine, so make the baseline on the machine you
+# compare on.
+
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+from os import path
+import platform
+import re
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+import xml.etree.ElementTree as StdET
+import zlib
+
+BENCH_DIR = path.dirname(path.realpath(__file__))
+sys.path.insert(0, path.join(BENCH_DIR, "..", "gpml2svg"))
+sys.path.insert(0, path.join(BENCH_DIR, "..", "svg2commons"))
+
+from commons_svg import SVG_NS, fix_svg_for_commons
+import convert
+import datasources
+import gpml
+from synthetic import write_gpml
+import wikidata
+import xref_cache
+
+
+STAND_INS_DIR = path.join(BENCH_DIR, "stand_ins")
+STAND_IN_TOOLS = ["gpml2pvjson", "bridgedb", "pvjs", "svgo"]
+DEFAULT_BASELINE_F = path.join(BENCH_DIR, "baseline.json")
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+DEFAULT_REPEAT = 5
+# how much slower or bigger than the baseline a scenario may get
+DEFAULT_TOLERANCE = 0.5
+# smaller differences are noise, however large they are relative to the baseline
+MIN_SECONDS_DIFF = 0.1
+MIN_RSS_KB_DIFF = 10 * 1024
+VALUES_ROW_RE = re.compile(r'\("((?:[^"\\]|\\.)*)" "((?:[^"\\]|\\.)*)" wdt:P\d+\)')
+
+
+class SparqlHandler(BaseHTTPRequestHandler):
+    """Stand-in for the Wikidata Query Service.
+
+    Answers the queries from wikidata.py: every pathway is in Wikidata, and
+    so are 2 of every 3 xrefs.
+    """
+
+    def do_GET(self):
+        self.respond(parse_qs(urlparse(self.path).query).get("query", [""])[0])
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.respond(parse_qs(body.decode()).get("query", [""])[0])
+
+    def respond(self, query):
+        if "wdt:P2410" in query:
+            bindings = [{"item": {"value": f"{wikidata.WD_ENTITY_IRI_BASE}Q1"}}]
+        else:
+            bindings = list()
+            for i, match in enumerate(VALUES_ROW_RE.finditer(query)):
+                if i % 3 == 2:
+                    continue
+                [datasource, identifier] = [
+                    value.replace('\\"', '"').replace("\\\\", "\\")
+                    for value in match.groups()
+                ]
+                wd_id = f"Q{zlib.crc32(identifier.encode()) % 100000000}"
+                bindings.append(
+                    {
+                        "datasource": {"value": datasource},
+                        "identifier": {"value": identifier},
+                        "item": {"value": f"{wikidata.WD_ENTITY_IRI_BASE}{wd_id}"},
+                    }
+                )
+        response_bytes = json.dumps({"results": {"bindings": bindings}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/sparql-results+json")
+        self.send_header("Content-Length", str(len(response_bytes)))
+        self.end_headers()
+        self.wfile.write(response_bytes)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def use_stand_ins():
+    """Point this process at the stand-in Wikidata Query Service.
+
+    The stand-in tools are found on PATH, which bench.py sets for the
+    processes it starts.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SparqlHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    wikidata._wd_sparql = wikidata.WikidataSparql(
+        endpoint=f"http://127.0.0.1:{server.server_port}/sparql", min_interval=0
+    )
+    # the bundled mapping, instead of downloading datasources.tsv
+    with open(datasources.BUNDLED_BRIDGEDB2WD_PROPS_F, "r") as f_in:
+        datasources._bridgedb2wd_props = json.load(f_in)
+
+
+def get_inputs(work_dir, size):
+    """Get the paths of the inputs for the pathway with size DataNodes."""
+    wp_id = f"WP{size}"
+    stub = f"{wp_id}_1"
+    inputs_dir = f"{work_dir}/inputs"
+    return {
+        "wp_id": wp_id,
+        "pathway_iri": f"http://identifiers.org/wikipathways/{wp_id}",
+        "pathway_version": "1",
+        "stub": stub,
+        "gpml": f"{inputs_dir}/{stub}.gpml",
+        "gpml_2010a": f"{inputs_dir}/2010a/{stub}.gpml",
+        "gpml_2008a": f"{inputs_dir}/2008a/{stub}.gpml",
+        "json": f"{inputs_dir}/{stub}.json",
+        "svg": f"{inputs_dir}/{stub}.svg",
+    }
+
+
+def prepare(work_dir, size):
+    """Make the synthetic GPML, and the JSON and SVG converted from it."""
+    inputs = get_inputs(work_dir, size)
+    for [version, gpml_f] in [
+        ["2013a", inputs["gpml"]],
+        ["2010a", inputs["gpml_2010a"]],
+        ["2008a", inputs["gpml_2008a"]],
+    ]:
+        os.makedirs(path.dirname(gpml_f), exist_ok=True)
+        write_gpml(gpml_f, size, version=version, wp_id=inputs["wp_id"])
+
+    args = [inputs["pathway_iri"], inputs["wp_id"], inputs["pathway_version"]]
+    convert.gpml2json(inputs["gpml"], inputs["json"], *args, build_cache=False)
+    convert.json2svg(inputs["json"], inputs["svg"], *args, "plain", build_cache=False)
+
+
+def bench_gpml2json(inputs, out_dir):
+    convert.gpml2json(
+        inputs["gpml"],
+        f"{out_dir}/{inputs['stub']}.json",
+        inputs["pathway_iri"],
+        inputs["wp_id"],
+        inputs["pathway_version"],
+        build_cache=False,
+    )
+
+
+def bench_json2svg(inputs, out_dir):
+    convert.json2svg(
+        inputs["json"],
+        [f"{out_dir}/{inputs['stub']}.svg", f"{out_dir}/{inputs['stub']}.dark.svg"],
+        inputs["pathway_iri"],
+        inputs["wp_id"],
+        inputs["pathway_version"],
+        ["plain", "dark"],
+        build_cache=False,
+    )
+
+
+def bench_commons_svg(inputs, out_dir):
+    # as in send2commons.prepare_upload, which needs pywikibot to import
+    StdET.register_namespace("", SVG_NS["svg"])
+    tree = StdET.parse(inputs["svg"])
+    fix_svg_for_commons(tree.getroot())
+    tree.write(f"{out_dir}/{inputs['stub']}.svg.processed.svg")
+
+
+def bench_convert(inputs, out_dir, gpml_key="gpml"):
+    convert.convert(
+        inputs[gpml_key],
+        f"{out_dir}/{inputs['stub']}.svg",
+        inputs["pathway_iri"],
+        inputs["wp_id"],
+        inputs["pathway_version"],
+        build_cache=False,
+    )
+
+
+SCENARIOS = {
+    "gpml2json": bench_gpml2json,
+    "json2svg": bench_json2svg,
+    "commons_svg": bench_commons_svg,
+    "convert": bench_convert,
+    "convert_2010a": lambda inputs, out_dir: bench_convert(
+        inputs, out_dir, "gpml_2010a"
+    ),
+    "convert_2008a": lambda inputs, out_dir: bench_convert(
+        inputs, out_dir, "gpml_2008a"
+    ),
+}
+
+
+def run_scenario(work_dir, scenario, size, repeat):
+    """Run one scenario repeat times and measure it.
+
+    Call this in a process of its own, so the peak memory is the scenario's.
+
+    Returns a dict with the median and min seconds per run, DataNodes per
+    second, peak RSS of this process, CPU seconds of this process and of the
+    stand-in tools, and Wikidata queries per run.
+    """
+    inputs = get_inputs(work_dir, size)
+    seconds = list()
+    cpu_s = 0.0
+    tools_cpu_s = 0.0
+    for i in range(repeat):
+        # nothing is reused from the run before
+        out_dir = f"{work_dir}/out/{scenario}/{i}"
+        os.makedirs(out_dir)
+        xref_cache._xref_cache = xref_cache.XrefCache(f"{out_dir}/xrefs.sqlite")
+        shutil.rmtree(gpml.UPGRADED_GPML_CACHE_DIR, ignore_errors=True)
+
+        usage_before = get_cpu_seconds()
+        start = time.perf_counter()
+        SCENARIOS[scenario](inputs, out_dir)
+        seconds.append(time.perf_counter() - start)
+        usage_after = get_cpu_seconds()
+        cpu_s += usage_after[0] - usage_before[0]
+        tools_cpu_s += usage_after[1] - usage_before[1]
+
+    [query_count, query_seconds] = wikidata.get_wd_sparql_stats()
+    median_seconds = statistics.median(seconds)
+    return {
+        "seconds": median_seconds,
+        "min_seconds": min(seconds),
+        "data_nodes_per_s": size / median_seconds,
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "cpu_s": cpu_s / repeat,
+        "tools_cpu_s": tools_cpu_s / repeat,
+        "sparql_queries": query_count / repeat,
+    }
+
+
+def get_cpu_seconds():
+    """Get the CPU seconds used so far by this process and by the tools it ran."""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    child_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return (
+        usage.ru_utime + usage.ru_stime,
+        child_usage.ru_utime + child_usage.ru_stime,
+    )
+
+
+def run_child(work_dir, child_args, verbose=False):
+    """Run bench.py in a new process with the stand-ins and an empty home."""
+    env = dict(os.environ)
+    env["PATH"] = STAND_INS_DIR + os.pathsep + env.get("PATH", "")
+    env["HOME"] = f"{work_dir}/home"
+    for tool in STAND_IN_TOOLS:
+        env.pop(tool.upper() + "_WORKER", None)
+    ps = subprocess.run(
+        [sys.executable, path.realpath(__file__), "--work-dir", work_dir] + child_args,
+        env=env,
+        stdout=None if verbose else subprocess.DEVNULL,
+    )
+    if ps.returncode != 0:
+        raise Exception(f"bench.py {' '.join(child_args)} failed")
+
+
+def compare(result, baseline_result, tolerance):
+    """Compare a result with its baseline.
+
+    Times are compared by the fastest run, which varies the least with
+    whatever else the machine is doing.
+
+    Returns a list of what got worse than the tolerance allows, e.g.,
+    ["time +45%"].
+    """
+    regressions = list()
+    for [name, key, min_diff] in [
+        ["time", "min_seconds", MIN_SECONDS_DIFF],
+        ["memory", "peak_rss_kb", MIN_RSS_KB_DIFF],
+    ]:
+        diff = result[key] - baseline_result[key]
+        if diff > min_diff and diff > baseline_result[key] * tolerance:
+            regressions.append(f"{name} +{100 * diff / baseline_result[key]:.0f}%")
+    return regressions
+
+
+def format_result(key, result, baseline_result):
+    line = (
+        f"{key:<22} {result['seconds']:9.3f} s (min {result['min_seconds']:.3f} s) "
+        + f"{result['data_nodes_per_s']:8.0f} DataNodes/s "
+        + f"{result['peak_rss_kb'] / 1024:7.1f} MB"
+    )
+    if baseline_result is not None:
+        line += (
+            f"  (baseline min {baseline_result['min_seconds']:.3f} s, "
+            + f"{baseline_result['peak_rss_kb'] / 1024:.1f} MB)"
+        )
+    return line
+
+
+def main():
+    """main."""
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark gpml2svg on synthetic pathways"
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=DEFAULT_SIZES,
+        help="Default: 10 100 1000 10000. Numbers of DataNodes per pathway.",
+    )
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        dest="scenarios",
+        choices=list(SCENARIOS),
+        help="Default: all. Can be specified more than once.",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=DEFAULT_REPEAT,
+        help=f"Default: {DEFAULT_REPEAT}. Runs per scenario.",
+    )
+    parser.add_argument(
+        "--baseline",
+        type=str,
+        default=DEFAULT_BASELINE_F,
+        help="Default: bench/baseline.json",
+    )
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="Save the results as the baseline instead of comparing with it",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help=f"Default: {DEFAULT_TOLERANCE}. Allowed slowdown or memory growth, "
+        + "as a fraction of the baseline.",
+    )
+    parser.add_argument(
+        "--work-dir",
+        type=str,
+        help="Default: a temporary directory, removed afterwards",
+    )
+    parser.add_argument(
+        "--verbose", action="store_true", help="Show what the conversion prints"
+    )
+    # used by bench.py to run each scenario in a process of its own
+    parser.add_argument("--prepare", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--run", nargs=2, help=argparse.SUPPRESS)
+    parser.add_argument("--result", type=str, help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.prepare is not None or args.run is not None:
+        if not gpml.UPGRADED_GPML_CACHE_DIR.startswith(args.work_dir):
+            raise Exception("--prepare and --run are only for bench.py itself")
+        use_stand_ins()
+        if args.prepare is not None:
+            prepare(args.work_dir, args.prepare)
+        else:
+            [scenario, size] = args.run
+            result = run_scenario(args.work_dir, scenario, int(size), args.repeat)
+            with open(args.result, "w") as f_out:
+                json.dump(result, f_out)
+        return
+
+    scenarios = args.scenarios or list(SCENARIOS)
+    baseline = None
+    if not args.update_baseline and path.isfile(args.baseline):
+        with open(args.baseline, "r") as f_in:
+            baseline = json.load(f_in)
+        if baseline["machine"] != platform.machine():
+            print(f"Note: the baseline was made on {baseline['machine']}")
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="wikipathways2wiki-bench-")
+    work_dir = path.realpath(work_dir)
+    results = dict()
+    regressions_by_key = dict()
+    try:
+        for size in args.sizes:
+            size_dir = f"{work_dir}/{size}"
+            run_child(size_dir, ["--prepare", str(size)], verbose=args.verbose)
+            for scenario in scenarios:
+                key = f"{scenario}/{size}"
+                result_f = f"{size_dir}/{scenario}.result.json"
+                run_child(
+                    size_dir,
+                    [
+                        "--run",
+                        scenario,
+                        str(size),
+                        "--repeat",
+                        str(args.repeat),
+                        "--result",
+                        result_f,
+                    ],
+                    verbose=args.verbose,
+                )
+                with open(result_f, "r") as f_in:
+                    results[key] = json.load(f_in)
+
+                baseline_result = None
+                if baseline is not None:
+                    baseline_result = baseline["results"].get(key)
+                print(format_result(key, results[key], baseline_result))
+                if baseline_result is not None:
+                    regressions = compare(results[key], baseline_result, args.tolerance)
+                    if regressions:
+                        print(f"  REGRESSION: {', '.join(regressions)}")
+                        regressions_by_key[key] = regressions
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.update_baseline:
+        if path.isfile(args.baseline):
+            with open(args.baseline, "r") as f_in:
+                baseline = json.load(f_in)
+            # keep the sizes and scenarios that weren't run this time
+            baseline["results"].update(results)
+            results = baseline["results"]
+        with open(args.baseline, "w") as f_out:
+            json.dump(
+                {
+                    "machine": platform.machine(),
+                    "python": platform.python_version(),
+                    "repeat": args.repeat,
+                    "results": dict(sorted(results.items())),
+                },
+                f_out,
+                indent=2,
+            )
+            f_out.write("\n")
+        print(f"Saved baseline to {args.baseline}")
+    elif baseline is None:
+        print(f"No baseline at {args.baseline}. Make one with --update-baseline.")
+    elif regressions_by_key:
+        print(f"{len(regressions_by_key)} of {len(results)} benchmarks regressed")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+import math
+
+from lxml import etree as ET
+
+
+GPML_NS_BY_VERSION = {
+    "2008a": "http://genmapp.org/GPML/2008a",
+    "2010a": "http://pathvisio.org/GPML/2010a",
+    "2013a": "http://pathvisio.org/GPML/2013a",
+}
+# GPML 2008a coordinates and sizes are in 1/15 px
+GPML_2008A_UNITS_PER_PX = 15
+
+# (datasource, first identifier, DataNode type), in the mix found on WikiPathways
+XREF_KINDS = [
+    ("Entrez Gene", 1000, "GeneProduct"),
+    ("Entrez Gene", 5000, "GeneProduct"),
+    ("Ensembl", 100000, "GeneProduct"),
+    ("ChEBI", 15000, "Metabolite"),
+    ("HMDB", 1000, "Metabolite"),
+    ("Uniprot-TrEMBL", 20000, "Protein"),
+]
+NODE_WIDTH = 80
+NODE_HEIGHT = 20
+NODE_SPACING = 120
+
+
+def get_xref(i):
+    """Get the (datasource, identifier, DataNode type) of the ith DataNode.
+
+    Every 10th DataNode has no Xref and every 7th repeats an earlier one,
+    like the same gene drawn twice.
+    """
+    if i % 10 == 9:
+        return None
+    if i % 7 == 6:
+        i = i // 2
+    [datasource, first_identifier, node_type] = XREF_KINDS[i % len(XREF_KINDS)]
+    identifier = str(first_identifier + i)
+    if datasource == "Ensembl":
+        identifier = f"ENSG{int(identifier):011d}"
+    elif datasource == "ChEBI":
+        identifier = f"CHEBI:{identifier}"
+    elif datasource == "HMDB":
+        identifier = f"HMDB{int(identifier):07d}"
+    elif datasource == "Uniprot-TrEMBL":
+        identifier = f"P{int(identifier):05d}"
+    return (datasource, identifier, node_type)
+
+
+def make_gpml(data_node_count, version="2013a", wp_id="WP0"):
+    """Make a synthetic GPML pathway.
+
+    The DataNodes are on a grid, with an Interaction from each one to the
+    next and a Label for every 10 DataNodes. 2008a uses its own units and
+    attribute names, as PathVisio wrote it.
+
+    Keyword arguments:
+    data_node_count -- number of DataNodes, e.g., 1000
+    version -- GPML version: 2008a, 2010a or 2013a (default 2013a)
+    wp_id -- e.g., WP4542
+
+    Returns the GPML as bytes.
+    """
+    ns = GPML_NS_BY_VERSION[version]
+    units = GPML_2008A_UNITS_PER_PX if version == "2008a" else 1
+    [x_attr, y_attr] = ["x", "y"] if version == "2008a" else ["X", "Y"]
+    [rel_x_attr, rel_y_attr] = (
+        ["relX", "relY"] if version == "2008a" else ["RelX", "RelY"]
+    )
+
+    def num(value):
+        return str(float(value * units))
+
+    columns = max(1, int(math.sqrt(data_node_count)))
+    rows = math.ceil(data_node_count / columns)
+
+    pathway = ET.Element(
+        f"{{{ns}}}Pathway",
+        nsmap={None: ns},
+        Name=f"Synthetic pathway with {data_node_count} DataNodes",
+        Organism="Homo sapiens",
+        Version=wp_id,
+    )
+    comment = ET.SubElement(
+        pathway, f"{{{ns}}}Comment", Source="WikiPathways-description"
+    )
+    comment.text = "A synthetic pathway for benchmarks."
+    board = ET.SubElement(
+        pathway,
+        f"{{{ns}}}Graphics",
+        BoardWidth=num(columns * NODE_SPACING + NODE_SPACING),
+        BoardHeight=num(rows * NODE_SPACING + NODE_SPACING),
+    )
+    if version == "2008a":
+        board.set("WindowWidth", num(1000))
+        board.set("WindowHeight", num(800))
+
+    def center(i):
+        return (
+            NODE_SPACING * (i % columns + 1),
+            NODE_SPACING * (i // columns + 1),
+        )
+
+    for i in range(data_node_count):
+        xref = get_xref(i)
+        [datasource, identifier, node_type] = (
+            xref if xref is not None else ["", "", "GeneProduct"]
+        )
+        data_node = ET.SubElement(
+            pathway,
+            f"{{{ns}}}DataNode",
+            TextLabel=f"N{i}",
+            GraphId=f"n{i}",
+            Type=node_type,
+        )
+        [center_x, center_y] = center(i)
+        ET.SubElement(
+            data_node,
+            f"{{{ns}}}Graphics",
+            CenterX=num(center_x),
+            CenterY=num(center_y),
+            Width=num(NODE_WIDTH),
+            Height=num(NODE_HEIGHT),
+            ZOrder="32768",
+            FontSize="10",
+            Valign="Middle",
+        )
+        ET.SubElement(data_node, f"{{{ns}}}Xref", Database=datasource, ID=identifier)
+
+    for i in range(data_node_count - 1):
+        interaction = ET.SubElement(pathway, f"{{{ns}}}Interaction", GraphId=f"e{i}")
+        graphics = ET.SubElement(
+            interaction, f"{{{ns}}}Graphics", ZOrder="12288", LineThickness="1.0"
+        )
+        for [j, rel_x, arrow_head] in [[i, 1.0, None], [i + 1, -1.0, "Arrow"]]:
+            [center_x, center_y] = center(j)
+            point = ET.SubElement(graphics, f"{{{ns}}}Point")
+            point.set(x_attr, num(center_x + rel_x * NODE_WIDTH / 2))
+            point.set(y_attr, num(center_y))
+            point.set("GraphRef", f"n{j}")
+            point.set(rel_x_attr, str(rel_x))
+            point.set(rel_y_attr, "0.0")
+            if arrow_head:
+                point.set("ArrowHead", arrow_head)
+        ET.SubElement(interaction, f"{{{ns}}}Xref", Database="", ID="")
+
+    for i in range(0, data_node_count, 10):
+        label = ET.SubElement(
+            pathway, f"{{{ns}}}Label", TextLabel=f"Label {i}", GraphId=f"l{i}"
+        )
+        [center_x, center_y] = center(i)
+        ET.SubElement(
+            label,
+            f"{{{ns}}}Graphics",
+            CenterX=num(center_x),
+            CenterY=num(center_y - NODE_HEIGHT * 1.5),
+            Width=num(NODE_WIDTH),
+            Height=num(NODE_HEIGHT),
+            ZOrder="28672",
+            FontSize="12",
+            Valign="Middle",
+        )
+
+    ET.SubElement(pathway, f"{{{ns}}}InfoBox", CenterX="0.0", CenterY="0.0")
+    ET.SubElement(pathway, f"{{{ns}}}Biopax")
+    return ET.tostring(pathway, xml_declaration=True, encoding="UTF-8")
+
+
+def write_gpml(gpml_f, data_node_count, version="2013a", wp_id="WP0"):
+    """Write a synthetic GPML pathway to gpml_f. See make_gpml."""
+    with open(gpml_f, "wb") as f_out:
+        f_out.write(make_gpml(data_node_count, version=version, wp_id=wp_id))
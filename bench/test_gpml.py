@@ -0,0 +1,113 @@
+# Tests for upgrading old GPML in gpml2svg/gpml.py.
+#
+# python3 -m pytest bench/test_gpml.py
+#
+# bench/fixtures has the same small pathway as GPML 2008a, 2010a and 2013a.
+# The 2013a file is what upgrading either of the others must give. It was
+# checked by hand against the GPML schemas: 2008a coordinates and sizes in
+# 1/15 px, x/y/relX/relY instead of X/Y/RelX/RelY and a window size, and
+# 2010a the same as 2013a but for the namespace. PathVisio isn't run here,
+# so its own output for these files hasn't been compared.
+
+from os import path
+import sys
+import tempfile
+
+from lxml import etree as ET
+import pytest
+
+BENCH_DIR = path.dirname(path.realpath(__file__))
+sys.path.insert(0, path.join(BENCH_DIR, "..", "gpml2svg"))
+
+import convert
+from gpml import (
+    get_gpml_version,
+    LATEST_GPML_VERSION,
+    UPGRADABLE_GPML_VERSIONS,
+    upgrade_gpml,
+    upgrade_gpml_bytes,
+)
+
+
+FIXTURES_DIR = path.join(BENCH_DIR, "fixtures")
+
+
+def get_fixture_f(gpml_version):
+    return path.join(FIXTURES_DIR, f"upgrade.{gpml_version}.gpml")
+
+
+def assert_same_gpml(actual_el, expected_el):
+    """Assert two GPML trees are the same, comparing numbers as numbers."""
+    assert actual_el.tag == expected_el.tag
+    assert (actual_el.text or "").strip() == (expected_el.text or "").strip()
+    assert sorted(actual_el.attrib) == sorted(expected_el.attrib), actual_el.tag
+    for [name, expected_value] in expected_el.attrib.items():
+        actual_value = actual_el.get(name)
+        try:
+            expected_number = float(expected_value)
+        except ValueError:
+            assert actual_value == expected_value, name
+        else:
+            assert float(actual_value) == pytest.approx(expected_number), name
+    assert len(actual_el) == len(expected_el), actual_el.tag
+    for [actual_child, expected_child] in zip(actual_el, expected_el):
+        assert_same_gpml(actual_child, expected_child)
+
+
+@pytest.mark.parametrize("gpml_version", ["2008a", "2010a"])
+def test_upgrade_gpml_bytes(gpml_version):
+    assert gpml_version in UPGRADABLE_GPML_VERSIONS
+    with open(get_fixture_f(gpml_version), "rb") as f_in:
+        upgraded = ET.fromstring(upgrade_gpml_bytes(f_in.read(), gpml_version))
+    expected = ET.parse(get_fixture_f(LATEST_GPML_VERSION)).getroot()
+    assert_same_gpml(upgraded, expected)
+
+
+def test_upgrade_gpml_2008a_values():
+    with open(get_fixture_f("2008a"), "rb") as f_in:
+        upgraded = ET.fromstring(upgrade_gpml_bytes(f_in.read(), "2008a"))
+    ns = {"gpml": "http://pathvisio.org/GPML/2013a"}
+    [board] = upgraded.xpath("gpml:Graphics", namespaces=ns)
+    assert board.attrib == {"BoardWidth": "600.0", "BoardHeight": "400.0"}
+    [data_node_graphics] = upgraded.xpath("gpml:DataNode/gpml:Graphics", namespaces=ns)
+    assert data_node_graphics.get("CenterX") == "120.0"
+    assert data_node_graphics.get("CenterY") == "80.5"
+    assert data_node_graphics.get("Width") == "80.0"
+    assert data_node_graphics.get("FontSize") == "10"
+    [point, free_point] = upgraded.xpath("//gpml:Point", namespaces=ns)
+    assert [point.get("X"), point.get("Y")] == ["160.0", "80.5"]
+    assert [point.get("RelX"), point.get("RelY")] == ["1.0", "0.0"]
+    assert free_point.get("ArrowHead") == "Arrow"
+    [shape_graphics] = upgraded.xpath("gpml:Shape/gpml:Graphics", namespaces=ns)
+    # radians in every version
+    assert shape_graphics.get("Rotation") == "0.785"
+
+
+def test_upgrade_gpml_only_for_tested_versions(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        gpml_2007_f = path.join(tmp_dir, "WP1.gpml")
+        with open(get_fixture_f("2008a"), "rb") as f_in:
+            gpml_bytes = f_in.read().replace(b"GPML/2008a", b"GPML/2007")
+        with open(gpml_2007_f, "wb") as f_out:
+            f_out.write(gpml_bytes)
+        assert get_gpml_version(gpml_2007_f) == "2007"
+        assert upgrade_gpml(gpml_2007_f, cache_dir=tmp_dir) is None
+        with pytest.raises(Exception, match="Can't upgrade GPML 2007"):
+            upgrade_gpml_bytes(gpml_bytes, "2007")
+
+        # so PathVisio upgrades it
+        pathvisio_upgraded_f = path.join(tmp_dir, "cache", "upgraded.gpml")
+        converted = list()
+
+        def pathvisio_convert(path_in, path_out, *args):
+            converted.append(path_in)
+            with open(path_out, "wb") as f_out:
+                f_out.write(b"<Pathway/>")
+
+        monkeypatch.setattr(convert, "convert", pathvisio_convert)
+        monkeypatch.setattr(
+            convert, "get_upgraded_gpml_f", lambda gpml_bytes: pathvisio_upgraded_f
+        )
+        upgraded_f = convert.get_latest_gpml_f(gpml_2007_f, None, "WP1", "1")
+        assert upgraded_f == pathvisio_upgraded_f
+        assert converted == [gpml_2007_f]
@@ -0,0 +1,40 @@
+# Tests for the stage records in gpml2svg/instrument.py.
+#
+# python3 -m pytest bench/test_instrument.py
+
+from os import path
+import sys
+
+BENCH_DIR = path.dirname(path.realpath(__file__))
+sys.path.insert(0, path.join(BENCH_DIR, "..", "gpml2svg"))
+
+from instrument import get_peak_rss, stage, start_recording, stop_recording, summarize
+
+
+ALLOCATED_BYTES = 200 * 1024 * 1024
+
+
+def allocate():
+    data = bytearray(ALLOCATED_BYTES)
+    # touch every page, so it's resident
+    data[::4096] = b"x" * len(data[::4096])
+    del data
+
+
+def test_stage_records_peak_rss_growth():
+    start_recording()
+    with stage("first"):
+        allocate()
+    # the same again stays below the peak from the first stage
+    with stage("second"):
+        allocate()
+    [first, second] = stop_recording()
+
+    assert "peak_rss_kb" not in first
+    assert first["peak_rss_growth_kb"] > ALLOCATED_BYTES // 1024 // 2
+    assert second["peak_rss_growth_kb"] < first["peak_rss_growth_kb"] // 2
+    assert get_peak_rss()["peak_rss_kb"] > ALLOCATED_BYTES // 1024
+
+    summary = summarize([first, second, dict(second, stage="first")])
+    assert summary["first"]["count"] == 2
+    assert summary["first"]["max_peak_rss_growth_kb"] == first["peak_rss_growth_kb"]
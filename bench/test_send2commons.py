@@ -0,0 +1,243 @@
+# Tests for svg2commons/send2commons.py, with a stand-in for pywikibot.
+#
+# python3 -m pytest bench/test_send2commons.py
+#
+# pywikibot isn't needed: a fake module records the description edits and the
+# uploads, so nothing is sent to Commons.
+
+import json
+import os
+from os import path
+import sys
+import tempfile
+import types
+
+import pytest
+
+BENCH_DIR = path.dirname(path.realpath(__file__))
+sys.path.insert(0, path.join(BENCH_DIR, "..", "svg2commons"))
+
+
+class FakeSite:
+    def __init__(self):
+        self.edits = list()
+        self.uploads = list()
+
+    def login(self):
+        pass
+
+
+class FakeFilePage:
+    def __init__(self, site, title):
+        self.site = site
+        self.title = title
+
+    def put(self, text, summary=None):
+        self.site.edits.append((self.title, text))
+
+
+class FakeUploadRobot:
+    def __init__(self, url, description, useFilename, targetSite, **kwargs):
+        self.description = description
+        self.use_filename = useFilename
+        self.site = targetSite
+
+    def upload_file(self, filename):
+        self.site.uploads.append((self.use_filename, self.description))
+        return self.use_filename
+
+
+fake_pywikibot = types.ModuleType("pywikibot")
+fake_pywikibot.FilePage = FakeFilePage
+fake_pywikibot.getSite = lambda *args: FakeSite()
+fake_pywikibot.stopme = lambda: None
+fake_specialbots = types.ModuleType("pywikibot.specialbots")
+fake_specialbots.UploadRobot = FakeUploadRobot
+fake_pywikibot.specialbots = fake_specialbots
+sys.modules.setdefault("pywikibot", fake_pywikibot)
+sys.modules.setdefault("pywikibot.specialbots", fake_specialbots)
+
+import send2commons
+from send2commons import CommonsLedger, complete_desc_and_upload, get_sha1
+
+
+PAGETITLE = "Some pathway (Homo sapiens).svg"
+SVGO_STAND_IN_F = path.join(BENCH_DIR, "stand_ins", "svgo")
+
+
+@pytest.fixture
+def work_dir():
+    with tempfile.TemporaryDirectory() as work_dir:
+        yield work_dir
+
+
+def write_svg(work_dir, text):
+    svg_f = path.join(work_dir, "WP1.svg.processed.svg")
+    with open(svg_f, "w") as f_out:
+        f_out.write(text)
+    return svg_f
+
+
+def upload(svg_f, site, ledger, desc="A pathway.", commons_sha1=None):
+    return complete_desc_and_upload(
+        filename=svg_f,
+        pagetitle=PAGETITLE,
+        desc=desc,
+        date="23:55, 14 June 2019",
+        categories="[[Category:WikiPathways]]",
+        source="Published as WP1",
+        author="WikiPathways community",
+        wpid="WP1",
+        qid="Q1",
+        target_site=site,
+        ledger=ledger,
+        commons_sha1=commons_sha1,
+    )
+
+
+def test_upload_sends_only_what_changed(work_dir):
+    site = FakeSite()
+    ledger = CommonsLedger(path.join(work_dir, "ledger.sqlite"))
+    svg_f = write_svg(work_dir, "<svg/>")
+
+    # new file
+    assert upload(svg_f, site, ledger) == "uploaded"
+    assert [title for [title, text] in site.uploads] == [PAGETITLE]
+    [description] = [text for [title, text] in site.uploads]
+    assert ledger.get(PAGETITLE)[0] == get_sha1(svg_f)
+
+    # unchanged
+    site.uploads.clear()
+    site.edits.clear()
+    assert upload(svg_f, site, ledger, commons_sha1=get_sha1(svg_f)) == "unchanged"
+    assert site.uploads == []
+    assert site.edits == []
+
+    # description only
+    assert upload(svg_f, site, ledger, desc="Another pathway.") == (
+        "description_updated"
+    )
+    assert site.uploads == []
+    [[title, text]] = site.edits
+    assert title == "File:" + PAGETITLE
+    assert "Another pathway." in text
+
+    # new file version, and the description page gets its new text too
+    site.edits.clear()
+    svg_f = write_svg(work_dir, "<svg><g/></svg>")
+    assert upload(svg_f, site, ledger, desc="A pathway.") == "uploaded"
+    assert len(site.uploads) == 1
+    assert site.edits == [("File:" + PAGETITLE, description)]
+
+
+def test_upload_with_empty_ledger(work_dir):
+    site = FakeSite()
+    svg_f = write_svg(work_dir, "<svg/>")
+
+    # the file on Commons is the same, so it's only recorded
+    ledger = CommonsLedger(path.join(work_dir, "ledger.sqlite"))
+    assert upload(svg_f, site, ledger, commons_sha1=get_sha1(svg_f)) == "unchanged"
+    assert site.uploads == []
+    assert site.edits == []
+    assert ledger.get(PAGETITLE)[0] == get_sha1(svg_f)
+    assert upload(svg_f, site, ledger) == "unchanged"
+
+    # a new version of a file already on Commons also gets its description
+    ledger = CommonsLedger(path.join(work_dir, "other_ledger.sqlite"))
+    assert upload(svg_f, site, ledger, commons_sha1="0" * 40) == "uploaded"
+    assert len(site.uploads) == 1
+    assert [title for [title, text] in site.edits] == ["File:" + PAGETITLE]
+
+
+def test_failed_upload_is_not_recorded(work_dir, monkeypatch):
+    site = FakeSite()
+    ledger = CommonsLedger(path.join(work_dir, "ledger.sqlite"))
+    svg_f = write_svg(work_dir, "<svg/>")
+    monkeypatch.setattr(FakeUploadRobot, "upload_file", lambda self, filename: None)
+    with pytest.raises(Exception, match="Failed to upload"):
+        upload(svg_f, site, ledger)
+    assert ledger.get(PAGETITLE) is None
+
+
+def write_pathway(work_dir, wpid):
+    """Write the SVG and the pathway JSON prepare_upload reads for wpid."""
+    with open(path.join(work_dir, f"{wpid}.svg"), "w") as f_out:
+        f_out.write('<svg xmlns="http://www.w3.org/2000/svg"><!-- x --><g/></svg>')
+    pathway = {
+        "name": f"Pathway {wpid}",
+        "organism": "Homo sapiens",
+        "pathwayVersion": "1",
+        "comments": [{"source": "WikiPathways-description", "content": "A pathway."}],
+    }
+    with open(path.join(work_dir, "json", f"{wpid}.json"), "w") as f_out:
+        json.dump({"pathway": pathway}, f_out)
+
+
+def test_upload_batch_goes_on_after_failures(work_dir, monkeypatch, capsys):
+    # the SVGs are prepared in forked processes, which see these changes
+    monkeypatch.chdir(work_dir)
+    os.makedirs(path.join(work_dir, "json"))
+    monkeypatch.setattr(send2commons, "PATHWAY_JSON_DIR", path.join(work_dir, "json"))
+    monkeypatch.setattr(send2commons, "SVGO", SVGO_STAND_IN_F)
+    for wpid in ["WP1", "WP3", "WP4", "WP5"]:
+        write_pathway(work_dir, wpid)
+    # WP2 has no pathway JSON, so it fails to prepare
+    entries = [
+        {"wpid": wpid, "qid": "Q1", "date": "14 June 2019", "categories": "A, B"}
+        for wpid in ["WP1", "WP2", "WP3", "WP4", "WP5"]
+    ]
+    manifest_f = path.join(work_dir, "pathways.jsonl")
+    with open(manifest_f, "w") as f_out:
+        f_out.write("\n".join(json.dumps(entry) for entry in entries) + "\n\n")
+
+    monkeypatch.setattr(
+        send2commons,
+        "get_commons_sha1s",
+        lambda session, pagetitles: {"Pathway WP3 (Homo sapiens).svg": "0" * 40},
+    )
+    uploads = dict()
+    statuses = {"WP1": "uploaded", "WP3": "unchanged", "WP5": "description_updated"}
+
+    def complete_desc_and_upload(**upload):
+        uploads[upload["wpid"]] = upload
+        if upload["wpid"] == "WP4":
+            raise Exception("Failed to upload")
+        return statuses[upload["wpid"]]
+
+    monkeypatch.setattr(
+        send2commons, "complete_desc_and_upload", complete_desc_and_upload
+    )
+    summaries = list()
+    real_upload_batch = send2commons.upload_batch
+
+    def upload_batch(*args, **kwargs):
+        summaries.append(real_upload_batch(*args, **kwargs))
+        return summaries[-1]
+
+    monkeypatch.setattr(send2commons, "upload_batch", upload_batch)
+
+    with pytest.raises(SystemExit) as excinfo:
+        send2commons.batch_main(
+            ["--manifest", manifest_f, "-j", "2", "--upload-interval", "0"]
+        )
+    assert excinfo.value.code == 1
+
+    [summary] = summaries
+    assert summary["uploaded"] == ["WP1"]
+    assert summary["description_updated"] == ["WP5"]
+    assert summary["unchanged"] == ["WP3"]
+    assert sorted(summary["failed"]) == ["WP2", "WP4"]
+    assert sorted(uploads) == ["WP1", "WP3", "WP4", "WP5"]
+    assert uploads["WP3"]["commons_sha1"] == "0" * 40
+    assert uploads["WP1"]["commons_sha1"] is None
+    assert uploads["WP1"]["filename"] == "WP1.svg.processed.svg"
+    assert uploads["WP1"]["categories"].endswith("[[Category:A]][[Category:B]]")
+    with open(path.join(work_dir, "WP1.svg.processed.svg")) as f_in:
+        assert "<!--" not in f_in.read()
+
+    output = capsys.readouterr().out
+    assert "Failed to prepare WP2: " in output
+    assert "Failed to upload WP4: Failed to upload" in output
+    assert "Uploaded 1, updated description of 1, skipped 1 unchanged, failed 2" in (
+        output
+    )
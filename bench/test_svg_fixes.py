@@ -0,0 +1,153 @@
+# Regression test for the inherited stroke-width fix, on large synthetic SVGs.
+#
+# python3 -m pytest bench/test_svg_fixes.py
+#
+# Checks set_inherited_stroke_widths from gpml2svg/svg_fixes.py, on its own
+# and through fix_svg_for_commons from svg2commons/commons_svg.py, against
+# the quadratic implementation it replaced, and checks that its run time
+# grows linearly with the SVG.
+
+from os import path
+import sys
+import time
+import xml.etree.ElementTree as StdET
+
+from lxml import etree as ET
+
+BENCH_DIR = path.dirname(path.realpath(__file__))
+sys.path.insert(0, path.join(BENCH_DIR, "..", "gpml2svg"))
+sys.path.insert(0, path.join(BENCH_DIR, "..", "svg2commons"))
+
+from commons_svg import fix_svg_for_commons
+from svg_fixes import INHERIT_STYLE, set_inherited_stroke_widths
+
+
+SVG_NS = "http://www.w3.org/2000/svg"
+# groups in the small and the large SVG for the timings
+SMALL_SIZE = 2000
+LARGE_SIZE = 8000
+# linear is about LARGE_SIZE / SMALL_SIZE, quadratic about its square
+MAX_TIME_RATIO = 2 * LARGE_SIZE / SMALL_SIZE
+REPEAT = 5
+
+
+def make_svg(group_count, stroke_widths=("2",), etree=ET):
+    """Make an SVG like the ones from pvjs, with inherit-styled elements.
+
+    Each group holds a few inherit-styled paths and a nested group, some with
+    a stroke-width and some without, and an unstyled rect.
+
+    Keyword arguments:
+    group_count -- number of top-level groups
+    stroke_widths -- stroke-widths the groups cycle through
+    etree -- lxml.etree or xml.etree.ElementTree
+    """
+    root = etree.Element(f"{{{SVG_NS}}}svg")
+    for i in range(group_count):
+        group = etree.SubElement(root, f"{{{SVG_NS}}}g", id=f"g{i}")
+        if i % 5 != 4:
+            group.set("stroke-width", stroke_widths[i % len(stroke_widths)])
+        for j in range(3):
+            etree.SubElement(group, f"{{{SVG_NS}}}path", style=INHERIT_STYLE)
+        etree.SubElement(group, f"{{{SVG_NS}}}rect", style="fill:red")
+        nested = etree.SubElement(group, f"{{{SVG_NS}}}g")
+        if i % 3 == 0:
+            nested.set("stroke-width", stroke_widths[(i + 1) % len(stroke_widths)])
+        etree.SubElement(nested, f"{{{SVG_NS}}}path", style=INHERIT_STYLE)
+    return root
+
+
+def set_inherited_stroke_widths_quadratic(root):
+    """The implementation from before, from json2svg and send2commons."""
+    style_selector = f"[@style='{INHERIT_STYLE}']"
+    for el_parent in root.findall(f".//*{style_selector}/.."):
+        stroke_width = el_parent.attrib.get("stroke-width", 1)
+        for el in root.findall(f".//*{style_selector}"):
+            el.set(
+                "style",
+                f"color:inherit;fill:inherit;fill-opacity:inherit;stroke:inherit;stroke-width:{str(stroke_width)}",
+            )
+
+
+def get_stroke_widths(root):
+    """Get the stroke-width set in the style of each styled element, in order."""
+    return [
+        el.get("style").split("stroke-width:")[1]
+        for el in root.iter()
+        if (el.get("style") or "").startswith("color:inherit")
+    ]
+
+
+def get_expected_stroke_widths(root):
+    """Get the stroke-width each inherit-styled element should get: its own
+    parent's, with a default of 1.
+    """
+    return [
+        str(parent.get("stroke-width", 1))
+        for parent in root.iter()
+        for el in parent
+        if el.get("style") == INHERIT_STYLE
+    ]
+
+
+def get_min_seconds(fix, group_count, etree):
+    seconds = list()
+    for i in range(REPEAT):
+        root = make_svg(group_count, stroke_widths=("1", "2", "3.5"), etree=etree)
+        start = time.perf_counter()
+        fix(root)
+        seconds.append(time.perf_counter() - start)
+    return min(seconds)
+
+
+FIXES = [set_inherited_stroke_widths, fix_svg_for_commons]
+ETREES = [ET, StdET]
+
+
+def make_one_stroke_width_svg(group_count, etree):
+    """Make an SVG where every group has the same stroke-width."""
+    root = make_svg(group_count, etree=etree)
+    for el in root.iter(f"{{{SVG_NS}}}g"):
+        el.set("stroke-width", "2")
+    return root
+
+
+def test_same_as_quadratic_with_one_stroke_width():
+    # with one stroke-width, and no default, the old implementation was right
+    for fix in FIXES:
+        for etree in ETREES:
+            root = make_one_stroke_width_svg(500, etree)
+            expected = make_one_stroke_width_svg(500, etree)
+            set_inherited_stroke_widths_quadratic(expected)
+            fix(root)
+            assert etree.tostring(root) == etree.tostring(expected)
+
+
+def test_own_parent_stroke_width():
+    for fix in FIXES:
+        for etree in ETREES:
+            root = make_svg(500, stroke_widths=("1", "2", "3.5"), etree=etree)
+            expected_stroke_widths = get_expected_stroke_widths(root)
+            fix(root)
+            assert get_stroke_widths(root) == expected_stroke_widths
+            assert not any(
+                el.get("style") == INHERIT_STYLE for el in root.iter()
+            ), "an inherit-styled element was left"
+
+    # the old implementation gave every element the same stroke-width
+    root = make_svg(500, stroke_widths=("1", "2", "3.5"))
+    expected_stroke_widths = get_expected_stroke_widths(root)
+    set_inherited_stroke_widths_quadratic(root)
+    assert get_stroke_widths(root) != expected_stroke_widths
+
+
+def test_linear_time():
+    for fix in FIXES:
+        for etree in ETREES:
+            small_seconds = get_min_seconds(fix, SMALL_SIZE, etree)
+            large_seconds = get_min_seconds(fix, LARGE_SIZE, etree)
+            ratio = large_seconds / small_seconds
+            assert ratio < MAX_TIME_RATIO, (
+                f"{fix.__name__} on {etree.__name__}: {LARGE_SIZE} groups took "
+                + f"{ratio:.1f}x as long as {SMALL_SIZE} groups"
+            )
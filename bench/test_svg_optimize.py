@@ -0,0 +1,329 @@
+# Tests for the SVG optimizer in gpml2svg/svg_optimize.py.
+#
+# python3 -m pytest bench/test_svg_optimize.py
+#
+# Each plugin runs on a small SVG snippet. Then json2svg runs on a small
+# pathway with the pvjs stand-in, and the optimized SVG must render the same
+# elements as the SVG from before optimizing, with the same ids and typeof
+# attributes. svgo isn't run here, so the SVGs aren't compared with svgo's
+# own output for svgo-config.json; the svgo stand-in only drops comments.
+
+import json
+import os
+from os import path
+import sys
+import tempfile
+
+from lxml import etree as ET
+import pytest
+
+BENCH_DIR = path.dirname(path.realpath(__file__))
+sys.path.insert(0, path.join(BENCH_DIR, "..", "gpml2svg"))
+
+import convert
+from svg_optimize import (
+    convert_color,
+    get_enabled_plugins,
+    get_skipped_plugins,
+    INHERITABLE_ATTRS,
+    optimize_svg,
+    parse_style,
+    PLUGINS,
+    WHITESPACE_RE,
+)
+import workers
+
+
+STAND_INS_DIR = path.join(BENCH_DIR, "stand_ins")
+SVGO_CONFIG_F = path.join(BENCH_DIR, "..", "gpml2svg", "svgo-config.json")
+SVG_START = (
+    '<svg xmlns="http://www.w3.org/2000/svg" '
+    + 'xmlns:xlink="http://www.w3.org/1999/xlink">'
+)
+# plugin name -> (SVG snippet, the snippet after the plugin ran)
+PLUGIN_CASES = {
+    "removeComments": ("<!-- a --><!--! license --><g/>", "<!--! license --><g/>"),
+    "removeMetadata": ("<metadata>x</metadata><g/>", "<g/>"),
+    "removeTitle": ("<title>T</title><g/>", "<g/>"),
+    "removeDesc": ("<desc>D</desc><g/>", "<g/>"),
+    "removeScriptElement": ("<script>alert(1)</script><g/>", "<g/>"),
+    "removeStyleElement": ("<style>.a{fill:red}</style><g/>", "<g/>"),
+    "removeEditorsNSData": (
+        '<g xmlns:inkscape="http://www.inkscape.org/namespaces/inkscape" '
+        + 'inkscape:label="L"><inkscape:x/><rect/></g>',
+        "<g><rect/></g>",
+    ),
+    "cleanupAttrs": ('<path d=" M0,0\n  L1,1 "/>', '<path d="M0,0 L1,1"/>'),
+    "removeEmptyAttrs": (
+        '<g fill="" requiredFeatures=""/>',
+        '<g requiredFeatures=""/>',
+    ),
+    "removeHiddenElems": (
+        '<rect width="0" height="5"/><circle r="0"/><g display="none"/>'
+        + '<g opacity="0" id="referenced"/><rect width="5" height="5"/>',
+        '<g opacity="0" id="referenced"/><rect width="5" height="5"/>',
+    ),
+    "removeEmptyText": (
+        "<text/><text>a<tspan/></text><tref/>",
+        "<text>a</text>",
+    ),
+    "convertStyleToAttrs": (
+        '<rect fill="blue" style="fill:red; stroke-width: 2;'
+        + 'cursor:pointer !important;foo:bar"/>',
+        '<rect fill="red" stroke-width="2" '
+        + 'style="cursor:pointer !important;foo:bar"/>',
+    ),
+    "convertColors": (
+        '<rect fill="#FF0000" stroke="rgb(0, 0, 255)" color="white"/>',
+        '<rect fill="red" stroke="#00f" color="#fff"/>',
+    ),
+    "removeRasterImages": (
+        '<image xlink:href="a.png"/><image xlink:href="b.svg"/>',
+        '<image xlink:href="b.svg"/>',
+    ),
+    "removeUselessDefs": (
+        '<defs><path d="M0,0"/><g><path id="p"/></g><style>x</style></defs>',
+        '<defs><g><path id="p"/></g><style>x</style></defs>',
+    ),
+    "collapseGroups": (
+        '<g><g fill="red"><rect/></g><g fill="red"><rect fill="blue"/></g>'
+        + '<g transform="scale(2)"><rect/></g></g>',
+        '<rect fill="red"/><g fill="red"><rect fill="blue"/></g>'
+        + '<g transform="scale(2)"><rect/></g>',
+    ),
+    "removeEmptyContainers": (
+        '<g/><g filter="url(#f)"/><defs/><mask id="m"/>'
+        + '<pattern xlink:href="#p"/><g><g/></g>',
+        '<g filter="url(#f)"/><mask id="m"/><pattern xlink:href="#p"/>',
+    ),
+    "removeUnusedNS": ("<g/>", "<g/>"),
+    "sortDefsChildren": (
+        '<defs><marker id="m"/><path id="a"/><path id="b"/></defs>',
+        '<defs><path id="a"/><path id="b"/><marker id="m"/></defs>',
+    ),
+    "sortAttrs": (
+        '<rect stroke="b" foo="x" fill="a" height="1" id="r" width="2"/>',
+        '<rect id="r" width="2" height="1" fill="a" stroke="b" foo="x"/>',
+    ),
+}
+# elements that draw something
+RENDERED_TAGS = [
+    "circle",
+    "ellipse",
+    "image",
+    "line",
+    "path",
+    "polygon",
+    "polyline",
+    "rect",
+    "text",
+    "use",
+]
+# group attributes that apply to the group as a whole, not to each child
+GROUP_EFFECT_ATTRS = ["clip-path", "filter", "mask", "opacity", "transform"]
+
+
+def parse_svg(snippet):
+    return ET.fromstring(f"{SVG_START}{snippet}</svg>")
+
+
+def canonicalize(root):
+    # exclusive C14N leaves out namespaces that aren't used
+    return ET.tostring(root, method="c14n", exclusive=True)
+
+
+def test_every_plugin_has_a_case():
+    assert sorted(PLUGIN_CASES) == sorted(PLUGINS)
+
+
+@pytest.mark.parametrize("name", list(PLUGIN_CASES))
+def test_plugin(name):
+    [snippet, expected_snippet] = PLUGIN_CASES[name]
+    root = parse_svg(snippet)
+    changed = PLUGINS[name](root)
+    expected = parse_svg(expected_snippet)
+    assert canonicalize(root) == canonicalize(expected)
+    if snippet != expected_snippet:
+        assert changed > 0
+    if name == "sortAttrs":
+        # C14N sorts attributes itself
+        assert root[0].keys() == expected[0].keys()
+    # nothing is left to change, so --multipass stops
+    assert PLUGINS[name](root) == 0
+
+
+def test_remove_unused_ns():
+    root = ET.fromstring(
+        '<svg xmlns="http://www.w3.org/2000/svg" xmlns:foo="http://example.org/foo" '
+        + 'xmlns:xlink="http://www.w3.org/1999/xlink"><use xlink:href="#a"/></svg>'
+    )
+    assert PLUGINS["removeUnusedNS"](root) == 1
+    assert set(root.nsmap) == {None, "xlink"}
+
+
+def test_get_enabled_plugins():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config_f = path.join(tmp_dir, "svgo-config.json")
+        for config in [
+            {"removeTitle": True, "removeDesc": False, "sortAttrs": {}},
+            {"plugins": [{"removeTitle": True}, {"removeDesc": False}, "sortAttrs"]},
+        ]:
+            with open(config_f, "w") as f_out:
+                json.dump(config, f_out)
+            assert get_enabled_plugins(config_f) == ["removeTitle", "sortAttrs"]
+
+        with open(config_f, "w") as f_out:
+            json.dump({"removeTitle": True, "mergePaths": True}, f_out)
+        root = parse_svg("<!-- a --><title>T</title><g/>")
+        assert optimize_svg(root, config_f) == ["mergePaths"]
+        # removeComments isn't in this config
+        assert canonicalize(root) == canonicalize(parse_svg("<!-- a --><g/>"))
+
+
+def test_skipped_plugins_of_svgo_config():
+    assert get_skipped_plugins(SVGO_CONFIG_F) == [
+        "convertPathData",
+        "convertTransform",
+        "inlineStyles",
+        "mergePaths",
+        "moveGroupAttrsToElems",
+        "removeNonInheritableGroupAttrs",
+        "removeUnknownsAndDefaults",
+        "removeUselessStrokeAndFill",
+    ]
+
+
+def get_rendered(el, inherited=None, effects=()):
+    """Get what an SVG draws, as a list with one tuple per rendered element.
+
+    Each tuple has the element's name, its own attributes, the inherited
+    presentation attributes in effect, the group effects, e.g., transforms,
+    from it and its ancestors, in order, and its text. This stays the same
+    when groups are collapsed, styles become attributes or colors are
+    written differently, but not when what's drawn changes.
+    """
+    if not isinstance(el.tag, str):
+        return []
+    name = ET.QName(el).localname
+    if name in ["defs", "title", "desc", "metadata"]:
+        return []
+    attrs = {
+        attr: WHITESPACE_RE.sub(" ", value).strip() for attr, value in el.attrib.items()
+    }
+    for [style_name, value] in parse_style(attrs.pop("style", "")):
+        attrs[style_name] = value
+    attrs = {attr: value for attr, value in attrs.items() if value != ""}
+    inherited = dict(inherited or {})
+    for attr in INHERITABLE_ATTRS:
+        value = attrs.pop(attr, "inherit")
+        if value != "inherit":
+            inherited[attr] = convert_color(value) if "color" in attr else value
+    for attr in ["color", "fill", "stroke"]:
+        if attr in inherited:
+            inherited[attr] = convert_color(inherited[attr])
+    effects = effects + tuple(
+        (attr, attrs.pop(attr)) for attr in GROUP_EFFECT_ATTRS if attr in attrs
+    )
+    if name in RENDERED_TAGS:
+        text = "".join(el.itertext()) if name == "text" else None
+        if name == "text" and not text:
+            return []
+        return [(name, sorted(attrs.items()), sorted(inherited.items()), effects, text)]
+    rendered = list()
+    for child in el:
+        rendered += get_rendered(child, inherited, effects)
+    return rendered
+
+
+def get_ids(root):
+    return {el.get("id") for el in root.iter(tag=ET.Element) if el.get("id")}
+
+
+def get_typeofs(root):
+    return {
+        el.get("id"): el.get("typeof")
+        for el in root.iter(tag=ET.Element)
+        if el.get("typeof") is not None
+    }
+
+
+def write_pvjson(json_f):
+    """Write a small pathway as pvjson, the input of pvjs."""
+    entities = [
+        {
+            "id": "a1",
+            "kaavioType": "Node",
+            "type": ["GeneProduct", "DataNode", "wikidata:Q283350"],
+            "x": 20,
+            "y": 20,
+            "width": 80,
+            "height": 20,
+            "fontSize": 10,
+            "textContent": "TP53",
+        },
+        {
+            "id": "b2",
+            "kaavioType": "Node",
+            "type": ["Metabolite", "DataNode"],
+            "x": 200,
+            "y": 20,
+            "width": 80,
+            "height": 20,
+            "fontSize": 10,
+            "textContent": "ATP",
+        },
+        {
+            "id": "c3",
+            "kaavioType": "Edge",
+            "type": ["Interaction", "mim-conversion"],
+            "points": [{"x": 100, "y": 30}, {"x": 200, "y": 30}],
+            "markerEnd": "Arrow",
+        },
+    ]
+    pathway = {
+        "id": "http://identifiers.org/wikipathways/WP1",
+        "name": "Test pathway",
+        "width": 300,
+        "height": 60,
+        "contains": [entity["id"] for entity in entities],
+    }
+    entities_by_id = {entity["id"]: entity for entity in entities}
+    with open(json_f, "w") as f_out:
+        json.dump({"pathway": pathway, "entitiesById": entities_by_id}, f_out)
+
+
+def test_json2svg_optimized_renders_the_same(monkeypatch):
+    monkeypatch.setenv("PATH", STAND_INS_DIR + os.pathsep + os.environ["PATH"])
+    monkeypatch.delenv("PVJS_WORKER", raising=False)
+    monkeypatch.setattr(workers, "_tools", dict())
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        json_f = path.join(tmp_dir, "WP1_1.json")
+        write_pvjson(json_f)
+        svg_f = path.join(tmp_dir, "WP1_1.svg")
+        convert.json2svg(
+            json_f,
+            svg_f,
+            "http://identifiers.org/wikipathways/WP1",
+            "WP1",
+            "1",
+            "plain",
+            debug=True,
+            use_svgo=False,
+            build_cache=False,
+        )
+        optimized = ET.parse(svg_f).getroot()
+        unoptimized = ET.parse(path.join(tmp_dir, "WP1_1.pre_svgo.svg")).getroot()
+
+    # removeRasterImages drops the structure image on purpose
+    for image in unoptimized.iter("{http://www.w3.org/2000/svg}image"):
+        image.getparent().remove(image)
+    assert get_rendered(optimized) == get_rendered(unoptimized)
+    # the background, two rect and text pairs and the edge
+    assert len(get_rendered(optimized)) == 6
+    assert get_ids(optimized) == get_ids(unoptimized)
+    assert {"a1", "b2", "c3", "markerEndArrow"} <= get_ids(optimized)
+    assert get_typeofs(optimized) == get_typeofs(unoptimized)
+    assert get_typeofs(optimized)["a1"] == "GeneProduct DataNode wikidata:Q283350"
+    # and it did optimize
+    assert len(optimized.findall(".//{*}title")) == 0
+    assert len(list(optimized.iter("{*}g"))) < len(list(unoptimized.iter("{*}g")))
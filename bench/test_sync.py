@@ -0,0 +1,175 @@
+# Test for sync.py against a local stand-in for the WikiPathways webservice.
+#
+# python3 -m pytest bench/test_sync.py
+#
+# Each sync runs in its own process, like the daily job, with the bench
+# stand-ins for the tools and the Wikidata Query Service and an empty home.
+# Between syncs, the stand-in webservice gets new revisions.
+
+import base64
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+from os import path
+import subprocess
+import sys
+import tempfile
+import threading
+from urllib.parse import parse_qs, urlparse
+
+BENCH_DIR = path.dirname(path.realpath(__file__))
+sys.path.insert(0, path.join(BENCH_DIR, "..", "gpml2svg"))
+
+from bench import STAND_INS_DIR, STAND_IN_TOOLS
+from synthetic import write_gpml
+
+
+THEMES = ["plain", "dark"]
+
+
+class WebserviceHandler(BaseHTTPRequestHandler):
+    """Stand-in for the WikiPathways webservice.
+
+    Answers getCurationTagsByName with the pathways in the server's
+    revisions, a dict from WikiPathways ID to (revision, species), and
+    getPathwayAs with a synthetic GPML file, except for the IDs in the
+    server's broken_ids.
+    """
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        revisions = self.server.revisions
+        if url.path == "/getCurationTagsByName":
+            body = {
+                "tags": [
+                    {"pathway": {"id": wp_id, "revision": revision, "species": species}}
+                    for wp_id, [revision, species] in sorted(revisions.items())
+                ]
+            }
+        elif (
+            url.path == "/getPathwayAs" and params["pwId"] not in self.server.broken_ids
+        ):
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                gpml_f = f"{tmp_dir}/pathway.gpml"
+                write_gpml(gpml_f, 20, wp_id=params["pwId"])
+                with open(gpml_f, "rb") as f_in:
+                    body = {"data": base64.b64encode(f_in.read()).decode()}
+        else:
+            self.send_response(500)
+            self.end_headers()
+            return
+        response_bytes = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response_bytes)))
+        self.end_headers()
+        self.wfile.write(response_bytes)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_webservice(revisions, broken_ids):
+    """Start the stand-in webservice in a thread and return the server."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), WebserviceHandler)
+    server.revisions = revisions
+    server.broken_ids = broken_ids
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_sync(work_dir, base_url):
+    """Sync to {work_dir}/out in a new process and return the summary."""
+    env = dict(os.environ)
+    env["PATH"] = STAND_INS_DIR + os.pathsep + env.get("PATH", "")
+    env["HOME"] = f"{work_dir}/home"
+    for tool in STAND_IN_TOOLS:
+        env.pop(tool.upper() + "_WORKER", None)
+    env.pop("WD_INDEX_F", None)
+    subprocess.run(
+        [sys.executable, path.realpath(__file__), f"{work_dir}/out", base_url],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        check=True,
+    )
+    with open(f"{work_dir}/out/summary.json", "r") as f_in:
+        return json.load(f_in)
+
+
+def get_svg_fs(dir_out):
+    return sorted(
+        base_out for base_out in os.listdir(dir_out) if base_out.endswith(".svg")
+    )
+
+
+def test_sync_only_new_revisions():
+    revisions = {
+        "WP1": ["10", "Homo sapiens"],
+        "WP2": ["20", "Homo sapiens"],
+        "WP3": ["30", "Mus musculus"],
+        "WP4": ["40", "Homo sapiens"],
+    }
+    broken_ids = {"WP4"}
+    server = start_webservice(revisions, broken_ids)
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    with tempfile.TemporaryDirectory() as work_dir:
+        dir_out = f"{work_dir}/out"
+
+        # only the human pathways, and a failed download doesn't stop the rest
+        summary = run_sync(work_dir, base_url)
+        assert summary["changed"] == 3
+        assert summary["succeeded"] == 2
+        assert summary["download_failures"] == ["WP4"]
+        # peak RSS per worker process, not per pathway
+        assert 1 <= len(summary["peak_rss_by_worker"]) <= 2
+        for peaks in summary["peak_rss_by_worker"].values():
+            assert peaks["peak_rss_kb"] > 0
+        with open(f"{dir_out}/report.jsonl", "r") as f_in:
+            for line in f_in:
+                for record in json.loads(line)["stages"]:
+                    assert "peak_rss_kb" not in record
+                    assert record["peak_rss_growth_kb"] >= 0
+        assert get_svg_fs(dir_out) == [
+            "WP1.dark.svg",
+            "WP1.svg",
+            "WP2.dark.svg",
+            "WP2.svg",
+        ]
+
+        # nothing new, but the failed download is tried again
+        summary = run_sync(work_dir, base_url)
+        assert summary["changed"] == 1
+        assert summary["unchanged"] == 2
+        assert summary["succeeded"] == 0
+        assert summary["download_failures"] == ["WP4"]
+
+        # a new revision replaces the files of the old one
+        revisions["WP2"] = ["21", "Homo sapiens"]
+        broken_ids.clear()
+        summary = run_sync(work_dir, base_url)
+        assert summary["changed"] == 2
+        assert sorted(result["wp_id"] for result in summary["successes"]) == [
+            "WP2",
+            "WP4",
+        ]
+        assert summary["download_failures"] == []
+        assert path.isfile(f"{dir_out}/WP2_21.gpml")
+        assert not path.isfile(f"{dir_out}/WP2_20.gpml")
+        assert len(get_svg_fs(dir_out)) == 6
+
+        summary = run_sync(work_dir, base_url)
+        assert summary["changed"] == 0
+        assert summary["unchanged"] == 3
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    # the process for one sync, see run_sync
+    import bench
+    import sync
+
+    bench.use_stand_ins()
+    [dir_out, base_url] = sys.argv[1:]
+    sync.sync(dir_out, base_url=base_url, themes=THEMES, workers=2)
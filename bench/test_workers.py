@@ -0,0 +1,190 @@
+# Tests for the long-lived tool workers in gpml2svg/workers.py.
+#
+# python3 -m pytest bench/test_workers.py
+#
+# WorkerPool runs against gpml2svg/stub_worker.py, and node_worker.js against
+# a small Node package made for the test, which stands in for gpml2pvjson,
+# bridgedb and pvjs: a script in bin/ that runs lib/cli.js, which uses a
+# dependency in node_modules/.
+
+import json
+import os
+from os import path
+import shlex
+import sys
+import tempfile
+
+import pytest
+
+BENCH_DIR = path.dirname(path.realpath(__file__))
+GPML2SVG_DIR = path.join(BENCH_DIR, "..", "gpml2svg")
+sys.path.insert(0, GPML2SVG_DIR)
+
+from workers import (
+    get_node_worker_cmd,
+    NODE_WORKER_F,
+    Tool,
+    WorkerCrashed,
+    WorkerPool,
+)
+
+
+STUB_WORKER_F = path.realpath(path.join(GPML2SVG_DIR, "stub_worker.py"))
+
+NODE_TOOL_FILES = {
+    "package.json": '{"name": "node-tool", "version": "1.0.0"}',
+    "bin/node-tool": """#!/usr/bin/env node
+require("../lib/cli.js");
+""",
+    "node_modules/dep/index.js": """
+global.depLoads = (global.depLoads || 0) + 1;
+module.exports = (text) => text.toUpperCase();
+""",
+    "lib/cli.js": """
+const stream = require("stream");
+const upper = require("dep");
+
+// module state, which must not carry over from one request to the next
+let runs = 0;
+runs += 1;
+
+const [mode, prefix] = process.argv.slice(2);
+
+function readAll(callback) {
+  const chunks = [];
+  process.stdin.on("data", (chunk) => chunks.push(chunk));
+  process.stdin.on("end", () => callback(Buffer.concat(chunks).toString()));
+}
+
+if (mode === "pipe") {
+  const transform = new stream.Transform({
+    transform(chunk, encoding, callback) {
+      callback(null, upper(chunk.toString()));
+    },
+  });
+  process.stdout.write(prefix || "");
+  process.stdin.pipe(transform).pipe(process.stdout);
+} else if (mode === "end") {
+  readAll((text) => {
+    setTimeout(() => {
+      process.stdout.write(upper(text));
+      process.stdout.end();
+    }, 10);
+  });
+} else if (mode === "log") {
+  readAll((text) => {
+    console.log(JSON.stringify({ text, runs, depLoads: global.depLoads }));
+    process.exit(0);
+  });
+} else if (mode === "exit") {
+  process.exit(3);
+} else if (mode === "throw") {
+  setTimeout(() => {
+    throw new Error("boom");
+  }, 10);
+} else if (mode === "die") {
+  process.kill(process.pid, "SIGKILL");
+}
+""",
+}
+
+
+def make_node_tool(tool_dir):
+    """Write the Node package for the test and return the path of its script."""
+    for [name, text] in NODE_TOOL_FILES.items():
+        f = path.join(tool_dir, name)
+        os.makedirs(path.dirname(f), exist_ok=True)
+        with open(f, "w") as f_out:
+            f_out.write(text)
+    script_f = path.join(tool_dir, "bin", "node-tool")
+    os.chmod(script_f, 0o755)
+    return script_f
+
+
+def test_stub_worker_crash_fails_the_request_and_restarts():
+    pool = WorkerPool(f"{sys.executable} {STUB_WORKER_F} --crash-after 2", size=1)
+    try:
+        assert pool.call(["a"], b"first") == b"first"
+        assert pool.call(["a"], b"second") == b"second"
+        # the third request crashes the worker, and isn't sent again
+        with pytest.raises(WorkerCrashed):
+            pool.call(["a"], b"third")
+        # the restarted worker answers the next one
+        assert pool.call(["a"], b"fourth") == b"fourth"
+        assert pool.call(["a"], b"fifth") == b"fifth"
+        with pytest.raises(WorkerCrashed):
+            pool.call(["a"], b"sixth")
+    finally:
+        pool.stop()
+
+
+def test_stub_worker_error_response():
+    exec_cmd = shlex.quote(f"{sys.executable} -c 'import sys; sys.exit(2)'")
+    pool = WorkerPool(f"{sys.executable} {STUB_WORKER_F} --exec {exec_cmd}", size=1)
+    try:
+        with pytest.raises(Exception) as excinfo:
+            pool.call([], b"input")
+        assert not isinstance(excinfo.value, WorkerCrashed)
+        # the worker is still up
+        with pytest.raises(Exception):
+            pool.call([], b"input")
+        assert pool.workers[0].ps.poll() is None
+    finally:
+        pool.stop()
+
+
+def test_tool_fails_on_non_zero_exit():
+    tool = Tool(f"{sys.executable} -c 'import sys; sys.exit(2)'")
+    with pytest.raises(Exception) as excinfo:
+        tool.run([], b"")
+    assert "failed with 2" in str(excinfo.value)
+
+
+def test_node_worker_runs_the_tool_in_process():
+    with tempfile.TemporaryDirectory() as tool_dir:
+        script_f = make_node_tool(tool_dir)
+        pool = WorkerPool(f"node {NODE_WORKER_F} {script_f}", size=1)
+        try:
+            assert pool.call(["pipe", "> "], b"abc") == b"> ABC"
+            # no prefix this time, so the args of the last request are gone
+            assert pool.call(["pipe"], b"def") == b"DEF"
+            assert pool.call(["end"], b"ghi") == b"GHI"
+            for text in ["jkl", "mno"]:
+                output = json.loads(pool.call(["log"], text.encode()))
+                # lib/cli.js runs anew, but its dependency is loaded only once
+                assert output == {"text": text, "runs": 1, "depLoads": 1}
+        finally:
+            pool.stop()
+
+
+def test_node_worker_failures():
+    with tempfile.TemporaryDirectory() as tool_dir:
+        script_f = make_node_tool(tool_dir)
+        pool = WorkerPool(f"node {NODE_WORKER_F} {script_f}", size=1)
+        try:
+            with pytest.raises(Exception, match="exited with 3"):
+                pool.call(["exit"], b"")
+            with pytest.raises(Exception, match="boom"):
+                pool.call(["throw"], b"")
+            # errors fail the request, but the worker keeps going
+            assert pool.call(["pipe"], b"abc") == b"ABC"
+            with pytest.raises(WorkerCrashed):
+                pool.call(["die"], b"")
+            assert pool.call(["pipe"], b"def") == b"DEF"
+        finally:
+            pool.stop()
+
+
+def test_node_worker_only_for_node_scripts(monkeypatch):
+    with tempfile.TemporaryDirectory() as tool_dir:
+        script_f = make_node_tool(tool_dir)
+        python_script_f = path.join(tool_dir, "bin", "python-tool")
+        with open(python_script_f, "w") as f_out:
+            f_out.write("#!/usr/bin/env python3\n")
+        os.chmod(python_script_f, 0o755)
+        monkeypatch.setenv(
+            "PATH", path.join(tool_dir, "bin") + os.pathsep + os.environ["PATH"]
+        )
+        assert get_node_worker_cmd("node-tool").endswith(f" {script_f}")
+        assert get_node_worker_cmd("python-tool") is None
+        assert get_node_worker_cmd("no-such-tool") is None
@@ -0,0 +1,165 @@
+// Long-lived worker that speaks the framed protocol from workers.py and
+// converts GPML with PathVisio, so the JVM starts once per batch instead of
+// once per output file.
+//
+// usage: java -classpath <PathVisio converter classpath> PathVisioWorker.java
+//
+// The request args are [path_in, scale, path_out...]. Each path out is
+// written by org.pathvisio.core.util.Converter, the class behind
+// `pathvisio convert`, which picks the format from the extension. scale is
+// only used for PNG. The response has no output bytes. Example:
+//
+//   PATHVISIO_WORKER="java -classpath $CLASSPATH gpml2svg/PathVisioWorker.java"
+//
+// If Converter exits the JVM, that request fails and WorkerPool restarts the
+// worker for the next one.
+
+import java.io.BufferedInputStream;
+import java.io.BufferedOutputStream;
+import java.io.DataInputStream;
+import java.io.DataOutputStream;
+import java.io.EOFException;
+import java.io.File;
+import java.io.FileDescriptor;
+import java.io.FileOutputStream;
+import java.io.IOException;
+import java.lang.reflect.InvocationTargetException;
+import java.lang.reflect.Method;
+import java.nio.charset.StandardCharsets;
+import java.util.ArrayList;
+import java.util.List;
+
+public class PathVisioWorker {
+  static byte[] readFrame(DataInputStream in) throws IOException {
+    int size;
+    try {
+      size = in.readInt();
+    } catch (EOFException e) {
+      return null;
+    }
+    byte[] payload = new byte[size];
+    try {
+      in.readFully(payload);
+    } catch (EOFException e) {
+      return null;
+    }
+    return payload;
+  }
+
+  static void writeFrame(DataOutputStream out, byte[] payload) throws IOException {
+    out.writeInt(payload.length);
+    out.write(payload);
+  }
+
+  // Get the "args" list from a header like {"args": ["a.gpml", "100", "a.pdf"]}.
+  // Headers come from workers.py, so this only handles a list of strings.
+  static List<String> parseArgs(String header) {
+    List<String> args = new ArrayList<>();
+    int i = header.indexOf("\"args\"");
+    if (i < 0) {
+      return args;
+    }
+    i = header.indexOf('[', i) + 1;
+    while (i > 0 && i < header.length()) {
+      char c = header.charAt(i);
+      if (c == ']') {
+        break;
+      } else if (c != '"') {
+        i++;
+        continue;
+      }
+      StringBuilder arg = new StringBuilder();
+      i++;
+      while (header.charAt(i) != '"') {
+        c = header.charAt(i);
+        if (c == '\\') {
+          char escaped = header.charAt(i + 1);
+          i += 2;
+          switch (escaped) {
+            case 'b': arg.append('\b'); break;
+            case 'f': arg.append('\f'); break;
+            case 'n': arg.append('\n'); break;
+            case 'r': arg.append('\r'); break;
+            case 't': arg.append('\t'); break;
+            case 'u':
+              arg.append((char) Integer.parseInt(header.substring(i, i + 4), 16));
+              i += 4;
+              break;
+            default: arg.append(escaped);
+          }
+        } else {
+          arg.append(c);
+          i++;
+        }
+      }
+      args.add(arg.toString());
+      i++;
+    }
+    return args;
+  }
+
+  static String toJsonString(String s) {
+    StringBuilder json = new StringBuilder("\"");
+    for (char c : s.toCharArray()) {
+      if (c == '"' || c == '\\') {
+        json.append('\\').append(c);
+      } else if (c < 0x20) {
+        json.append(String.format("\\u%04x", (int) c));
+      } else {
+        json.append(c);
+      }
+    }
+    return json.append('"').toString();
+  }
+
+  public static void main(String[] argv) throws Exception {
+    DataInputStream in = new DataInputStream(new BufferedInputStream(System.in));
+    DataOutputStream out =
+        new DataOutputStream(
+            new BufferedOutputStream(new FileOutputStream(FileDescriptor.out)));
+    // PathVisio logs to stdout, which is only for frames here
+    System.setOut(System.err);
+
+    Method convert =
+        Class.forName("org.pathvisio.core.util.Converter").getMethod("main", String[].class);
+
+    while (true) {
+      byte[] header = readFrame(in);
+      byte[] input = header == null ? null : readFrame(in);
+      if (input == null) {
+        break;
+      }
+
+      String response = "{\"ok\": true}";
+      try {
+        List<String> args = parseArgs(new String(header, StandardCharsets.UTF_8));
+        if (args.size() < 3) {
+          throw new Exception("Expected args [path_in, scale, path_out...]");
+        }
+        String pathIn = args.get(0);
+        String scale = args.get(1);
+        for (String pathOut : args.subList(2, args.size())) {
+          List<String> converterArgs = new ArrayList<>();
+          converterArgs.add(pathIn);
+          converterArgs.add(pathOut);
+          if (pathOut.endsWith(".png")) {
+            converterArgs.add(scale);
+          }
+          convert.invoke(null, (Object) converterArgs.toArray(new String[0]));
+          File f = new File(pathOut);
+          if (!f.isFile() || f.length() == 0) {
+            throw new Exception("PathVisio didn't write " + pathOut);
+          }
+        }
+      } catch (Throwable e) {
+        Throwable cause = e instanceof InvocationTargetException ? e.getCause() : e;
+        cause.printStackTrace();
+        response = "{\"ok\": false, \"error\": " + toJsonString(String.valueOf(cause)) + "}";
+      }
+
+      writeFrame(out, response.getBytes(StandardCharsets.UTF_8));
+      writeFrame(out, new byte[0]);
+      out.flush();
+    }
+  }
+}
@@ -0,0 +1,427 @@
+#!/usr/bin/env python3
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import csv
+import json
+import os
+from os import path
+import sys
+import time
+import traceback
+
+from convert import convert, get_pathway_xrefs, WPID_RE, WPID_REV_RE
+from datasources import get_bridgedb2wd_props
+from instrument import get_peak_rss, start_recording, stop_recording, summarize
+import issues
+from wikidata import get_xref_resolver
+from xref_cache import get_xref_cache
+
+DEFAULT_THEMES = ["plain", "dark"]
+# xrefs per call to the resolver in the batch xref lookup. The resolver
+# adapts its batch size between calls.
+XREF_PREPASS_CHUNK_SIZE = 2000
+
+
+def get_svg_path_out(dir_out, wp_id, theme):
+    """Get the SVG path out for a pathway and theme.
+
+    The plain theme keeps the bare name, e.g., ./WP4542.svg, and other themes
+    get a suffix, e.g., ./WP4542.dark.svg
+    """
+    if theme == "plain":
+        return f"{dir_out}/{wp_id}.svg"
+    return f"{dir_out}/{wp_id}.{theme}.svg"
+
+
+def parse_gpml_f(gpml_f):
+    """Get WikiPathways ID and version from a GPML filename.
+
+    Keyword arguments:
+    gpml_f -- e.g., ./Hs_Some_pathway_WP4542_103412.gpml
+    """
+    base_in = path.basename(gpml_f)
+    wp_id = None
+    pathway_version = 0
+    wp_id_rev_match = WPID_REV_RE.search(base_in)
+    if wp_id_rev_match:
+        wp_id = wp_id_rev_match.group(1)
+        pathway_version = wp_id_rev_match.group(2)
+    else:
+        wp_id_match = WPID_RE.search(base_in)
+        if wp_id_match:
+            wp_id = wp_id_match.group(0)
+    return wp_id, pathway_version
+
+
+def convert_pathway(gpml_f, dir_out, themes):
+    """Convert one GPML file to an SVG per theme.
+
+    Any error is caught and reported in the returned result, so that one bad
+    pathway doesn't stop the rest of the batch. The result also has a record
+    of each stage of the conversion, from instrument, and the issues found.
+
+    Keyword arguments:
+    gpml_f -- path in, e.g., ./WP4542_103412.gpml
+    dir_out -- directory for the SVG files
+    themes -- list of themes, e.g., ["plain", "dark"]
+    """
+    start = time.time()
+    start_recording()
+    issues.start_recording()
+    wp_id, pathway_version = parse_gpml_f(gpml_f)
+    result = {
+        "gpml_f": gpml_f,
+        "wp_id": wp_id,
+        "pathway_version": pathway_version,
+        "outputs": [],
+        "ok": True,
+        "error": None,
+    }
+
+    try:
+        if wp_id is None:
+            raise Exception(f"No WikiPathways ID in filename '{gpml_f}'")
+        pathway_iri = f"http://identifiers.org/wikipathways/{wp_id}"
+        print(f"Processing {wp_id}")
+        paths_out = [get_svg_path_out(dir_out, wp_id, theme) for theme in themes]
+        # all the themes in one call, so the GPML is converted to JSON only once
+        converted = convert(
+            gpml_f,
+            paths_out,
+            pathway_iri=pathway_iri,
+            wp_id=wp_id,
+            pathway_version=pathway_version,
+            theme=themes,
+        )
+        for path_out in paths_out:
+            if converted is False or not path.isfile(path_out):
+                raise Exception(f"Failed to convert {gpml_f} to {path_out}")
+            result["outputs"].append(path_out)
+    except Exception as e:
+        result["ok"] = False
+        result["error"] = f"{type(e).__name__}: {e}"
+        result["traceback"] = traceback.format_exc()
+        issues.report(
+            issues.CONVERSION_FAILED,
+            wp_id,
+            message=f"Failed to process {gpml_f}: {result['error']}",
+            error=result["error"],
+        )
+
+    result["seconds"] = round(time.time() - start, 3)
+    result["stages"] = stop_recording()
+    # the peak of the worker so far, from this or an earlier pathway
+    result["worker"] = {"pid": os.getpid(), **get_peak_rss()}
+    result["issues"] = issues.stop_recording()
+    return result
+
+
+def get_gpml_f_xrefs(gpml_f):
+    """Get the xrefs the conversion of a GPML file will look up in Wikidata,
+    see convert.get_pathway_xrefs, or none if that fails.
+    """
+    wp_id, pathway_version = parse_gpml_f(gpml_f)
+    try:
+        if wp_id is None:
+            raise Exception(f"No WikiPathways ID in filename '{gpml_f}'")
+        pathway_iri = f"http://identifiers.org/wikipathways/{wp_id}"
+        return get_pathway_xrefs(gpml_f, pathway_iri, wp_id, pathway_version)
+    except Exception as e:
+        # the conversion will report it
+        print(f"Failed to get the xrefs of {gpml_f}: {e}")
+        return list()
+
+
+def resolve_batch_xrefs(xrefs_by_pathway):
+    """Look up the Wikidata items for the xrefs of a whole batch at once.
+
+    Pathways share many xrefs, e.g., the same genes, so each unique xref is
+    looked up once, in large batched queries, instead of once per pathway.
+    The results go to the xref cache, where the conversion of each pathway
+    finds them. Xrefs that are already cached aren't looked up again.
+
+    Keyword arguments:
+    xrefs_by_pathway -- list with the xrefs to look up for each pathway, as
+                        (datasource, identifier) pairs, see get_gpml_f_xrefs
+
+    Returns a dict with the number of xrefs, unique xrefs, cached xrefs,
+    looked up xrefs and Wikidata queries, and the seconds it took.
+    """
+    start = time.time()
+    bridgedb2wd_props = get_bridgedb2wd_props()
+    xref_count = sum(len(xrefs) for xrefs in xrefs_by_pathway)
+    xrefs = {
+        tuple(xref) for pathway_xrefs in xrefs_by_pathway for xref in pathway_xrefs
+    }
+
+    xref_cache = get_xref_cache()
+    cached_wd_ids_by_xref = xref_cache.get_many(xrefs)
+    uncached_xrefs = sorted(xref for xref in xrefs if xref not in cached_wd_ids_by_xref)
+    xref_resolver = get_xref_resolver()
+    query_count_before = xref_resolver.query_count
+    for i in range(0, len(uncached_xrefs), XREF_PREPASS_CHUNK_SIZE):
+        chunk = uncached_xrefs[i : i + XREF_PREPASS_CHUNK_SIZE]
+        xref_cache.set_many(xref_resolver.resolve(chunk, bridgedb2wd_props))
+
+    stats = {
+        "xrefs": xref_count,
+        "unique": len(xrefs),
+        "cached": len(cached_wd_ids_by_xref),
+        "looked_up": len(uncached_xrefs),
+        "queries": xref_resolver.query_count - query_count_before,
+        "seconds": round(time.time() - start, 3),
+    }
+    print(
+        f"Looked up {stats['looked_up']} of {stats['unique']} unique xrefs "
+        + f"({stats['xrefs']} in all) with {stats['queries']} Wikidata queries"
+    )
+    return stats
+
+
+def convert_batch(
+    gpml_fs,
+    dir_out,
+    themes=None,
+    workers=None,
+    summary_f=None,
+    report_f=None,
+    issues_f=None,
+    issues_tsv_f=None,
+    xref_prepass=True,
+):
+    """Convert many GPML files to SVG across a pool of processes.
+
+    First the xrefs of all the pathways are looked up at once, see
+    resolve_batch_xrefs, unless they're looked up in a local Wikidata index
+    (WD_INDEX_F), see wd_index.py.
+
+    The run report has one JSON line per pathway, with the time and
+    resources used by each stage. The issues file has one JSON line per
+    issue, e.g., an xref with no Wikidata item, and the issues TSV one row
+    per kind of issue per pathway. The summary has the totals per stage and
+    per issue code, and the peak RSS of each worker process.
+
+    Keyword arguments:
+    gpml_fs -- list of GPML paths in
+    dir_out -- directory for the SVG files
+    themes -- list of themes (default plain and dark)
+    workers -- number of worker processes (default: number of CPUs)
+    summary_f -- path for the JSON summary (default: {dir_out}/summary.json)
+    report_f -- path for the run report (default: {dir_out}/report.jsonl)
+    issues_f -- path for the issues (default: {dir_out}/issues.jsonl)
+    issues_tsv_f -- path for the issues TSV (default: {dir_out}/issues.tsv)
+    xref_prepass -- look up the xrefs of all the pathways first (default True)
+    """
+    if themes is None:
+        themes = DEFAULT_THEMES
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if summary_f is None:
+        summary_f = f"{dir_out}/summary.json"
+    if report_f is None:
+        report_f = f"{dir_out}/report.jsonl"
+    if issues_f is None:
+        issues_f = f"{dir_out}/issues.jsonl"
+    if issues_tsv_f is None:
+        issues_tsv_f = f"{dir_out}/issues.tsv"
+
+    start = time.time()
+    results = list()
+    xref_stats = None
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # with a local Wikidata index, there's nothing to look up first
+        if xref_prepass and not os.environ.get("WD_INDEX_F"):
+            # The xrefs are those of the JSON from BridgeDb, like in the
+            # conversion, whose gpml2pvjson and BridgeDb stages then come
+            # from the build cache. The lookup is in a worker, so that the
+            # workers don't inherit the connections of a Wikidata client
+            # started in this process.
+            try:
+                xrefs_by_pathway = list(executor.map(get_gpml_f_xrefs, gpml_fs))
+                xref_stats = executor.submit(
+                    resolve_batch_xrefs, xrefs_by_pathway
+                ).result()
+            except Exception as e:
+                print(
+                    f"Failed to look up the xrefs of the batch: {e}. "
+                    + "Each pathway will look up its own."
+                )
+        futures_by_gpml_f = {
+            executor.submit(convert_pathway, gpml_f, dir_out, themes): gpml_f
+            for gpml_f in gpml_fs
+        }
+        for future in as_completed(futures_by_gpml_f):
+            gpml_f = futures_by_gpml_f[future]
+            try:
+                results.append(future.result())
+            except Exception as e:
+                # the worker process itself died, e.g., killed for using
+                # too much memory.
+                wp_id = parse_gpml_f(gpml_f)[0]
+                error = f"{type(e).__name__}: {e}"
+                results.append(
+                    {
+                        "gpml_f": gpml_f,
+                        "wp_id": wp_id,
+                        "outputs": [],
+                        "ok": False,
+                        "error": error,
+                        "issues": [
+                            issues.get_issue(
+                                issues.CONVERSION_FAILED, wp_id, error=error
+                            )
+                        ],
+                    }
+                )
+
+    results.sort(key=lambda result: result["gpml_f"])
+    peak_rss_by_worker = dict()
+    for result in results:
+        worker = result.pop("worker", None)
+        if worker is not None:
+            # peaks only grow, so the highest is the worker's peak for the batch
+            peaks = peak_rss_by_worker.setdefault(
+                str(worker.pop("pid")), {"peak_rss_kb": 0, "child_peak_rss_kb": 0}
+            )
+            for key in peaks:
+                peaks[key] = max(peaks[key], worker[key])
+    stage_records = list()
+    issue_counts = dict()
+    with open(report_f, "w") as f_out, open(issues_f, "w") as issues_out, open(
+        issues_tsv_f, "w", newline=""
+    ) as issues_tsv_out:
+        issues_tsv_writer = csv.writer(issues_tsv_out, delimiter="\t")
+        issues_tsv_writer.writerow(issues.TSV_HEADER)
+        for result in results:
+            stages = result.pop("stages", [])
+            stage_records.extend(stages)
+            report_line = {
+                "wp_id": result["wp_id"],
+                "gpml_f": result["gpml_f"],
+                "ok": result["ok"],
+                "seconds": result.get("seconds"),
+                "stages": stages,
+            }
+            f_out.write(json.dumps(report_line) + "\n")
+
+            issue_records = result.pop("issues", [])
+            for record in issue_records:
+                issues_out.write(json.dumps(record) + "\n")
+            issues_tsv_writer.writerows(issues.get_tsv_rows(issue_records))
+            issues.count_issues(issue_records, issue_counts)
+
+    successes = [result for result in results if result["ok"]]
+    failures = [result for result in results if not result["ok"]]
+    summary = {
+        "workers": workers,
+        "themes": themes,
+        "total": len(results),
+        "succeeded": len(successes),
+        "failed": len(failures),
+        "seconds": round(time.time() - start, 3),
+        "xref_prepass": xref_stats,
+        "report": report_f,
+        "stages": summarize(stage_records),
+        "peak_rss_by_worker": peak_rss_by_worker,
+        "issues_file": issues_f,
+        "issues_tsv": issues_tsv_f,
+        "issues": issue_counts,
+        "successes": successes,
+        "failures": failures,
+    }
+    with open(summary_f, "w") as f_out:
+        json.dump(summary, f_out, indent=2)
+
+    print(
+        f"Converted {len(successes)} of {len(results)} pathways "
+        + f"in {summary['seconds']}s ({len(failures)} failed). Summary: {summary_f}"
+    )
+    for failure in failures:
+        print(f"Failed: {failure['wp_id']} ({failure['gpml_f']}): {failure['error']}")
+
+    return summary
+
+
+def main():
+    """main."""
+
+    parser = argparse.ArgumentParser(description="Convert a directory of GPML to SVG")
+    parser.add_argument("dir_in", help="directory with *.gpml files")
+    parser.add_argument("dir_out", nargs="?", help="Default: same as dir_in")
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        help="Default: number of CPUs. Number of pathways to convert at once.",
+    )
+    parser.add_argument(
+        "--theme",
+        action="append",
+        dest="themes",
+        help="Default: plain and dark. Can be specified more than once.",
+    )
+    parser.add_argument(
+        "--summary",
+        type=str,
+        help="Default: {dir_out}/summary.json",
+    )
+    parser.add_argument(
+        "--report",
+        type=str,
+        help="Default: {dir_out}/report.jsonl. Time and resources per stage per pathway.",
+    )
+    parser.add_argument(
+        "--issues",
+        type=str,
+        help="Default: {dir_out}/issues.jsonl. Issues found, e.g., xrefs with no Wikidata item.",
+    )
+    parser.add_argument(
+        "--issues-tsv",
+        type=str,
+        help="Default: {dir_out}/issues.tsv. Issues, one row per kind per pathway.",
+    )
+    parser.add_argument(
+        "--no-xref-prepass",
+        action="store_true",
+        help="Look up the xrefs of each pathway separately, not of all at once first",
+    )
+
+    parser.add_argument(
+        "--wd-index",
+        type=str,
+        help="Look up Wikidata IDs in this index, built with wd_index.py, "
+        + "instead of query.wikidata.org. Default: $WD_INDEX_F, if set.",
+    )
+
+    args = parser.parse_args()
+
+    if args.wd_index:
+        # the worker processes open it, see get_wd_index
+        os.environ["WD_INDEX_F"] = args.wd_index
+
+    dir_in = args.dir_in
+    dir_out = args.dir_out or dir_in
+    gpml_fs = sorted(
+        f"{dir_in}/{base_in}"
+        for base_in in os.listdir(dir_in)
+        if base_in.endswith(".gpml")
+    )
+
+    summary = convert_batch(
+        gpml_fs,
+        dir_out,
+        themes=args.themes,
+        workers=args.workers,
+        summary_f=args.summary,
+        report_f=args.report,
+        issues_f=args.issues,
+        issues_tsv_f=args.issues_tsv,
+        xref_prepass=not args.no_xref_prepass,
+    )
+    if summary["failed"] > 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
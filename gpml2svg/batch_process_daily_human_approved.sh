@@ -5,45 +5,21 @@ get_script_dir() { echo "$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"; }
 SCRIPT_DIR=$(get_script_dir)
 
 batch_name="daily_human_approved_gpml_$(printf '%(%Y-%m-%d)T\n' -1)"
-echo "Batch processing results to $SCRIPT_DIR/$batch_name"
-if [ ! -d "$batch_name" ]; then
-  wget -O "$batch_name.zip" \
-    'https://www.wikipathways.org//wpi/batchDownload.php?species=Homo%20sapiens&fileType=gpml&tag=Curation:AnalysisCollection'
-  unzip -d "$batch_name" "$batch_name.zip"
-  rm -rf "$batch_name.zip"
-else
-  echo "Using previously downloaded $batch_name"
-fi
 
-gpml2svg() {
-  gpmlfile="$1"
-  wpid=$(echo $gpmlfile | awk -F_ '{print $(NF-1)}')
-  echo "Processing $wpid"
-  python3 gpml2svg/convert.py --theme plain "$gpmlfile" "$batch_name/$wpid.svg" || return
-  python3 gpml2svg/convert.py --theme dark "$gpmlfile" "$batch_name/$wpid.dark.svg" || return
-}
-
-# TODO: look at using gnu parallel instead of for loop. Example:
-# https://github.com/ariutta/allene/blob/3ad257effa85426511504d7862f65b9241f7dd31/src/update#L216
-for gpmlfile in $batch_name/*.gpml; do
-  gpml2svg "$gpmlfile" || break
-done
-
-# just for testing purposes:
-#for gpmlfile in $(ls -1 $batch_name/*.gpml | grep WP106); do done
-#for gpmlfile in $(ls -1 $batch_name/*.gpml | head -n 2); do done
-
-# TODO: get the log processing steps below working again
-#cp "$batch_name/*" "public/"
-#mv "$HOME/logs/$batch_name.log"
-#
-#ISSUES_F="$SCRIPT_DIR/public/issues.log"
-#echo $'"error"\t"wpid"\t"notes"' > "$ISSUES_F"
-#
-#grep 'wikidata_property_missing' "$HOME/logs/$batch_name.log" | sort -u >> "$ISSUES_F"
-#grep 'wikidata_mapping_failed' "$HOME/logs/$batch_name.log" | sort -u >> "$ISSUES_F"
-#grep 'wikidata_ambiguous_mapping' "$HOME/logs/$batch_name.log" | sort -u >> "$ISSUES_F"
-#
-#grep 'Missing Xref data source and/or identifier in WP' "$HOME/logs/$batch_name.log" |\
-#  sed -E 's#Missing Xref data source and/or identifier in (WP[0-9]+)#"xref_missing_datasource_or_identifier"\t"\1"\t""#' |\
-#  sort >> "$ISSUES_F"
+# Keeps the converted pathways in $sync_dir between runs. Each run asks the
+# WikiPathways webservice for the current revision of every human pathway
+# tagged Curation:AnalysisCollection and only downloads and converts the
+# ones with a new revision, using a pool of worker processes. A failed
+# pathway is recorded in $sync_dir/$batch_name.summary.json and doesn't stop
+# the rest. The time and resources used by each stage of each pathway go to
+# $sync_dir/$batch_name.report.jsonl. The issues found, e.g., xrefs with no
+# Wikidata item, go to $sync_dir/$batch_name.issues.jsonl, and one row per
+# kind of issue per pathway to $sync_dir/$batch_name.issues.tsv. Set WORKERS
+# to override the number of processes (default: number of CPUs).
+sync_dir="$SCRIPT_DIR/human_approved_gpml"
+echo "Syncing pathways to $sync_dir"
+python3 "$SCRIPT_DIR/sync.py" ${WORKERS:+--workers "$WORKERS"} \
+  --summary "$sync_dir/$batch_name.summary.json" \
+  --report "$sync_dir/$batch_name.report.jsonl" \
+  --issues "$sync_dir/$batch_name.issues.jsonl" \
+  --issues-tsv "$sync_dir/$batch_name.issues.tsv" "$sync_dir"
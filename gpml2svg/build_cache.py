@@ -0,0 +1,207 @@
+from glob import glob
+import hashlib
+import json
+import os
+from os import path
+import sqlite3
+import threading
+import time
+
+from instrument import stage as instrument_stage
+
+SCRIPT_DIR = path.dirname(path.realpath(__file__))
+
+DEFAULT_BUILD_CACHE_DIR = path.join(
+    path.expanduser("~"), ".cache", "wikipathways2wiki", "build"
+)
+
+
+def hash_bytes(data):
+    """Get the SHA256 hex digest of some bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_files(fs):
+    """Get one SHA256 hex digest for the contents of several files."""
+    sha256 = hashlib.sha256()
+    for f in fs:
+        with open(f, "rb") as f_in:
+            sha256.update(hash_bytes(f_in.read()).encode())
+    return sha256.hexdigest()
+
+
+_code_version = None
+
+
+def get_code_version():
+    """Get a hash of the Python code in this directory.
+
+    Stages that run our own code include it in their inputs, so changing
+    the code rebuilds their outputs.
+    """
+    global _code_version
+    if _code_version is None:
+        _code_version = hash_files(sorted(glob(path.join(SCRIPT_DIR, "*.py"))))
+    return _code_version
+
+
+class BuildCache:
+    """On-disk cache of the outputs of each stage of the conversion.
+
+    A stage output is keyed by a hash of everything that goes into it, e.g.,
+    the hash of the input bytes, the theme and the version of the tool. The
+    manifest is an SQLite table from key to the hash of the output. The output
+    itself is stored once under objects/, named by its hash, so identical
+    outputs are only kept once.
+
+    The cache can be used from several threads and by several batch workers
+    at once.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_BUILD_CACHE_DIR):
+        """Keyword arguments:
+        cache_dir -- where to keep the manifest and outputs (default ~/.cache/wikipathways2wiki/build)
+        """
+        self.cache_dir = cache_dir
+        self.objects_dir = path.join(cache_dir, "objects")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(
+            path.join(cache_dir, "manifest.sqlite"),
+            timeout=60,
+            check_same_thread=False,
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS outputs (
+                key TEXT PRIMARY KEY,
+                stage TEXT NOT NULL,
+                output_hash TEXT NOT NULL,
+                built_at REAL NOT NULL
+            )"""
+        )
+        self.conn.commit()
+
+    def get_key(self, stage, inputs):
+        """Get the key for a stage with inputs, e.g., {"theme": "dark"}."""
+        key_str = json.dumps({"stage": stage, "inputs": inputs}, sort_keys=True)
+        return hash_bytes(key_str.encode())
+
+    def get_object_f(self, output_hash):
+        return path.join(self.objects_dir, output_hash[:2], output_hash)
+
+    def get(self, key, max_age=None):
+        """Get the cached output bytes for a key, or None if not cached.
+
+        Keyword arguments:
+        key -- from get_key
+        max_age -- treat outputs built more than this many seconds ago as not cached
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT output_hash, built_at FROM outputs WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        [output_hash, built_at] = row
+        if max_age is not None and time.time() - built_at > max_age:
+            return None
+        object_f = self.get_object_f(output_hash)
+        if not path.isfile(object_f):
+            return None
+        with open(object_f, "rb") as f_in:
+            output_bytes = f_in.read()
+        # older versions cached the empty output of a failed tool
+        if not output_bytes:
+            return None
+        return output_bytes
+
+    def put(self, key, stage, output_bytes):
+        """Cache the output bytes for a key."""
+        output_hash = hash_bytes(output_bytes)
+        object_f = self.get_object_f(output_hash)
+        if not path.isfile(object_f):
+            os.makedirs(path.dirname(object_f), exist_ok=True)
+            # write to a temporary file first, so another worker never reads
+            # a partly written output
+            tmp_f = f"{object_f}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_f, "wb") as f_out:
+                f_out.write(output_bytes)
+            os.replace(tmp_f, object_f)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO outputs VALUES (?, ?, ?, ?)",
+                (key, stage, output_hash, time.time()),
+            )
+
+    def get_or_build(self, stage, inputs, build, max_age=None):
+        """Get a stage output from the cache, or build and cache it.
+
+        Keyword arguments:
+        stage -- name of the stage, e.g., pvjs
+        inputs -- JSON-serializable dict of everything the output depends on
+        build -- function returning the output bytes, or None if the stage
+                 failed and nothing should be cached. It should raise when a
+                 tool fails, and empty output is never cached.
+        max_age -- rebuild outputs older than this many seconds (default: never)
+        """
+        key = self.get_key(stage, inputs)
+        output_bytes = self.get(key, max_age=max_age)
+        if output_bytes is not None:
+            with self.lock:
+                self.hits += 1
+            return output_bytes
+
+        with self.lock:
+            self.misses += 1
+        output_bytes = build()
+        if output_bytes:
+            self.put(key, stage, output_bytes)
+        return output_bytes
+
+
+def run_stage(build_cache, stage, inputs, build, max_age=None, bytes_in=None):
+    """Run a stage through build_cache, or just build it if build_cache is False.
+
+    The stage is recorded by instrument, including whether it was cached.
+    Raises if the stage builds empty output, e.g., from a tool that failed
+    without saying so.
+
+    Keyword arguments:
+    bytes_in -- size of the stage input, for the record
+
+    See BuildCache.get_or_build for the other arguments.
+    """
+    with instrument_stage(stage, bytes_in=bytes_in) as record:
+        built = list()
+
+        def build_and_record():
+            built.append(True)
+            output_bytes = build()
+            if output_bytes == b"":
+                raise Exception(f"The {stage} stage produced no output")
+            return output_bytes
+
+        if build_cache is False:
+            output_bytes = build_and_record()
+        else:
+            output_bytes = build_cache.get_or_build(
+                stage, inputs, build_and_record, max_age=max_age
+            )
+        record["cached"] = len(built) == 0
+        if output_bytes is not None:
+            record["bytes_out"] = len(output_bytes)
+        return output_bytes
+
+
+_build_cache = None
+
+
+def get_build_cache():
+    """Get the build cache for this process, creating it if needed."""
+    global _build_cache
+    if _build_cache is None:
+        _build_cache = BuildCache()
+    return _build_cache
@@ -2,18 +2,34 @@
 
 # import xml.etree.ElementTree as ET
 import argparse
-import csv
-import itertools
+from concurrent.futures import ThreadPoolExecutor
 import json
 from lxml import etree as ET
+import os
 import re
 import shlex
+import shutil
 import subprocess
 
-from os import path, rename
-import requests
-import pywikibot
-from pywikibot.data import sparql
+from os import path
+
+from build_cache import get_build_cache, get_code_version, hash_bytes, run_stage
+from datasources import get_bridgedb2wd_props, get_bridgedb2wd_props_version
+from gpml import (
+    LATEST_GPML_VERSION,
+    get_gpml_version,
+    get_upgraded_gpml_f,
+    upgrade_gpml,
+)
+from instrument import stage as instrument_stage
+import issues
+from svg_fixes import set_inherited_stroke_widths
+from svg_optimize import get_skipped_plugins, optimize_svg
+from svg_rules import JSON2SVG_RULES
+from wd_index import get_wd_index
+from wikidata import get_xref_resolver
+from workers import get_tool
+from xref_cache import DEFAULT_NEGATIVE_TTL, DEFAULT_TTL, get_xref_cache
 
 
 SCRIPT_DIR = path.dirname(path.realpath(__file__))
@@ -26,39 +42,46 @@ WPID_REV_RE = re.compile(r"(WP\d+)_r?(\d+)")
 LEADING_DOT_RE = re.compile(r"^\.")
 BARE_BASE_RE = re.compile(r"(.+)\.*")
 NON_ALPHANUMERIC_RE = re.compile(r"\W")
-LATEST_GPML_VERSION = "2013a"
-
-BRIDGEDB_REPO_BASE = "https://raw.githubusercontent.com/bridgedb/BridgeDb/master"
-BRIDGEDB2WD_PROPS_REQUEST = requests.get(
-    BRIDGEDB_REPO_BASE + "/org.bridgedb.bio/src/main/resources/org/bridgedb/bio/datasources.tsv"
-)
-BRIDGEDB2WD_PROPS = dict()
-for row in csv.DictReader(BRIDGEDB2WD_PROPS_REQUEST.text.splitlines(), delimiter="\t"):
-    BRIDGEDB2WD_PROPS[row["datasource_name"]] = row["wikidata_property"]
-
-
-# see https://stackoverflow.com/a/8998040
-def grouper_it(n, iterable):
-    it = iter(iterable)
-    while True:
-        chunk_it = itertools.islice(it, n)
-        try:
-            first_el = next(chunk_it)
-        except StopIteration:
-            return
-        yield itertools.chain((first_el,), chunk_it)
-
-
-def gpml2json(path_in, path_out, pathway_iri, wp_id, pathway_version, wd_sparql):
+# how long the build cache may reuse outputs of stages that use web services
+BRIDGEDB_STAGE_MAX_AGE = DEFAULT_TTL
+WIKIDATA_STAGE_MAX_AGE = DEFAULT_NEGATIVE_TTL
+# formats PathVisio converts GPML to
+PATHVISIO_EXTS = ["gpml", "owl", "pdf", "png", "pwf", "txt"]
+FORMATS = ["json", "jsonld", "svg", "pvjssvg"] + PATHVISIO_EXTS
+# what gpmlconverter converts to when it isn't given a path out
+DEFAULT_FORMATS = ["json", "pvjssvg", "svg", "owl", "pdf", "png", "pwf", "txt"]
+
+
+def gpml2json(
+    path_in,
+    path_out,
+    pathway_iri,
+    wp_id,
+    pathway_version,
+    wd_sparql=None,
+    xref_cache=None,
+    wd_index=None,
+    build_cache=None,
+    debug=False,
+):
     """Convert from GPML to JSON.
 
+    The stages (gpml2pvjson, BridgeDb and the Wikidata lookups) pass their
+    output to each other in memory, and only the final JSON is written.
+
     Keyword arguments:
     path_in -- path in, e.g., ./WP4542_103412.gpml
     path_out -- path out, e.g., ./WP4542_103412.json
     pathway_iri -- e.g., http://identifiers.org/wikipathways/WP4542
     wp_id -- e.g., WP4542
     pathway_version -- e.g., 103412
-    wd_sparql -- wikidata object for making queries
+    wd_sparql -- wikidata object for making queries (default: shared client)
+    xref_cache -- cache of xref to Wikidata lookups (default: shared cache)
+    wd_index -- local Wikidata index to use instead of queries (default: the
+                one named by WD_INDEX_F, if set)
+    build_cache -- cache of stage outputs (default: shared cache, False for none)
+    debug -- also write the inputs of BridgeDb and of the Wikidata lookups,
+             e.g., ./WP4542_103412.pre_bridgedb.json and ./WP4542_103412.pre_wd.json
     """
 
     dir_out = path.dirname(path_out)
@@ -66,206 +89,610 @@ def gpml2json(path_in, path_out, pathway_iri, wp_id, pathway_version, wd_sparql)
     base_out = path.basename(path_out)
     [stub_out, ext_out_with_dot] = path.splitext(base_out)
 
-    gpml2pvjson_cmd = (
-        f"gpml2pvjson --id {pathway_iri} --pathway-version {pathway_version}"
+    if build_cache is None:
+        build_cache = get_build_cache()
+    if wd_index is None:
+        wd_index = get_wd_index()
+
+    [pre_bridgedb_json_bytes, bridgedb_out] = get_bridgedb_json(
+        path_in,
+        pathway_iri,
+        wp_id,
+        pathway_version,
+        build_cache=build_cache,
+        debug_stub=f"{dir_out}/{stub_out}" if debug else None,
     )
-    with open(path_in, "r") as f_in:
-        with open(path_out, "w") as f_out:
-            gpml2pvjson_ps = subprocess.Popen(
-                shlex.split(gpml2pvjson_cmd), stdin=f_in, stdout=f_out, shell=False
-            )
-            gpml2pvjson_ps.communicate()[0]
 
+    if bridgedb_out is None:
+        json_bytes = pre_bridgedb_json_bytes
+    else:
+        if debug:
+            with open(f"{dir_out}/{stub_out}.pre_wd.json", "wb") as f_out:
+                f_out.write(bridgedb_out)
+
+        # Wikidata gets new items every day, so the enriched JSON is only
+        # reused for as long as a not-found xref stays in the xref cache.
+        # A local index doesn't change, so with one it's reused until the
+        # index is rebuilt.
+        json_bytes = run_stage(
+            build_cache,
+            "wikidata",
+            {
+                "json": hash_bytes(bridgedb_out),
+                "wp_id": wp_id,
+                "bridgedb2wd_props": get_bridgedb2wd_props_version(),
+                "wd_index": wd_index.version if wd_index is not None else None,
+                "code": get_code_version(),
+            },
+            lambda: add_wikidata_ids(
+                bridgedb_out, wp_id, wd_sparql, xref_cache, wd_index
+            ),
+            max_age=WIKIDATA_STAGE_MAX_AGE if wd_index is None else None,
+            bytes_in=len(bridgedb_out),
+        )
+        if json_bytes is None:
+            # as before, path_out gets the JSON without Wikidata IDs
+            with open(path_out, "wb") as f_out:
+                f_out.write(bridgedb_out)
+            return False
+        # from the output rather than in add_wikidata_ids, so that a cached
+        # wikidata stage reports the same issues
+        if issues.is_recording():
+            report_xref_issues(json_bytes, wp_id)
+
+    with open(path_out, "wb") as f_out:
+        f_out.write(json_bytes)
+
+
+def get_bridgedb_json(
+    path_in,
+    pathway_iri,
+    wp_id,
+    pathway_version,
+    build_cache=None,
+    debug_stub=None,
+    report_issues=True,
+):
+    """Convert from GPML to JSON with gpml2pvjson, then map its xrefs with BridgeDb.
+
+    These are the stages of gpml2json before the Wikidata lookups.
+
+    Keyword arguments:
+    path_in -- path in, e.g., ./WP4542_103412.gpml
+    pathway_iri -- e.g., http://identifiers.org/wikipathways/WP4542
+    wp_id -- e.g., WP4542
+    pathway_version -- e.g., 103412
+    build_cache -- cache of stage outputs (default: shared cache, False for none)
+    debug_stub -- if set, e.g., to ./WP4542_103412, also write the input of
+                  BridgeDb to ./WP4542_103412.pre_bridgedb.json
+    report_issues -- report the issues found, e.g., invalid xrefs (default True)
+
+    Returns the JSON from gpml2pvjson, without invalid xrefs, and the JSON
+    from BridgeDb, which is None if BridgeDb wasn't called, e.g., for a
+    pathway without an organism or xrefs.
+    """
+    if build_cache is None:
+        build_cache = get_build_cache()
+
+    gpml2pvjson = get_tool("gpml2pvjson")
+    gpml2pvjson_args = shlex.split(
+        f"--id {pathway_iri} --pathway-version {pathway_version}"
+    )
+    with open(path_in, "rb") as f_in:
+        gpml_bytes = f_in.read()
+    gpml2pvjson_out = run_stage(
+        build_cache,
+        "gpml2pvjson",
+        {
+            "gpml": hash_bytes(gpml_bytes),
+            "args": gpml2pvjson_args,
+            "gpml2pvjson": gpml2pvjson.version(),
+        },
+        lambda: gpml2pvjson.run(gpml2pvjson_args, gpml_bytes),
+        bytes_in=len(gpml_bytes),
+    )
     organism = None
-    with open(path_out, "r") as json_f:
-        pathway_data = json.load(json_f)
-        pathway = pathway_data["pathway"]
-        organism = pathway["organism"]
-        entities_by_id = pathway_data["entitiesById"]
-        entities_with_valid_xrefs = list()
-        for entity in entities_by_id.values():
-            datasource_invalid = "xrefDataSource" in entity and (
-                entity["xrefDataSource"] in ["undefined"]
-                or not entity["xrefDataSource"]
-            )
-            xref_identifier_invalid = "xrefIdentifier" in entity and (
-                entity["xrefIdentifier"] in ["undefined"]
-                or not entity["xrefIdentifier"]
-            )
-            if datasource_invalid or xref_identifier_invalid:
-                entity_id = entity["id"]
-                print(
-                    f"Invalid xref datasource and/or identifier for {wp_id}, entity {entity_id}"
+    pathway_data = json.loads(gpml2pvjson_out)
+    pathway = pathway_data["pathway"]
+    organism = pathway["organism"]
+    entities_by_id = pathway_data["entitiesById"]
+    entities_with_valid_xrefs = list()
+    for entity in entities_by_id.values():
+        datasource_invalid = "xrefDataSource" in entity and (
+            entity["xrefDataSource"] in ["undefined"] or not entity["xrefDataSource"]
+        )
+        xref_identifier_invalid = "xrefIdentifier" in entity and (
+            entity["xrefIdentifier"] in ["undefined"] or not entity["xrefIdentifier"]
+        )
+        if datasource_invalid or xref_identifier_invalid:
+            entity_id = entity["id"]
+            if report_issues:
+                issues.report(
+                    issues.XREF_MISSING_DATASOURCE_OR_IDENTIFIER,
+                    wp_id,
+                    entity_id,
+                    message=f"Invalid xref datasource and/or identifier for {wp_id}, entity {entity_id}",
+                    datasource=entity.get("xrefDataSource"),
+                    identifier=entity.get("xrefIdentifier"),
                 )
-                # bridgedbjs fails when an identifier is something like 'undefined'.
-                # Should it ignore datasources/identifiers it doesn't recognize
-                # and just keep going?
-                del entity["xrefDataSource"]
-                del entity["xrefIdentifier"]
-            else:
-                entities_with_valid_xrefs.append(entity)
-        with open(path_out, "w") as f_out:
-            json.dump(pathway_data, f_out)
+            # bridgedbjs fails when an identifier is something like 'undefined'.
+            # Should it ignore datasources/identifiers it doesn't recognize
+            # and just keep going?
+            del entity["xrefDataSource"]
+            del entity["xrefIdentifier"]
+        else:
+            entities_with_valid_xrefs.append(entity)
+
+    if len(entities_with_valid_xrefs) == len(entities_by_id):
+        # nothing was removed, so the gpml2pvjson output can be passed on as is
+        pre_bridgedb_json_bytes = gpml2pvjson_out
+    else:
+        pre_bridgedb_json_bytes = json.dumps(pathway_data).encode()
 
     if not organism:
-        print("No organism. Can't call BridgeDb.")
+        if report_issues:
+            issues.report(
+                issues.ORGANISM_MISSING,
+                wp_id,
+                message="No organism. Can't call BridgeDb.",
+            )
+        return [pre_bridgedb_json_bytes, None]
     elif len(entities_with_valid_xrefs) == 0:
         # TODO: bridgedbjs fails when no xrefs are present.
         # Update bridgedbjs to do this check:
-        print("No xrefs to process.")
+        if report_issues:
+            print("No xrefs to process.")
+        return [pre_bridgedb_json_bytes, None]
+
+    if debug_stub is not None:
+        with open(f"{debug_stub}.pre_bridgedb.json", "wb") as f_out:
+            f_out.write(pre_bridgedb_json_bytes)
+
+    bridgedb_args = shlex.split(
+        f"""xrefs -f json \
+        -i '.entitiesById[].type' "{organism}" \
+        '.entitiesById[].xrefDataSource' \
+        '.entitiesById[].xrefIdentifier' \
+        ChEBI P683 Ensembl P594 "Entrez Gene" P351 HGNC P353 HMDB P2057 Wikidata
+    """
+    )
+    bridgedb = get_tool("bridgedb")
+    # BridgeDb's mappings change now and then, so its output is only
+    # reused for a while.
+    bridgedb_out = run_stage(
+        build_cache,
+        "bridgedb",
+        {
+            "json": hash_bytes(pre_bridgedb_json_bytes),
+            "args": bridgedb_args,
+            "bridgedb": bridgedb.version(),
+        },
+        lambda: bridgedb.run(bridgedb_args, pre_bridgedb_json_bytes),
+        max_age=BRIDGEDB_STAGE_MAX_AGE,
+        bytes_in=len(pre_bridgedb_json_bytes),
+    )
+    return [pre_bridgedb_json_bytes, bridgedb_out]
+
+
+def get_xrefs_to_look_up(entities_by_id, bridgedb2wd_props):
+    """Get the xrefs of a pathway to look up in Wikidata.
+
+    Those are the xrefs of entities that have no Wikidata ID from BridgeDb
+    yet, for datasources with a Wikidata property. Entities with the same
+    xref share a key, so it's looked up only once.
+
+    Keyword arguments:
+    entities_by_id -- entitiesById of the pathway JSON from BridgeDb
+    bridgedb2wd_props -- e.g., {"Entrez Gene": "P351"}
+
+    Returns a dict from key to [datasource, identifier], and a dict from key
+    to the IDs of the entities with that xref.
+    """
+    no_wikidata_xrefs_by_bridgedb_key = dict()
+    entity_ids_by_bridgedb_key = dict()
+    for entity in entities_by_id.values():
+        if (
+            "xrefIdentifier" in entity
+            and "xrefDataSource" in entity
+            and entity["xrefDataSource"] in bridgedb2wd_props
+            and len(
+                [
+                    entity_type
+                    for entity_type in entity["type"]
+                    if entity_type.startswith("Wikidata:")
+                ]
+            )
+            == 0
+        ):
+            entity_id = entity["id"]
+            datasource = entity["xrefDataSource"]
+            xref_identifier = entity["xrefIdentifier"]
+            bridgedb_key = NON_ALPHANUMERIC_RE.sub("", datasource + xref_identifier)
+            no_wikidata_xrefs_by_bridgedb_key[bridgedb_key] = [
+                datasource,
+                xref_identifier,
+            ]
+            if bridgedb_key not in entity_ids_by_bridgedb_key:
+                entity_ids_by_bridgedb_key[bridgedb_key] = [entity_id]
+            else:
+                entity_ids_by_bridgedb_key[bridgedb_key].append(entity_id)
+    return [no_wikidata_xrefs_by_bridgedb_key, entity_ids_by_bridgedb_key]
+
+
+def get_pathway_xrefs(gpml_f, pathway_iri, wp_id, pathway_version, build_cache=None):
+    """Get the (datasource, identifier) pairs that converting a pathway looks
+    up in Wikidata, e.g., to look up those of many pathways at once.
+
+    Runs the same stages as convert up to BridgeDb, whose outputs stay in
+    the build cache for the conversion.
+
+    Keyword arguments:
+    gpml_f -- path in, e.g., ./WP4542_103412.gpml
+    pathway_iri -- e.g., http://identifiers.org/wikipathways/WP4542
+    wp_id -- e.g., WP4542
+    pathway_version -- e.g., 103412
+    build_cache -- cache of stage outputs (default: shared cache, False for none)
+    """
+    latest_gpml_f = get_latest_gpml_f(gpml_f, pathway_iri, wp_id, pathway_version)
+    [_, bridgedb_out] = get_bridgedb_json(
+        latest_gpml_f,
+        pathway_iri,
+        wp_id,
+        pathway_version,
+        build_cache=build_cache,
+        report_issues=False,
+    )
+    if bridgedb_out is None:
+        return list()
+    [no_wikidata_xrefs_by_bridgedb_key, _] = get_xrefs_to_look_up(
+        json.loads(bridgedb_out)["entitiesById"], get_bridgedb2wd_props()
+    )
+    return [tuple(xref) for xref in no_wikidata_xrefs_by_bridgedb_key.values()]
+
+
+def add_wikidata_ids(json_bytes, wp_id, wd_sparql=None, xref_cache=None, wd_index=None):
+    """Add Wikidata IDs to the pathway and its entities.
+
+    Keyword arguments:
+    json_bytes -- pathway JSON from BridgeDb
+    wp_id -- e.g., WP4542
+    wd_sparql -- wikidata object for making queries (default: shared client)
+    xref_cache -- cache of xref to Wikidata lookups (default: shared cache)
+    wd_index -- local Wikidata index to use instead of queries (default: the
+                one named by WD_INDEX_F, if set)
+
+    Returns the updated pathway JSON as bytes, or None if the pathway
+    isn't in Wikidata.
+    """
+    bridgedb2wd_props = get_bridgedb2wd_props()
+    pathway_data = json.loads(json_bytes)
+    pathway = pathway_data["pathway"]
+    entities_by_id = pathway_data["entitiesById"]
+    [
+        no_wikidata_xrefs_by_bridgedb_key,
+        entity_ids_by_bridgedb_key,
+    ] = get_xrefs_to_look_up(entities_by_id, bridgedb2wd_props)
+
+    if wd_index is None:
+        wd_index = get_wd_index()
+    if wd_index is not None:
+        wd_ids_by_xref = wd_index.get_many(
+            [tuple(xref) for xref in no_wikidata_xrefs_by_bridgedb_key.values()],
+            bridgedb2wd_props,
+        )
+        wd_ids_by_bridgedb_key = {
+            bridgedb_key: wd_ids_by_xref[tuple(xref)]
+            for bridgedb_key, xref in no_wikidata_xrefs_by_bridgedb_key.items()
+        }
+        wikidata_pathway_identifier = wd_index.get_pathway_id(wp_id)
+        if wikidata_pathway_identifier is None:
+            issues.report(
+                issues.PATHWAY_NOT_IN_WIKIDATA,
+                wp_id,
+                message=f"Pathway ID {wp_id} not found in {wd_index.index_f}. "
+                + "Skipping conversion.",
+            )
+            return None
     else:
-        pre_bridgedb_json_f = f"{dir_out}/{stub_out}.pre_bridgedb.json"
-        rename(path_out, pre_bridgedb_json_f)
-
-        bridgedb_cmd = f"""bridgedb xrefs -f json \
-            -i '.entitiesById[].type' "{organism}" \
-            '.entitiesById[].xrefDataSource' \
-            '.entitiesById[].xrefIdentifier' \
-            ChEBI P683 Ensembl P594 "Entrez Gene" P351 HGNC P353 HMDB P2057 Wikidata
-        """
-        with open(pre_bridgedb_json_f, "r") as f_in:
-            with open(path_out, "w") as f_out:
-                bridgedb_ps = subprocess.Popen(
-                    shlex.split(bridgedb_cmd), stdin=f_in, stdout=f_out, shell=False
-                )
-                bridgedb_ps.communicate()[0]
-
-        no_wikidata_xrefs_by_bridgedb_key = dict()
-        entity_ids_by_bridgedb_key = dict()
-        with open(path_out, "r") as json_f:
-            pathway_data = json.load(json_f)
-            pathway = pathway_data["pathway"]
-            entities_by_id = pathway_data["entitiesById"]
-            for entity in entities_by_id.values():
-                if (
-                    "xrefIdentifier" in entity
-                    and "xrefDataSource" in entity
-                    and entity["xrefDataSource"] in BRIDGEDB2WD_PROPS
-                    and len(
-                        [
-                            entity_type
-                            for entity_type in entity["type"]
-                            if entity_type.startswith("Wikidata:")
-                        ]
-                    )
-                    == 0
-                ):
-                    entity_id = entity["id"]
-                    datasource = entity["xrefDataSource"]
-                    xref_identifier = entity["xrefIdentifier"]
-                    bridgedb_key = NON_ALPHANUMERIC_RE.sub(
-                        "", datasource + xref_identifier
-                    )
-                    no_wikidata_xrefs_by_bridgedb_key[bridgedb_key] = [
-                        datasource,
-                        xref_identifier,
-                    ]
-                    if bridgedb_key not in entity_ids_by_bridgedb_key:
-                        entity_ids_by_bridgedb_key[bridgedb_key] = [entity_id]
-                    else:
-                        entity_ids_by_bridgedb_key[bridgedb_key].append(entity_id)
-
-            pathway_id_query = (
-                '''
+        xref_resolver = get_xref_resolver(wd_sparql)
+        wd_sparql = xref_resolver.wd_sparql
+
+        pathway_id_query = (
+            '''
 SELECT ?item WHERE {
 ?item wdt:P2410 "'''
-                + wp_id
-                + """" .
+            + wp_id
+            + """" .
 SERVICE wikibase:label { bd:serviceParam wikibase:language "en" }
 }"""
-            )
+        )
+        # The pathway ID lookup runs alongside the xref queries below.
+        wd_pathway_id_future = xref_resolver.executor.submit(
+            wd_sparql.query, pathway_id_query
+        )
+
+        # xrefs found in the cache don't need to be queried again
+        if xref_cache is None:
+            xref_cache = get_xref_cache()
+        cached_wd_ids_by_xref = xref_cache.get_many(
+            tuple(xref) for xref in no_wikidata_xrefs_by_bridgedb_key.values()
+        )
+        wd_ids_by_bridgedb_key = dict()
+        uncached_xrefs_by_bridgedb_key = dict()
+        for bridgedb_key, xref in no_wikidata_xrefs_by_bridgedb_key.items():
+            if tuple(xref) in cached_wd_ids_by_xref:
+                wd_ids_by_bridgedb_key[bridgedb_key] = cached_wd_ids_by_xref[
+                    tuple(xref)
+                ]
+            else:
+                uncached_xrefs_by_bridgedb_key[bridgedb_key] = xref
+
+        queried_wd_ids_by_xref = xref_resolver.resolve(
+            [tuple(xref) for xref in uncached_xrefs_by_bridgedb_key.values()],
+            bridgedb2wd_props,
+        )
+        for bridgedb_key, xref in uncached_xrefs_by_bridgedb_key.items():
+            wd_ids_by_bridgedb_key[bridgedb_key] = queried_wd_ids_by_xref[tuple(xref)]
+
+        # not-found xrefs are cached too, so we don't keep asking for them
+        xref_cache.set_many(queried_wd_ids_by_xref)
+
+        wd_pathway_id_result = wd_pathway_id_future.result()
+
+        if len(wd_pathway_id_result["results"]["bindings"]) == 0:
+            print(f"Pathway ID {wp_id} not found in Wikidata. Retrying.")
+            # retry once
             wd_pathway_id_result = wd_sparql.query(pathway_id_query)
+        if len(wd_pathway_id_result["results"]["bindings"]) == 0:
+            # if it still doesn't work, skip it
+            issues.report(
+                issues.PATHWAY_NOT_IN_WIKIDATA,
+                wp_id,
+                message=f"Pathway ID {wp_id} still not found in Wikidata. Skipping conversion.",
+            )
+            return None
+
+        wikidata_pathway_iri = wd_pathway_id_result["results"]["bindings"][0]["item"][
+            "value"
+        ]
+        wikidata_pathway_identifier = wikidata_pathway_iri.replace(
+            "http://www.wikidata.org/entity/", ""
+        )
 
-            if len(wd_pathway_id_result["results"]["bindings"]) == 0:
-                print(f"Pathway ID {wp_id} not found in Wikidata. Retrying.")
-                # retry once
-                wd_pathway_id_result = wd_sparql.query(pathway_id_query)
-            if len(wd_pathway_id_result["results"]["bindings"]) == 0:
-                # if it still doesn't work, skip it
-                print(
-                    f"Pathway ID {wp_id} still not found in Wikidata. Skipping conversion."
+    # adding Wikidata IRI to sameAs property & ensuring no duplication
+    if not "sameAs" in pathway:
+        pathway["sameAs"] = wikidata_pathway_identifier
+    else:
+        same_as = pathway["sameAs"]
+        if type(same_as) == str:
+            pathway["sameAs"] = list({wikidata_pathway_identifier, same_as})
+        else:
+            same_as.append(wikidata_pathway_identifier)
+            pathway["sameAs"] = list(set(same_as))
+
+    for bridgedb_key, wd_ids in wd_ids_by_bridgedb_key.items():
+        for wd_xref_identifier in wd_ids:
+            for entity_id in entity_ids_by_bridgedb_key[bridgedb_key]:
+                entities_by_id[entity_id]["type"].append(
+                    f"Wikidata:{wd_xref_identifier}"
                 )
-                return False
 
-            wikidata_pathway_iri = wd_pathway_id_result["results"]["bindings"][0][
-                "item"
-            ]["value"]
-            wikidata_pathway_identifier = wikidata_pathway_iri.replace(
-                "http://www.wikidata.org/entity/", ""
+    return json.dumps(pathway_data).encode()
+
+
+def report_xref_issues(json_bytes, wp_id):
+    """Report the xrefs with no Wikidata item, or with more than one.
+
+    Keyword arguments:
+    json_bytes -- pathway JSON with Wikidata IDs, from add_wikidata_ids
+    wp_id -- e.g., WP4542
+    """
+    bridgedb2wd_props = get_bridgedb2wd_props()
+    for entity in json.loads(json_bytes)["entitiesById"].values():
+        datasource = entity.get("xrefDataSource")
+        xref_identifier = entity.get("xrefIdentifier")
+        if not datasource or not xref_identifier:
+            continue
+        wd_ids = sorted(
+            {
+                entity_type.replace("Wikidata:", "")
+                for entity_type in entity["type"]
+                if entity_type.startswith("Wikidata:")
+            }
+        )
+        if len(wd_ids) == 1:
+            continue
+        if len(wd_ids) > 1:
+            code = issues.WIKIDATA_AMBIGUOUS_MAPPING
+        elif datasource not in bridgedb2wd_props:
+            code = issues.WIKIDATA_PROPERTY_MISSING
+        else:
+            code = issues.WIKIDATA_MAPPING_FAILED
+        details = {"datasource": datasource, "identifier": xref_identifier}
+        if wd_ids:
+            details["wikidata_ids"] = ",".join(wd_ids)
+        issues.report(code, wp_id, entity["id"], **details)
+
+
+def pathvisio_convert(path_in, paths_out, scale=100):
+    """Convert GPML with PathVisio, e.g., to PDF and PNG.
+
+    With PATHVISIO_WORKER set, e.g., to
+        java -classpath "$CLASSPATH" gpml2svg/PathVisioWorker.java
+    all of paths_out are one request to a long-lived JVM, which stays up for
+    the next pathway. Otherwise `pathvisio convert` runs once per path out.
+
+    Keyword arguments:
+    path_in -- path of GPML file, e.g., ./WP4542_103412.gpml
+    paths_out -- list of paths out, e.g., [./WP4542_103412.pdf, ./WP4542_103412.png]
+    scale -- scale to use when converting to PNG (default 100)
+    """
+    if scale is None:
+        scale = 100
+    with instrument_stage("pathvisio", bytes_in=path.getsize(path_in)):
+        pathvisio = get_tool("pathvisio")
+        if pathvisio.worker_cmd:
+            # the worker fails the request if any path out wasn't written
+            pathvisio.run([path_in, str(scale)] + list(paths_out), b"")
+        else:
+            run_pathvisio_per_path_out(path_in, paths_out, scale)
+
+
+def run_pathvisio_per_path_out(path_in, paths_out, scale):
+    """Run `pathvisio convert` once per path out, starting a JVM each time."""
+    for path_out in paths_out:
+        if path_out.endswith(".png"):
+            # TODO: look at using --scale as an option (instead of an argument),
+            #       for both pathvisio and gpmlconverter.
+            # TODO: move the setting of a default value for scale into
+            # pathvisio instead of here.
+            subprocess.run(
+                shlex.split(f"pathvisio convert {path_in} {path_out} {scale}")
             )
+            # Use interlacing? See https://github.com/PathVisio/pathvisio/issues/78
+            # It's probably not worthwhile. If we did it, we would need to install
+            # imagemagick and then run this:
+            #     mv "$path_out" "$path_out.noninterlaced.png"
+            #     convert -interlace PNG "$path_out.noninterlaced.png" "$path_out"
+        else:
+            subprocess.run(shlex.split(f"pathvisio convert {path_in} {path_out}"))
 
-            # adding Wikidata IRI to sameAs property & ensuring no duplication
-            if not "sameAs" in pathway:
-                pathway["sameAs"] = wikidata_pathway_identifier
-            else:
-                same_as = pathway["sameAs"]
-                if type(same_as) == str:
-                    pathway["sameAs"] = list({wikidata_pathway_identifier, same_as})
-                else:
-                    same_as.append(wikidata_pathway_identifier)
-                    pathway["sameAs"] = list(set(same_as))
-
-            headings = []
-            queries = []
-            for i, xref in enumerate(no_wikidata_xrefs_by_bridgedb_key.values()):
-                [datasource, xref_identifier] = xref
-                heading = "?" + NON_ALPHANUMERIC_RE.sub(
-                    "", datasource + xref_identifier
-                )
-                headings.append(heading)
-                wd_prop = BRIDGEDB2WD_PROPS[datasource]
-                queries.append(f'{heading} wdt:{wd_prop} "{xref_identifier}" .')
-
-            # Here we chunk the headings and queries into paired batches and
-            # make several smaller requests to WD. This is needed because some
-            # of the GET requests become too large to send as a single request.
-
-            batch_size = 10
-            for [heading_batch, query_batch] in zip(
-                grouper_it(batch_size, headings), grouper_it(batch_size, queries)
-            ):
-                headings_str = " ".join(heading_batch)
-                queries_str = (
-                    "WHERE { "
-                    + " ".join(query_batch)
-                    + ' SERVICE wikibase:label { bd:serviceParam wikibase:language "en" }}'
-                )
-                xref_query = f"SELECT {headings_str} {queries_str}"
-                xref_result = wd_sparql.query(xref_query)
-                xref_query = f"SELECT {headings_str} {queries_str}"
-                xref_result = wd_sparql.query(xref_query)
-
-                bridgedb_keys = xref_result["head"]["vars"]
-                for binding in xref_result["results"]["bindings"]:
-                    for bridgedb_key in bridgedb_keys:
-                        # TODO: is this check needed?
-                        if type(binding[bridgedb_key]["value"]) == list:
-                            raise Exception("Error: expected list and got string")
-
-                        wd_xref_identifier = binding[bridgedb_key]["value"].replace(
-                            "http://www.wikidata.org/entity/", ""
-                        )
-                        for entity_id in entity_ids_by_bridgedb_key[bridgedb_key]:
-                            entities_by_id[entity_id]["type"].append(
-                                f"Wikidata:{wd_xref_identifier}"
-                            )
-
-            pre_wd_json_f = f"{dir_out}/{stub_out}.pre_wd.json"
-            rename(path_out, pre_wd_json_f)
-            with open(path_out, "w") as f_out:
-                json.dump(pathway_data, f_out)
-
-
-def json2svg(json_f, path_out, pathway_iri, wp_id, pathway_version, theme):
-    """Convert from JSON to SVG.
+
+def get_themed_paths_out(path_out, theme):
+    """Pair up SVG paths out with their themes.
+
+    Keyword arguments:
+    path_out -- path out, e.g., ./WP4542.svg, or a list of paths out
+    theme -- theme for path_out, e.g., plain, or a list with one theme per path out
+
+    Returns a list of (path_out, theme) pairs.
+    """
+    if isinstance(path_out, str):
+        return [(path_out, theme)]
+    paths_out = list(path_out)
+    themes = [theme] * len(paths_out) if isinstance(theme, str) else list(theme)
+    if len(paths_out) != len(themes):
+        raise Exception(
+            f"Got {len(paths_out)} paths out but {len(themes)} themes. "
+            + "Specify one theme per path out."
+        )
+    return list(zip(paths_out, themes))
+
+
+def json2svg(
+    json_f,
+    path_out,
+    pathway_iri,
+    wp_id,
+    pathway_version,
+    theme,
+    debug=False,
+    use_svgo=None,
+    build_cache=None,
+):
+    """Convert from JSON to SVG, for one or more themes.
+
+    The JSON is read once, then pvjs runs once per theme, with the runs in
+    parallel in a thread pool. Each theme's rendering then gets the SVG
+    fixes and is optimized on its own, as it comes in.
 
     Keyword arguments:
     json_f -- path of JSON file, e.g., ./WP4542_103412.gpml
-    path_out -- path out, e.g., ./WP4542_103412.svg
+    path_out -- path out, e.g., ./WP4542_103412.svg, or a list of paths out
     pathway_iri -- e.g., http://identifiers.org/wikipathways/WP4542
     wp_id -- e.g., WP4542
     pathway_version -- e.g., 103412
-    theme -- theme (plain or dark) to use when converting to SVG (default plain)
+    theme -- theme (plain or dark) to use when converting to SVG, or a list
+             with one theme per path out
+    debug -- also write the SVG from before optimizing, e.g., ./WP4542_103412.pre_svgo.svg
+    use_svgo -- optimize with the svgo CLI, or in Python (default: svgo if installed)
+    build_cache -- cache of stage outputs (default: shared cache, False for none)
+    """
+
+    themed_paths_out = get_themed_paths_out(path_out, theme)
+    use_svgo = get_use_svgo(use_svgo)
+
+    if build_cache is None:
+        build_cache = get_build_cache()
+
+    with open(json_f, "rb") as f_in:
+        json_bytes = f_in.read()
+
+    pvjs = get_tool("pvjs")
+
+    def run_pvjs(theme_out):
+        pvjs_args = ["--theme", theme_out]
+        return run_stage(
+            build_cache,
+            "pvjs",
+            {"json": hash_bytes(json_bytes), "args": pvjs_args, "pvjs": pvjs.version()},
+            lambda: pvjs.run(pvjs_args, json_bytes),
+            bytes_in=len(json_bytes),
+        )
+
+    svgo_config_f = f"{SCRIPT_DIR}/svgo-config.json"
+    with open(svgo_config_f, "rb") as f_in:
+        svgo_config_hash = hash_bytes(f_in.read())
+    if not use_svgo:
+        # on every run, also when the SVGs come from the build cache
+        skipped_plugins = get_skipped_plugins(svgo_config_f)
+        if len(skipped_plugins) > 0:
+            print(
+                f"Warning: optimizing {wp_id} without svgo, so these plugins from "
+                + f"svgo-config.json are skipped: {', '.join(skipped_plugins)}"
+            )
+
+    def build_svg(pvjs_out, path_out_themed):
+        fix_svg(pvjs_out, path_out_themed, debug, use_svgo)
+        with open(path_out_themed, "rb") as f_in:
+            return f_in.read()
+
+    with ThreadPoolExecutor(max_workers=len(themed_paths_out)) as executor:
+        pvjs_futures = [
+            executor.submit(run_pvjs, theme_out)
+            for [path_out_themed, theme_out] in themed_paths_out
+        ]
+        for [path_out_themed, theme_out], pvjs_future in zip(
+            themed_paths_out, pvjs_futures
+        ):
+            pvjs_out = pvjs_future.result()
+            # in debug mode, always run the fixes, to get the *.pre_svgo.svg
+            svg_out = run_stage(
+                False if debug else build_cache,
+                "svg",
+                {
+                    "pvjs_out": hash_bytes(pvjs_out),
+                    "svgo_config": svgo_config_hash,
+                    "svgo": get_tool("svgo").version() if use_svgo else None,
+                    "code": get_code_version(),
+                },
+                lambda: build_svg(pvjs_out, path_out_themed),
+                bytes_in=len(pvjs_out),
+            )
+            with open(path_out_themed, "wb") as f_out:
+                f_out.write(svg_out)
+
+
+def get_use_svgo(use_svgo=None):
+    """Get whether to optimize SVGs with the svgo CLI.
+
+    By default, svgo is used when it's installed. The optimizer in Python is
+    faster but skips the svgo plugins it has no version of, like
+    convertPathData and mergePaths, so its SVGs are bigger.
+    """
+    if use_svgo is None:
+        return shutil.which("svgo") is not None
+    return use_svgo
+
+
+def fix_svg(pvjs_out, path_out, debug=False, use_svgo=None):
+    """Fix up and optimize the SVG from pvjs, then write it to path_out.
+
+    Keyword arguments:
+    pvjs_out -- SVG bytes from pvjs
+    path_out -- path out, e.g., ./WP4542_103412.svg
+    debug -- also write the SVG from before optimizing, e.g., ./WP4542_103412.pre_svgo.svg
+    use_svgo -- optimize with the svgo CLI, or in Python (default: svgo if installed)
     """
 
     dir_out = path.dirname(path_out)
@@ -273,202 +700,53 @@ def json2svg(json_f, path_out, pathway_iri, wp_id, pathway_version, theme):
     base_out = path.basename(path_out)
     [stub_out, ext_out_with_dot] = path.splitext(base_out)
 
-    pvjs_cmd = f"pvjs --theme {theme}"
-    with open(json_f, "r") as f_in:
-        with open(path_out, "w") as f_out:
-            pvjs_ps = subprocess.Popen(
-                shlex.split(pvjs_cmd), stdin=f_in, stdout=f_out, shell=False
-            )
-            pvjs_ps.communicate()[0]
-
-    tree = ET.parse(path_out, parser=parser)
-    root = tree.getroot()
-
-    #############################
-    # SVG > .svg
-    #############################
-
-    # TODO: make the stand-alone SVGs work for upload to WM Commons:
-    # https://www.mediawiki.org/wiki/Manual:Coding_conventions/SVG
-    # https://commons.wikimedia.org/wiki/Help:SVG
-    # https://commons.wikimedia.org/wiki/Commons:Commons_SVG_Checker?withJS=MediaWiki:CommonsSvgChecker.js
-    # W3 validator: http://validator.w3.org/#validate_by_upload+with_options
-
-    # WM says: "the recommended image height is around 400–600 pixels. When a
-    #           user views the full size image, a width of 600–800 pixels gives
-    #           them a good close-up view"
-    # https://commons.wikimedia.org/wiki/Help:SVG#Frequently_asked_questions
-    root.set("width", "800px")
-    root.set("height", "600px")
-
-    # TODO: verify that all of the following cases are now correctly handled in pvjs
-    for style_el in root.findall(".//style"):
-        if not style_el.text == "":
-            raise Exception("Expected empty style sheets.")
-    for el in root.findall(".//pattern[@id='PatternQ47512']"):
-        raise Exception("Unexpected pattern.")
-
-    edge_warning_sent = False
-    for el in root.xpath(
-        ".//svg:g/svg:g[contains(@class,'Edge')]/svg:g", namespaces=SVG_NS
-    ):
-        if not edge_warning_sent:
-            print("TODO: update pvjs to avoid having nested g elements for edges.")
-            edge_warning_sent = True
-        # raise Exception("Unexpected nested g element for edge.")
-
-    for el in root.xpath(
-        "/svg:svg/svg:g/svg:g[contains(@class,'Edge')]/svg:path/@style",
-        namespaces=SVG_NS,
-    ):
-        raise Exception(
-            "Unexpected style attribute on path element for edge.", namespaces=SVG_NS
-        )
-
-    for el in root.xpath(
-        "/svg:svg/svg:defs/svg:g[@id='jic-defs']/svg:svg/svg:defs", namespaces=SVG_NS
-    ):
-        raise Exception("Unexpected nested svg for defs.")
+    with instrument_stage("svg_fixes", bytes_in=len(pvjs_out)):
+        root = ET.fromstring(pvjs_out, parser=parser)
+        tree = root.getroottree()
 
-    for el in root.findall(".//defs/g[@id='jic-defs']/svg/defs"):
-        raise Exception("Unexpected nested svg for defs.")
+        #############################
+        # SVG > .svg
+        #############################
 
-    for el in root.xpath(
-        ".//svg:g/svg:g[contains(@class,'Edge')]/svg:path/@style", namespaces=SVG_NS
-    ):
-        raise Exception("Unexpected style attribute on path element for edge.")
+        # TODO: make the stand-alone SVGs work for upload to WM Commons:
+        # https://www.mediawiki.org/wiki/Manual:Coding_conventions/SVG
+        # https://commons.wikimedia.org/wiki/Help:SVG
+        # https://commons.wikimedia.org/wiki/Commons:Commons_SVG_Checker?withJS=MediaWiki:CommonsSvgChecker.js
+        # W3 validator: http://validator.w3.org/#validate_by_upload+with_options
 
-    # TODO: should any of this be in pvjs instead?
-    style_selector = (
-        "[@style='color:inherit;fill:inherit;fill-opacity:inherit;stroke:inherit;stroke-width:inherit']"
-    )
-    for el_parent in root.findall(f".//*{style_selector}/.."):
-        stroke_width = el_parent.attrib.get("stroke-width", 1)
-        for el in root.findall(f".//*{style_selector}"):
-            el.set(
-                "style",
-                f"color:inherit;fill:inherit;fill-opacity:inherit;stroke:inherit;stroke-width:{str(stroke_width)}",
-            )
+        # WM says: "the recommended image height is around 400–600 pixels. When a
+        #           user views the full size image, a width of 600–800 pixels gives
+        #           them a good close-up view"
+        # https://commons.wikimedia.org/wiki/Help:SVG#Frequently_asked_questions
+        root.set("width", "800px")
+        root.set("height", "600px")
 
-    for el in root.findall(".//*[@filter='url(#kaavioblackto000000filter)']"):
-        el.attrib.pop("filter", None)
-
-    for image_parent in root.findall(".//*image/.."):
-        images = image_parent.findall("image")
-        for image in images:
-            image_parent.remove(image)
-
-    # TODO: do the attributes "filter" "fill" "fill-opacity" "stroke" "stroke-dasharray" "stroke-width"
-    # on the top-level g element apply to the g elements for edges?
-
-    # TODO: do the attributes "color" "fill" "fill-opacity" "stroke" "stroke-dasharray" "stroke-width"
-    # on the top-level g element apply to the path elements for edges?
-
-    # TODO: Which of the following is correct?
-    # To make the SVG file independent of Arial, change all occurrences of
-    #   font-family: Arial to font-family: 'Liberation Sans', Arial, sans-serif
-    #   https://commons.wikimedia.org/wiki/Help:SVG#fallback
-    # vs.
-    # Phab:T64987, Phab:T184369, Gnome #95; font-family="'font name'"
-    #   (internally quoted font family name) does not work
-    #   (File:Mathematical_implication_diagram-alt.svg, File:T184369.svg)
-    #   https://commons.wikimedia.org/wiki/Commons:Commons_SVG_Checker?withJS=MediaWiki:CommonsSvgChecker.js
-
-    # Liberation Sans is the open replacement for Arial, but its kerning
-    # has some issues, at least as processed by librsvg.
-    # An alternative that is also supported MW is DejaVu Sans. Using
-    #   transform="scale(0.92,0.98)"
-    # might yield better kerning and take up about the same amount of space.
-
-    # Long-term, should we switch our default font from Arial to something prettier?
-    # It would have to be a well-supported font.
-    # This page <https://commons.wikimedia.org/wiki/Help:SVG#fallback> says:
-    #     On Commons, librsvg has the fonts listed in:
-    #     https://meta.wikimedia.org/wiki/SVG_fonts#Latin_(basic)_fonts_comparison
-    #     ...
-    #     In graphic illustrations metric exact text elements are often important
-    #     and Arial can be seen as de-facto standard for such a feature.
-
-    for el in root.xpath(".//*[contains(@font-family,'Arial')]", namespaces=SVG_NS):
-        el.set("font-family", "'Liberation Sans', Arial, sans-serif")
-
-    # TODO: do we need to specify fill=currentColor for any elements?
-
-    for el in root.xpath(".//svg:defs//svg:marker//*[not(@fill)]", namespaces=SVG_NS):
-        el.set("fill", "currentColor")
-
-    for el in root.xpath(".//svg:text[@stroke-width='0.05px']", namespaces=SVG_NS):
-        el.attrib.pop("stroke-width", None)
-
-    for el in root.xpath(".//svg:text[@overflow]", namespaces=SVG_NS):
-        el.attrib.pop("overflow", None)
-
-    for el in root.xpath(".//svg:text[@dominant-baseline]", namespaces=SVG_NS):
-        el.attrib.pop("dominant-baseline", None)
-
-    for el in root.xpath(".//svg:text[@clip-path]", namespaces=SVG_NS):
-        el.attrib.pop("clip-path", None)
-
-    FONT_SIZE_RE = re.compile(r"^([0-9.]*)px$")
-    # TRANSLATE_RE = re.compile(r"^translate[(]([0-9.]*),([0-9.]*)[)]$")
-    TRANSLATE_RE = re.compile(r"^translate\(([0-9.]*),([0-9.]*)\)$")
-    # We are pushing the text down based on font size.
-    # This is needed because librsvg doesn't support attribute "alignment-baseline".
-
-    for el in root.xpath(".//svg:text[@font-size]", namespaces=SVG_NS):
-        font_size_full = el.attrib.get("font-size")
-        font_size_matches = re.search(FONT_SIZE_RE, font_size_full)
-        if font_size_matches:
-            font_size = float(font_size_matches.group(1))
-
-        if not font_size:
-            font_size = 5
-
-        x_translation = None
-        y_translation = None
-        transform_full = el.attrib.get("transform")
-        if transform_full:
-            translate_matches = re.search(TRANSLATE_RE, transform_full)
-            if translate_matches:
-                x_translation = float(translate_matches.group(1))
-                y_translation_uncorrected = float(translate_matches.group(2))
-
-        if not x_translation:
-            x_translation = 0
-            y_translation_uncorrected = 0
-
-        y_translation_corrected = font_size / 3 + y_translation_uncorrected
-        el.set("transform", f"translate({x_translation},{y_translation_corrected})")
-
-    # Add link outs
-    WIKIDATA_CLASS_RE = re.compile("Wikidata_Q[0-9]+")
-    for el in root.xpath(".//*[contains(@class,'DataNode')]", namespaces=SVG_NS):
-        wikidata_classes = list(
-            filter(WIKIDATA_CLASS_RE.match, el.attrib.get("class").split(" "))
-        )
-        if len(wikidata_classes) > 0:
-            # if there are multiple, we just link out to the first
-            wikidata_id = wikidata_classes[0].replace("Wikidata_", "")
-            el.tag = "{http://www.w3.org/2000/svg}a"
-            # linkout_base = "https://www.wikidata.org/wiki/"
-            linkout_base = "https://scholia.toolforge.org/"
-            el.set("{http://www.w3.org/1999/xlink}href", linkout_base + wikidata_id)
+        # TODO: should any of this be in pvjs instead?
+        set_inherited_stroke_widths(root)
 
-            # make linkout open in new tab/window
-            el.set("target", "_blank")
+        # The other fixes are rules in svg_rules.py, run in one walk over the tree.
+        JSON2SVG_RULES.apply(root)
 
     ###########
-    # Run SVGO
+    # Optimize
     ###########
 
-    pre_svgo_svg_f = f"{dir_out}/{stub_out}.pre_svgo.svg"
-    tree.write(pre_svgo_svg_f)
+    svgo_config_f = f"{SCRIPT_DIR}/svgo-config.json"
 
-    tree.write(path_out)
-    args = shlex.split(
-        f'svgo --multipass --config "{SCRIPT_DIR}/svgo-config.json" {path_out}'
-    )
-    subprocess.run(args)
+    if debug:
+        pre_svgo_svg_f = f"{dir_out}/{stub_out}.pre_svgo.svg"
+        tree.write(pre_svgo_svg_f)
+
+    if get_use_svgo(use_svgo):
+        tree.write(path_out)
+        args = shlex.split(f'svgo --multipass --config "{svgo_config_f}" {path_out}')
+        with instrument_stage("svgo"):
+            subprocess.run(args)
+    else:
+        # same as svgo for most of svgo-config.json, without starting Node
+        with instrument_stage("optimize_svg"):
+            optimize_svg(root, svgo_config_f)
+        tree.write(path_out)
 
     #########################################
     # Future enhancements for pretty version
@@ -623,26 +901,79 @@ def json2svg(json_f, path_out, pathway_iri, wp_id, pathway_version, theme):
     #            """
 
 
+def get_latest_gpml_f(gpml_f, pathway_iri, wp_id, pathway_version):
+    """Get the path of a GPML file in the latest GPML version.
+
+    That's gpml_f itself if it's already the latest version. Otherwise it's
+    an upgraded copy in a cache, leaving gpml_f as it is.
+    """
+    # only reads the root tag, not the whole file
+    gpml_version = get_gpml_version(gpml_f)
+    if gpml_version == LATEST_GPML_VERSION:
+        return gpml_f
+    issues.report(issues.GPML_OUTDATED, wp_id, gpml_version=gpml_version)
+
+    with instrument_stage("gpml_upgrade", bytes_in=path.getsize(gpml_f)) as record:
+        upgraded_f = upgrade_gpml(gpml_f, gpml_version)
+        if upgraded_f is None:
+            # older than we can upgrade ourselves, so PathVisio does it
+            with open(gpml_f, "rb") as f_in:
+                upgraded_f = get_upgraded_gpml_f(f_in.read())
+            if not path.isfile(upgraded_f):
+                os.makedirs(path.dirname(upgraded_f), exist_ok=True)
+                convert(gpml_f, upgraded_f, pathway_iri, wp_id, pathway_version)
+        record["bytes_out"] = path.getsize(upgraded_f)
+    return upgraded_f
+
+
 def convert(
-    path_in, path_out, pathway_iri, wp_id, pathway_version, scale=100, theme="plain"
+    path_in,
+    path_out,
+    pathway_iri,
+    wp_id,
+    pathway_version,
+    scale=100,
+    theme="plain",
+    debug=False,
+    use_svgo=None,
+    build_cache=None,
 ):
     """Convert from GPML to another format like SVG.
 
+    To get SVGs for several themes, e.g., plain and dark, pass a list of
+    paths out and a list of themes. The GPML is then checked and converted
+    to JSON only once for all of them. A list of paths out can also be any
+    of the formats PathVisio writes, e.g., PDF, PNG and OWL, which are then
+    converted in one request to PathVisio.
+
     Keyword arguments:
     path_in -- path in, e.g., ./WP4542_103412.gpml
-    path_out -- path out, e.g., ./WP4542_103412.svg
+    path_out -- path out, e.g., ./WP4542_103412.svg, or a list of paths out
     pathway_iri -- e.g., http://identifiers.org/wikipathways/WP4542
     pathway_version -- e.g., 103412
     scale -- scale to use when converting to PNG (default 100)
-    theme -- theme (plain or dark) to use when converting to SVG (default plain)"""
+    theme -- theme (plain or dark) to use when converting to SVG (default plain),
+             or a list with one theme per SVG path out
+    debug -- keep intermediate files for debugging (default False)
+    use_svgo -- optimize SVG with the svgo CLI, or in Python (default: svgo if installed)
+    build_cache -- cache of stage outputs (default: shared cache, False for none)"""
     if not path.exists(path_in):
         raise Exception(f"Missing file '{path_in}'")
 
-    if path.exists(path_out):
-        print(f"File {path_out} already exists. Skipping.")
+    themed_paths_out = list()
+    for [path_out_themed, theme_out] in get_themed_paths_out(path_out, theme):
+        if path.exists(path_out_themed):
+            print(f"File {path_out_themed} already exists. Skipping.")
+        else:
+            themed_paths_out.append((path_out_themed, theme_out))
+    if len(themed_paths_out) == 0:
         return True
+    if len(themed_paths_out) == 1:
+        [[path_out, theme]] = themed_paths_out
+    else:
+        path_out = [path_out_themed for [path_out_themed, _] in themed_paths_out]
+        theme = [theme_out for [_, theme_out] in themed_paths_out]
 
-    dir_in = path.dirname(path_in)
     base_in = path.basename(path_in)
     # example base_in: 'WP4542.gpml'
     [stub_in, ext_in_with_dot] = path.splitext(base_in)
@@ -654,64 +985,187 @@ def convert(
         raise Exception(f"Currently only accepting *.gpml for path_in")
     gpml_f = path_in
 
-    dir_out = path.dirname(path_out)
+    [first_path_out, first_theme] = themed_paths_out[0]
+    dir_out = path.dirname(first_path_out)
     # example base_out: 'WP4542.svg'
-    base_out = path.basename(path_out)
+    base_out = path.basename(first_path_out)
     [stub_out, ext_out_with_dot] = path.splitext(base_out)
     # getting rid of the leading dot, e.g., '.svg' to 'svg'
     ext_out = LEADING_DOT_RE.sub("", ext_out_with_dot)
+    exts_out = [
+        LEADING_DOT_RE.sub("", path.splitext(path_out_themed)[1])
+        for [path_out_themed, _] in themed_paths_out
+    ]
+    if len(exts_out) > 1 and not (
+        set(exts_out) <= {"svg", "pvjssvg"} or set(exts_out) <= set(PATHVISIO_EXTS)
+    ):
+        raise Exception(
+            "Multiple paths out are only supported for SVG or for PathVisio formats"
+        )
 
-    tree = ET.parse(gpml_f, parser=parser)
-    root = tree.getroot()
-
-    if root is None:
-        raise Exception("no root element")
-    if root.tag is None:
-        raise Exception("no root tag")
-
-    gpml_version = re.sub(r"{http://pathvisio.org/GPML/(\w+)}Pathway", r"\1", root.tag)
-    if ext_out != "gpml" and gpml_version != LATEST_GPML_VERSION:
-        old_f = f"{dir_in}/{stub_in}.{gpml_version}.gpml"
-        rename(gpml_f, old_f)
-        convert(old_f, gpml_f, pathway_iri, wp_id, pathway_version, scale)
-
-    # trying to get wd ids via sparql via pywikibot
-    site = pywikibot.Site("wikidata", "wikidata")
-    repo = site.data_repository()  # this is a DataSite object
-    wd_sparql = sparql.SparqlQuery(
-        endpoint="https://query.wikidata.org/sparql", repo=repo
-    )
-    # (self, endpoint=None, entity_url=None, repo=None, 2 max_retries=None, retry_wait=None)
-
-    if ext_out in ["gpml", "owl", "pdf", "pwf", "txt"]:
-        subprocess.run(shlex.split(f"pathvisio convert {path_in} {path_out}"))
-    elif ext_out == "png":
-        # TODO: look at using --scale as an option (instead of an argument),
-        #       for both pathvisio and gpmlconverter.
-        # TODO: move the setting of a default value for scale into
-        # pathvisio instead of here.
-        subprocess.run(shlex.split(f"pathvisio convert {path_in} {path_out} {scale}"))
-        # Use interlacing? See https://github.com/PathVisio/pathvisio/issues/78
-        # It's probably not worthwhile. If we did it, we would need to install
-        # imagemagick and then run this:
-        #     mv "$path_out" "$path_out.noninterlaced.png"
-        #     convert -interlace PNG "$path_out.noninterlaced.png" "$path_out"
+    if "gpml" not in exts_out:
+        gpml_f = get_latest_gpml_f(gpml_f, pathway_iri, wp_id, pathway_version)
+        path_in = gpml_f
+
+    if ext_out in PATHVISIO_EXTS:
+        pathvisio_convert(
+            path_in,
+            [path_out_themed for [path_out_themed, _] in themed_paths_out],
+            scale,
+        )
     elif ext_out in ["json", "jsonld"]:
-        gpml2json(path_in, path_out, pathway_iri, wp_id, pathway_version, wd_sparql)
+        gpml2json(
+            path_in,
+            path_out,
+            pathway_iri,
+            wp_id,
+            pathway_version,
+            build_cache=build_cache,
+            debug=debug,
+        )
     elif ext_out in ["svg", "pvjssvg"]:
         #############################
         # SVG
         #############################
 
         json_f = f"{dir_out}/{stub_in}.json"
-        if not path.isfile(json_f):
-            gpml2json(path_in, json_f, pathway_iri, wp_id, pathway_version, wd_sparql)
+        # With the build cache, an existing JSON file isn't trusted, because
+        # the GPML may have changed since. Redoing an unchanged pathway only
+        # takes cache lookups.
+        if build_cache is not False or not path.isfile(json_f):
+            gpml2json(
+                path_in,
+                json_f,
+                pathway_iri,
+                wp_id,
+                pathway_version,
+                build_cache=build_cache,
+                debug=debug,
+            )
 
-        json2svg(json_f, path_out, pathway_iri, wp_id, pathway_version, theme)
+        json2svg(
+            json_f,
+            path_out,
+            pathway_iri,
+            wp_id,
+            pathway_version,
+            theme,
+            debug=debug,
+            use_svgo=use_svgo,
+            build_cache=build_cache,
+        )
     else:
         raise Exception(f"Invalid output extension: '{ext_out}'")
 
 
+def convert_many(
+    path_in,
+    formats,
+    out_dir,
+    pathway_iri,
+    wp_id,
+    pathway_version,
+    scale=100,
+    theme="plain",
+    debug=False,
+    use_svgo=None,
+    build_cache=None,
+):
+    """Convert from GPML to several formats at once, e.g., SVG, PDF and PNG.
+
+    The outputs are named after path_in, e.g., {out_dir}/WP4542_103412.pdf.
+    Each stage runs once for all the formats that need it:
+
+        GPML -> latest GPML -> JSON -> SVG
+        GPML -> PathVisio formats (one request for all of them)
+
+    The JSON/SVG branch and the PathVisio branch run at the same time.
+
+    Keyword arguments:
+    path_in -- path in, e.g., ./WP4542_103412.gpml
+    formats -- list of formats, e.g., ["svg", "pdf", "png"]
+    out_dir -- directory for the outputs
+    pathway_iri -- e.g., http://identifiers.org/wikipathways/WP4542
+    wp_id -- e.g., WP4542
+    pathway_version -- e.g., 103412
+    scale -- scale to use when converting to PNG (default 100)
+    theme -- theme (plain or dark) to use when converting to SVG (default plain)
+    debug -- keep intermediate files for debugging (default False)
+    use_svgo -- optimize SVG with the svgo CLI, or in Python (default: svgo if installed)
+    build_cache -- cache of stage outputs (default: shared cache, False for none)
+    """
+    if not path.exists(path_in):
+        raise Exception(f"Missing file '{path_in}'")
+    invalid_formats = [fmt for fmt in formats if fmt not in FORMATS]
+    if len(invalid_formats) > 0:
+        raise Exception(f"Invalid output formats: {invalid_formats}")
+
+    [stub_in, ext_in_with_dot] = path.splitext(path.basename(path_in))
+    if LEADING_DOT_RE.sub("", ext_in_with_dot) != "gpml":
+        raise Exception(f"Currently only accepting *.gpml for path_in")
+
+    paths_out = dict()
+    for fmt in formats:
+        path_out = f"{out_dir}/{stub_in}.{fmt}"
+        if path.exists(path_out):
+            print(f"File {path_out} already exists. Skipping.")
+        else:
+            paths_out[fmt] = path_out
+    if len(paths_out) == 0:
+        return True
+    os.makedirs(out_dir, exist_ok=True)
+
+    pathvisio_paths_out = [
+        path_out for fmt, path_out in paths_out.items() if fmt in PATHVISIO_EXTS
+    ]
+    json_paths_out = [paths_out[fmt] for fmt in ["json", "jsonld"] if fmt in paths_out]
+    svg_paths_out = [paths_out[fmt] for fmt in ["svg", "pvjssvg"] if fmt in paths_out]
+
+    def convert_json_and_svg():
+        gpml_f = get_latest_gpml_f(path_in, pathway_iri, wp_id, pathway_version)
+        json_f = json_paths_out[0] if json_paths_out else f"{out_dir}/{stub_in}.json"
+        if json_paths_out or build_cache is not False or not path.isfile(json_f):
+            gpml2json(
+                gpml_f,
+                json_f,
+                pathway_iri,
+                wp_id,
+                pathway_version,
+                build_cache=build_cache,
+                debug=debug,
+            )
+        for json_path_out in json_paths_out[1:]:
+            shutil.copyfile(json_f, json_path_out)
+
+        if svg_paths_out:
+            json2svg(
+                json_f,
+                svg_paths_out[0],
+                pathway_iri,
+                wp_id,
+                pathway_version,
+                theme,
+                debug=debug,
+                use_svgo=use_svgo,
+                build_cache=build_cache,
+            )
+            # svg and pvjssvg are the same rendering
+            for svg_path_out in svg_paths_out[1:]:
+                shutil.copyfile(svg_paths_out[0], svg_path_out)
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futures = list()
+        if pathvisio_paths_out:
+            # PathVisio reads every GPML version, so it doesn't wait for the upgrade
+            futures.append(
+                executor.submit(pathvisio_convert, path_in, pathvisio_paths_out, scale)
+            )
+        if json_paths_out or svg_paths_out:
+            futures.append(executor.submit(convert_json_and_svg))
+        for future in futures:
+            future.result()
+
+
 def main():
     """main."""
 
@@ -719,7 +1173,12 @@ def main():
 
     parser = argparse.ArgumentParser(description="Convert GPML to SVG")
     parser.add_argument("path_in")
-    parser.add_argument("path_out")
+    parser.add_argument(
+        "path_out",
+        nargs="+",
+        help="For SVG, one path out per theme, e.g., WP4542.svg WP4542.dark.svg. "
+        + "For PathVisio formats, any of them at once, e.g., WP4542.pdf WP4542.png",
+    )
 
     group_version = parser.add_mutually_exclusive_group()
     group_version.add_argument(
@@ -748,8 +1207,61 @@ def main():
 
     group.add_argument(
         "--theme",
+        action="append",
+        dest="themes",
+        help="Default: plain. Options: plain or dark. Only valid for conversions to SVG format. "
+        + "Specify once per path out to render several themes in one run.",
+    )
+
+    parser.add_argument(
+        "--debug",
+        action="store_true",
+        help="Keep intermediate files, e.g., *.pre_svgo.svg",
+    )
+
+    parser.add_argument(
+        "--svgo",
+        action="store_true",
+        default=None,
+        help="Optimize SVG with the svgo CLI. Requires svgo. "
+        + "Default: svgo if it's installed, else the optimizer in Python.",
+    )
+
+    parser.add_argument(
+        "--no-svgo",
+        action="store_false",
+        dest="svgo",
+        help="Optimize SVG in Python, which is faster but skips some svgo "
+        + "plugins, e.g., convertPathData and mergePaths.",
+    )
+
+    parser.add_argument(
+        "--formats",
+        nargs="+",
+        choices=FORMATS + ["all"],
+        help="Convert to each of these formats at once, with path_out as the "
+        + "directory for them, e.g., WP4542.gpml out/ --formats svg pdf png. "
+        + f"Option all: {' '.join(DEFAULT_FORMATS)}.",
+    )
+
+    parser.add_argument(
+        "--no-build-cache",
+        action="store_true",
+        help="Redo every stage instead of reusing outputs from ~/.cache/wikipathways2wiki/build",
+    )
+
+    parser.add_argument(
+        "--issues",
+        type=str,
+        help="Write the issues found, e.g., xrefs with no Wikidata item, "
+        + "to this file as JSON lines",
+    )
+
+    parser.add_argument(
+        "--wd-index",
         type=str,
-        help="Default: plain. Options: plain or dark. Only valid for conversions to SVG format.",
+        help="Look up Wikidata IDs in this index, built with wd_index.py, "
+        + "instead of query.wikidata.org. Default: $WD_INDEX_F, if set.",
     )
 
     args = parser.parse_args()
@@ -790,15 +1302,53 @@ def main():
             else:
                 pathway_iri = f"http://identifiers.org/wikipathways/{wp_id}"
 
-        convert(
-            args.path_in,
-            args.path_out,
-            pathway_iri=pathway_iri,
-            wp_id=wp_id,
-            pathway_version=pathway_version,
-            scale=args.scale,
-            theme=args.theme,
-        )
+        if args.wd_index:
+            os.environ["WD_INDEX_F"] = args.wd_index
+        if args.issues:
+            issues.start_recording()
+
+        if args.formats:
+            if len(args.path_out) != 1:
+                raise Exception("With --formats, specify one directory as path_out")
+            convert_many(
+                args.path_in,
+                DEFAULT_FORMATS if "all" in args.formats else args.formats,
+                args.path_out[0],
+                pathway_iri=pathway_iri,
+                wp_id=wp_id,
+                pathway_version=pathway_version,
+                scale=args.scale,
+                theme=(args.themes or ["plain"])[0],
+                debug=args.debug,
+                use_svgo=args.svgo,
+                build_cache=False if args.no_build_cache else None,
+            )
+        else:
+            themes = args.themes or ["plain"] * len(args.path_out)
+            if len(args.path_out) == 1:
+                path_out = args.path_out[0]
+                theme = themes[0]
+            else:
+                path_out = args.path_out
+                theme = themes
+
+            convert(
+                args.path_in,
+                path_out,
+                pathway_iri=pathway_iri,
+                wp_id=wp_id,
+                pathway_version=pathway_version,
+                scale=args.scale,
+                theme=theme,
+                debug=args.debug,
+                use_svgo=args.svgo,
+                build_cache=False if args.no_build_cache else None,
+            )
+
+        if args.issues:
+            with open(args.issues, "w") as f_out:
+                for record in issues.stop_recording():
+                    f_out.write(json.dumps(record) + "\n")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,137 @@
+import csv
+import hashlib
+import json
+import os
+from os import path
+import time
+
+import requests
+
+
+SCRIPT_DIR = path.dirname(path.realpath(__file__))
+
+BRIDGEDB_REPO_BASE = "https://raw.githubusercontent.com/bridgedb/BridgeDb/master"
+DATASOURCES_URL = (
+    BRIDGEDB_REPO_BASE
+    + "/org.bridgedb.bio/src/main/resources/org/bridgedb/bio/datasources.tsv"
+)
+DATASOURCES_CACHE_DIR = path.join(
+    path.expanduser("~"), ".cache", "wikipathways2wiki", "datasources"
+)
+# made from datasources.tsv by other/js/bridgedb2wdprop.sh
+BUNDLED_BRIDGEDB2WD_PROPS_F = path.normpath(
+    path.join(SCRIPT_DIR, "..", "other", "js", "bridgedb2wdprop.json")
+)
+# how long to use the cached datasources.tsv before checking for a new one
+REFRESH_SECONDS = 24 * 60 * 60
+
+
+def parse_datasources_tsv(text):
+    """Get a dict from BridgeDb datasource name to Wikidata property.
+
+    Datasources without a Wikidata property are left out.
+    """
+    bridgedb2wd_props = dict()
+    for row in csv.DictReader(text.splitlines(), delimiter="\t"):
+        if row.get("wikidata_property"):
+            bridgedb2wd_props[row["datasource_name"]] = row["wikidata_property"]
+    return bridgedb2wd_props
+
+
+def get_version(bridgedb2wd_props):
+    """Get a short hash identifying the contents of a mapping."""
+    mapping_str = json.dumps(bridgedb2wd_props, sort_keys=True)
+    return hashlib.sha256(mapping_str.encode()).hexdigest()[:16]
+
+
+def write_atomically(f, text):
+    """Write text to a file so that readers, e.g., other batch processes, see
+    either the old or the new file, never a partial one.
+    """
+    tmp_f = f"{f}.{os.getpid()}.tmp"
+    with open(tmp_f, "w") as f_out:
+        f_out.write(text)
+    os.replace(tmp_f, f)
+
+
+def load_datasources_tsv(cache_dir=DATASOURCES_CACHE_DIR, refresh=REFRESH_SECONDS):
+    """Get datasources.tsv, using the local cache when possible.
+
+    When the cached copy is older than refresh seconds, we ask GitHub whether
+    it changed (ETag/If-Modified-Since) and only download it again if so.
+    Returns None if there is no cached copy and the download fails.
+
+    Keyword arguments:
+    cache_dir -- where to keep datasources.tsv and its metadata
+    refresh -- seconds before checking for a new datasources.tsv (default 1 day)
+    """
+    tsv_f = path.join(cache_dir, "datasources.tsv")
+    meta_f = path.join(cache_dir, "datasources.meta.json")
+
+    meta = dict()
+    if path.isfile(tsv_f) and path.isfile(meta_f):
+        with open(meta_f, "r") as f_in:
+            meta = json.load(f_in)
+        if time.time() - meta.get("checked_at", 0) < refresh:
+            with open(tsv_f, "r") as f_in:
+                return f_in.read()
+
+    headers = dict()
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+
+    try:
+        response = requests.get(DATASOURCES_URL, headers=headers, timeout=10)
+    except requests.RequestException as e:
+        print(f"Failed to check for a new datasources.tsv: {e}")
+        response = None
+
+    if response is not None and response.status_code == 200:
+        os.makedirs(cache_dir, exist_ok=True)
+        write_atomically(tsv_f, response.text)
+        meta = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        }
+    elif response is not None and response.status_code != 304:
+        print(
+            f"Failed to check for a new datasources.tsv (status {response.status_code})"
+        )
+
+    if not path.isfile(tsv_f):
+        return None
+
+    if response is not None and response.status_code in [200, 304]:
+        meta["checked_at"] = time.time()
+        write_atomically(meta_f, json.dumps(meta))
+
+    with open(tsv_f, "r") as f_in:
+        return f_in.read()
+
+
+_bridgedb2wd_props = None
+
+
+def get_bridgedb2wd_props():
+    """Get a dict from BridgeDb datasource name to Wikidata property.
+
+    Loaded on first use, from the cached BridgeDb datasources.tsv or, when
+    that isn't available, e.g., with no network, from the bundled snapshot.
+    """
+    global _bridgedb2wd_props
+    if _bridgedb2wd_props is None:
+        datasources_tsv = load_datasources_tsv()
+        if datasources_tsv is not None:
+            _bridgedb2wd_props = parse_datasources_tsv(datasources_tsv)
+        else:
+            print(f"Using bundled {BUNDLED_BRIDGEDB2WD_PROPS_F}")
+            with open(BUNDLED_BRIDGEDB2WD_PROPS_F, "r") as f_in:
+                _bridgedb2wd_props = json.load(f_in)
+    return _bridgedb2wd_props
+
+
+def get_bridgedb2wd_props_version():
+    """Get a short hash identifying the BridgeDb to Wikidata mapping in use."""
+    return get_version(get_bridgedb2wd_props())
@@ -0,0 +1,193 @@
+import os
+from os import path
+import re
+
+from lxml import etree as ET
+
+from build_cache import hash_bytes, hash_files
+
+
+# GPML 2007 and 2008a used genmapp.org namespaces, later versions pathvisio.org
+GPML_NS_RE = re.compile(r"^{http://(?:genmapp|pathvisio)\.org/GPML/(\w+)}")
+GPML_NS_BY_VERSION = {
+    "2007": "http://genmapp.org/GPML/2007",
+    "2008a": "http://genmapp.org/GPML/2008a",
+    "2010a": "http://pathvisio.org/GPML/2010a",
+    "2013a": "http://pathvisio.org/GPML/2013a",
+}
+LATEST_GPML_VERSION = "2013a"
+# versions upgrade_gpml can upgrade without PathVisio, each with a fixture in
+# bench/fixtures. PathVisio still upgrades the others, e.g., 2007.
+UPGRADABLE_GPML_VERSIONS = ["2008a", "2010a"]
+UPGRADED_GPML_CACHE_DIR = path.join(
+    path.expanduser("~"), ".cache", "wikipathways2wiki", "gpml"
+)
+# GPML 2008a coordinates and sizes are in 1/15 px. Later versions use px.
+GPML_2008A_UNITS_PER_PX = 15
+GPML_2008A_SCALED_ATTRS = [
+    "CenterX",
+    "CenterY",
+    "Width",
+    "Height",
+    "BoardWidth",
+    "BoardHeight",
+    "X",
+    "Y",
+]
+GPML_2008A_RENAMED_ATTRS = {"x": "X", "y": "Y", "relX": "RelX", "relY": "RelY"}
+GPML_2008A_REMOVED_ATTRS = ["WindowWidth", "WindowHeight"]
+# the elements that make up most of a GPML file, in any GPML version
+TOP_LEVEL_TAGS = [
+    "{*}DataNode",
+    "{*}State",
+    "{*}Interaction",
+    "{*}GraphicalLine",
+    "{*}Label",
+    "{*}Shape",
+    "{*}Group",
+]
+
+
+def get_gpml_version(gpml_f):
+    """Get the GPML version of a file, e.g., 2013a.
+
+    Only the root start tag is read, so this takes about the same time for
+    any size of file.
+    """
+    with open(gpml_f, "rb") as f_in:
+        for event, root in ET.iterparse(f_in, events=("start",)):
+            break
+        else:
+            raise Exception("no root element")
+    if root.tag is None:
+        raise Exception("no root tag")
+    gpml_ns_match = GPML_NS_RE.match(root.tag)
+    if not gpml_ns_match:
+        raise Exception(f"Not GPML: root tag is '{root.tag}'")
+    return gpml_ns_match.group(1)
+
+
+def iter_data_nodes(gpml_f):
+    """Yield the DataNodes of a GPML file, without building the whole tree.
+
+    Each DataNode is a dict like
+        {"GraphId": "a1b", "TextLabel": "TP53", "Type": "GeneProduct",
+         "Xref": {"Database": "Entrez Gene", "ID": "7157"}}
+    where "Xref" is None if the DataNode has no Xref.
+
+    DataNodes and the other large top-level elements are dropped once they
+    have been read, so memory use stays about the same for any size of file.
+    """
+    with open(gpml_f, "rb") as f_in:
+        for event, el in ET.iterparse(f_in, events=("end",), tag=TOP_LEVEL_TAGS):
+            parent = el.getparent()
+            if parent is None or parent.getparent() is not None:
+                # not a top-level element, e.g., a Label in a future GPML
+                continue
+
+            if el.tag.endswith("}DataNode"):
+                xref = None
+                for child in el.iterchildren("{*}Xref"):
+                    xref = {"Database": child.get("Database"), "ID": child.get("ID")}
+                    break
+                yield {
+                    "GraphId": el.get("GraphId"),
+                    "TextLabel": el.get("TextLabel"),
+                    "Type": el.get("Type"),
+                    "Xref": xref,
+                }
+
+            el.clear()
+            while el.getprevious() is not None:
+                del parent[0]
+
+
+def iter_xrefs(gpml_f):
+    """Yield the (datasource, identifier) pair of each DataNode Xref.
+
+    DataNodes without an Xref, or with an empty datasource or identifier,
+    are skipped.
+    """
+    for data_node in iter_data_nodes(gpml_f):
+        xref = data_node["Xref"]
+        if xref is not None and xref["Database"] and xref["ID"]:
+            yield (xref["Database"], xref["ID"])
+
+
+def upgrade_gpml_bytes(gpml_bytes, gpml_version):
+    """Upgrade GPML 2010a or 2008a to the latest GPML version.
+
+    2013a only added to 2010a, so 2010a just gets the new namespace. 2008a
+    also gets its coordinates and sizes converted from 1/15 px to px, the
+    attribute names used since 2010a and no window size.
+
+    Keyword arguments:
+    gpml_bytes -- contents of the GPML file
+    gpml_version -- e.g., 2010a
+
+    Returns the upgraded GPML as bytes.
+    """
+    if gpml_version not in UPGRADABLE_GPML_VERSIONS:
+        raise Exception(f"Can't upgrade GPML {gpml_version}")
+
+    old_ns = GPML_NS_BY_VERSION[gpml_version].encode()
+    new_ns = GPML_NS_BY_VERSION[LATEST_GPML_VERSION].encode()
+    upgraded_bytes = gpml_bytes.replace(old_ns, new_ns)
+    if gpml_version != "2008a":
+        return upgraded_bytes
+
+    root = ET.fromstring(upgraded_bytes, parser=ET.XMLParser(strip_cdata=False))
+    for el in root.iter(tag=ET.Element):
+        for old_attr, new_attr in GPML_2008A_RENAMED_ATTRS.items():
+            if old_attr in el.attrib:
+                el.set(new_attr, el.attrib.pop(old_attr))
+        for attr in GPML_2008A_REMOVED_ATTRS:
+            el.attrib.pop(attr, None)
+        for attr in GPML_2008A_SCALED_ATTRS:
+            value = el.get(attr)
+            if value:
+                el.set(attr, str(float(value) / GPML_2008A_UNITS_PER_PX))
+    return ET.tostring(root, xml_declaration=True, encoding="UTF-8")
+
+
+def get_upgraded_gpml_f(gpml_bytes, cache_dir=UPGRADED_GPML_CACHE_DIR):
+    """Get the cache path for the upgraded version of some GPML.
+
+    The path is keyed by the hashes of the GPML and of this file, so a change
+    to the upgrade code doesn't reuse old upgrades.
+    """
+    upgrade_hash = hash_bytes(
+        (hash_bytes(gpml_bytes) + hash_files([__file__])).encode()
+    )
+    return path.join(cache_dir, f"{upgrade_hash}.{LATEST_GPML_VERSION}.gpml")
+
+
+def upgrade_gpml(gpml_f, gpml_version=None, cache_dir=UPGRADED_GPML_CACHE_DIR):
+    """Upgrade a GPML file to the latest GPML version, without changing it.
+
+    The upgraded file is kept in cache_dir, so the same GPML is only
+    upgraded once.
+
+    Keyword arguments:
+    gpml_f -- path of GPML file, e.g., ./WP4542_103412.gpml
+    gpml_version -- e.g., 2010a (default: read from gpml_f)
+    cache_dir -- where to keep upgraded files (default ~/.cache/wikipathways2wiki/gpml)
+
+    Returns the path of the upgraded file, or None if gpml_version can't be
+    upgraded without PathVisio, e.g., 2007.
+    """
+    if gpml_version is None:
+        gpml_version = get_gpml_version(gpml_f)
+    if gpml_version not in UPGRADABLE_GPML_VERSIONS:
+        return None
+
+    with open(gpml_f, "rb") as f_in:
+        gpml_bytes = f_in.read()
+    upgraded_f = get_upgraded_gpml_f(gpml_bytes, cache_dir=cache_dir)
+    if not path.isfile(upgraded_f):
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_f = f"{upgraded_f}.{os.getpid()}.tmp"
+        with open(tmp_f, "wb") as f_out:
+            f_out.write(upgrade_gpml_bytes(gpml_bytes, gpml_version))
+        os.replace(tmp_f, upgraded_f)
+    return upgraded_f
@@ -0,0 +1,153 @@
+from contextlib import contextmanager
+import resource
+import threading
+import time
+
+from wikidata import get_wd_sparql_stats
+
+
+_records = None
+_lock = threading.Lock()
+
+
+def start_recording():
+    """Start recording stages, e.g., before converting one pathway."""
+    global _records
+    with _lock:
+        _records = list()
+
+
+def stop_recording():
+    """Stop recording stages and return the records since start_recording."""
+    global _records
+    with _lock:
+        records = _records or list()
+        _records = None
+    return records
+
+
+def get_usage():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    [sparql_queries, sparql_seconds] = get_wd_sparql_stats()
+    return {
+        "time": time.time(),
+        "cpu": own.ru_utime + own.ru_stime,
+        "child_cpu": children.ru_utime + children.ru_stime,
+        # kB on Linux. These only grow over the life of the process.
+        "peak_rss_kb": own.ru_maxrss,
+        "child_peak_rss_kb": children.ru_maxrss,
+        "sparql_queries": sparql_queries,
+        "sparql_seconds": sparql_seconds,
+    }
+
+
+def get_peak_rss():
+    """Get the peak RSS so far of this process and of its largest exited
+    subprocess, e.g., pvjs, in kB.
+    """
+    return {
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "child_peak_rss_kb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    }
+
+
+@contextmanager
+def stage(name, bytes_in=None):
+    """Record the time and resources used by a stage of the conversion.
+
+    Yields the record, a dict the stage can add to, e.g., bytes_out. Nothing
+    is measured unless start_recording was called.
+
+    CPU time, SPARQL queries and peak RSS are for the whole process, so a
+    stage running at the same time as another, e.g., pvjs for two themes,
+    also counts some of the other's usage. Child CPU time only counts
+    subprocesses that exited during the stage.
+
+    The peak RSS of a process only grows, and a batch worker converts many
+    pathways, so a stage records by how much it raised the peak, not the
+    peak itself. A stage that stays below an earlier peak records 0, however
+    much memory it used. For the peaks themselves, see get_peak_rss.
+
+    Keyword arguments:
+    name -- e.g., pvjs
+    bytes_in -- size of the stage input
+    """
+    record = {"stage": name, "bytes_in": bytes_in, "bytes_out": None}
+    if _records is None:
+        yield record
+        return
+
+    start = get_usage()
+    record["ok"] = False
+    try:
+        yield record
+        record["ok"] = True
+    finally:
+        end = get_usage()
+        record.update(
+            {
+                "wall_s": round(end["time"] - start["time"], 4),
+                "cpu_s": round(end["cpu"] - start["cpu"], 4),
+                "child_cpu_s": round(end["child_cpu"] - start["child_cpu"], 4),
+                "peak_rss_growth_kb": end["peak_rss_kb"] - start["peak_rss_kb"],
+                "child_peak_rss_growth_kb": end["child_peak_rss_kb"]
+                - start["child_peak_rss_kb"],
+                "sparql_queries": end["sparql_queries"] - start["sparql_queries"],
+                "sparql_s": round(end["sparql_seconds"] - start["sparql_seconds"], 4),
+            }
+        )
+        with _lock:
+            if _records is not None:
+                _records.append(record)
+
+
+def summarize(records):
+    """Sum up stage records, e.g., from every pathway in a batch.
+
+    Returns a dict from stage name to totals and maximums for that stage.
+    """
+    summary = dict()
+    for record in records:
+        totals = summary.setdefault(
+            record["stage"],
+            {
+                "count": 0,
+                "failed": 0,
+                "cached": 0,
+                "wall_s": 0.0,
+                "max_wall_s": 0.0,
+                "cpu_s": 0.0,
+                "child_cpu_s": 0.0,
+                "max_peak_rss_growth_kb": 0,
+                "max_child_peak_rss_growth_kb": 0,
+                "sparql_queries": 0,
+                "sparql_s": 0.0,
+                "bytes_in": 0,
+                "bytes_out": 0,
+            },
+        )
+        totals["count"] += 1
+        if not record.get("ok", True):
+            totals["failed"] += 1
+        if record.get("cached"):
+            totals["cached"] += 1
+        for key in [
+            "wall_s",
+            "cpu_s",
+            "child_cpu_s",
+            "sparql_queries",
+            "sparql_s",
+            "bytes_in",
+            "bytes_out",
+        ]:
+            totals[key] += record.get(key) or 0
+        totals["max_wall_s"] = max(totals["max_wall_s"], record.get("wall_s") or 0)
+        for key in ["peak_rss_growth_kb", "child_peak_rss_growth_kb"]:
+            totals[f"max_{key}"] = max(totals[f"max_{key}"], record.get(key) or 0)
+
+    for totals in summary.values():
+        for key in ["wall_s", "max_wall_s", "cpu_s", "child_cpu_s", "sparql_s"]:
+            totals[key] = round(totals[key], 3)
+        totals["mean_wall_s"] = round(totals["wall_s"] / totals["count"], 3)
+    return summary
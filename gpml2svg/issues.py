@@ -0,0 +1,107 @@
+import threading
+
+
+# Issue codes. The first four are the ones the old issues.log had.
+XREF_MISSING_DATASOURCE_OR_IDENTIFIER = "xref_missing_datasource_or_identifier"
+WIKIDATA_PROPERTY_MISSING = "wikidata_property_missing"
+WIKIDATA_MAPPING_FAILED = "wikidata_mapping_failed"
+WIKIDATA_AMBIGUOUS_MAPPING = "wikidata_ambiguous_mapping"
+PATHWAY_NOT_IN_WIKIDATA = "pathway_not_in_wikidata"
+ORGANISM_MISSING = "organism_missing"
+GPML_OUTDATED = "gpml_outdated"
+CONVERSION_FAILED = "conversion_failed"
+
+TSV_HEADER = ["code", "wp_id", "entity_ids", "notes"]
+
+_records = None
+_lock = threading.Lock()
+
+
+def start_recording():
+    """Start recording issues, e.g., before converting one pathway."""
+    global _records
+    with _lock:
+        _records = list()
+
+
+def stop_recording():
+    """Stop recording issues and return the records since start_recording."""
+    global _records
+    with _lock:
+        records = _records or list()
+        _records = None
+    return records
+
+
+def is_recording():
+    return _records is not None
+
+
+def get_issue(code, wp_id, entity_id=None, **details):
+    """Get an issue record, e.g.,
+    {"code": "wikidata_mapping_failed", "wp_id": "WP4542", "entity_id": "a1b",
+     "details": {"datasource": "Entrez Gene", "identifier": "1234"}}
+    """
+    return {"code": code, "wp_id": wp_id, "entity_id": entity_id, "details": details}
+
+
+def report(code, wp_id, entity_id=None, message=None, **details):
+    """Report an issue with a pathway.
+
+    The message, if any, is printed as before. The issue is only recorded
+    while recording.
+
+    Keyword arguments:
+    code -- one of the issue codes above, e.g., wikidata_mapping_failed
+    wp_id -- e.g., WP4542
+    entity_id -- ID of the DataNode or other entity, if the issue is about one
+    message -- text to print
+    details -- anything else about the issue, e.g., datasource="Entrez Gene"
+    """
+    if message is not None:
+        print(message)
+    if _records is None:
+        return
+    record = get_issue(code, wp_id, entity_id, **details)
+    with _lock:
+        if _records is not None:
+            _records.append(record)
+
+
+def get_tsv_rows(records):
+    """Get TSV rows for the issues of a pathway, one row per code and notes.
+
+    Entities with the same issue, e.g., the same xref drawn twice, share a
+    row.
+    """
+    entity_ids_by_key = dict()
+    for record in records:
+        notes = "; ".join(
+            f"{key}={value}" for key, value in sorted(record["details"].items())
+        )
+        key = (record["code"], record["wp_id"] or "", notes)
+        entity_ids = entity_ids_by_key.setdefault(key, list())
+        if record["entity_id"] and record["entity_id"] not in entity_ids:
+            entity_ids.append(record["entity_id"])
+    return [
+        [code, wp_id, ",".join(entity_ids), notes]
+        for [code, wp_id, notes], entity_ids in sorted(entity_ids_by_key.items())
+    ]
+
+
+def count_issues(records, counts=None):
+    """Count issues by code, adding to counts from earlier records if given.
+
+    Returns a dict from code to the number of issues and of pathways with
+    that issue.
+    """
+    if counts is None:
+        counts = dict()
+    wp_ids_by_code = dict()
+    for record in records:
+        code_counts = counts.setdefault(record["code"], {"count": 0, "pathways": 0})
+        code_counts["count"] += 1
+        wp_ids_by_code.setdefault(record["code"], set()).add(record["wp_id"])
+    for code, wp_ids in wp_ids_by_code.items():
+        counts[code]["pathways"] += len(wp_ids)
+    return counts
@@ -0,0 +1,206 @@
+#!/usr/bin/env node
+
+// Long-lived worker that speaks the framed protocol from workers.py and runs
+// a Node command-line tool, e.g., pvjs, in this process for each request.
+//
+// usage: node node_worker.js <command or path of its script>
+//
+// The tool's script is run as if it were started on its own, with the
+// request args as its arguments, the request input as its stdin and what it
+// writes to stdout as the response output. Its dependencies, e.g., React
+// for pvjs, stay loaded between requests, so they're loaded once per worker
+// instead of once per pathway. Only the tool's own files and its argument
+// parser are run again, so no options carry over from one request to the
+// next. Example:
+//
+//   PVJS_WORKER="node gpml2svg/node_worker.js pvjs"
+//
+// workers.py uses this for gpml2pvjson, bridgedb and pvjs by default.
+//
+// A request is done when the tool ends its stdout, when a stream it piped
+// to stdout ends or when it calls process.exit. A non-zero exit code or an
+// uncaught error fails the request, but the worker keeps going.
+
+const fs = require("fs");
+const path = require("path");
+const stream = require("stream");
+const util = require("util");
+
+// argument parsers keep the options they parsed, so they're loaded again
+const ARG_PARSER_RE = /[\\/]node_modules[\\/](commander|minimist|yargs|yargs-parser)[\\/]/;
+
+function getScriptPath(cmd) {
+  if (cmd.indexOf(path.sep) > -1) {
+    return fs.realpathSync(cmd);
+  }
+  for (const dir of (process.env.PATH || "").split(path.delimiter)) {
+    const candidate = path.join(dir, cmd);
+    if (dir && fs.existsSync(candidate)) {
+      return fs.realpathSync(candidate);
+    }
+  }
+  throw new Error(`Can't find ${cmd} on PATH`);
+}
+
+// the package the script is in, e.g., .../node_modules/@wikipathways/pvjs
+function getPackageDir(scriptPath) {
+  let dir = path.dirname(scriptPath);
+  while (!fs.existsSync(path.join(dir, "package.json"))) {
+    const parentDir = path.dirname(dir);
+    if (parentDir === dir) {
+      return path.dirname(scriptPath);
+    }
+    dir = parentDir;
+  }
+  return dir;
+}
+
+const scriptPath = getScriptPath(process.argv[2]);
+const packageDir = getPackageDir(scriptPath);
+const ownNodeModulesDir = path.join(packageDir, "node_modules");
+
+function isReloaded(modulePath) {
+  return (
+    ARG_PARSER_RE.test(modulePath) ||
+    (modulePath.startsWith(packageDir + path.sep) &&
+      !modulePath.startsWith(ownNodeModulesDir + path.sep))
+  );
+}
+
+// the frames go to the real stdout, which the tool doesn't get to see
+const frameOut = process.stdout;
+const realStdin = process.stdin;
+const realStderr = process.stderr;
+
+let current = null;
+
+// between requests, stray output goes to stderr
+Object.defineProperty(process, "stdout", {
+  configurable: true,
+  enumerable: true,
+  get: () => (current ? current.stdout : realStderr),
+});
+Object.defineProperty(process, "stdin", {
+  configurable: true,
+  enumerable: true,
+  get: () => (current ? current.stdin : new stream.Readable({ read() {} })),
+});
+for (const method of ["log", "info", "debug"]) {
+  console[method] = (...args) => {
+    process.stdout.write(util.format(...args) + "\n");
+  };
+}
+const realExit = process.exit;
+process.exit = (code) => {
+  if (current) {
+    current.finish(code === undefined ? process.exitCode : code);
+  } else {
+    realExit(code);
+  }
+};
+process.on("uncaughtException", (err) => fail(err));
+process.on("unhandledRejection", (err) => fail(err));
+
+function fail(err) {
+  if (current) {
+    current.fail(err);
+  } else {
+    console.error(err);
+    realExit(1);
+  }
+}
+
+function writeFrame(payload) {
+  const header = Buffer.alloc(4);
+  header.writeUInt32BE(payload.length, 0);
+  frameOut.write(header);
+  frameOut.write(payload);
+}
+
+function respond(response, output) {
+  writeFrame(Buffer.from(JSON.stringify(response)));
+  writeFrame(output);
+}
+
+function runTool(args, input) {
+  return new Promise((resolve) => {
+    const chunks = [];
+    const stdout = new stream.Writable({
+      write(chunk, encoding, callback) {
+        if (current === request) {
+          chunks.push(Buffer.isBuffer(chunk) ? chunk : Buffer.from(chunk, encoding));
+        }
+        callback();
+      },
+    });
+    const stdin = new stream.Readable({ read() {} });
+    stdin.push(input);
+    stdin.push(null);
+
+    const request = {
+      stdout,
+      stdin,
+      finish(code) {
+        if (current !== request) {
+          return;
+        }
+        current = null;
+        if (code) {
+          resolve([{ ok: false, error: `exited with ${code}` }, Buffer.alloc(0)]);
+        } else {
+          resolve([{ ok: true }, Buffer.concat(chunks)]);
+        }
+      },
+      fail(err) {
+        if (current !== request) {
+          return;
+        }
+        current = null;
+        resolve([{ ok: false, error: String((err && err.stack) || err) }, Buffer.alloc(0)]);
+      },
+    };
+    stdout.on("finish", () => request.finish(process.exitCode));
+    stdout.on("unpipe", () => request.finish(process.exitCode));
+
+    current = request;
+    process.exitCode = undefined;
+    process.argv = [process.argv[0], scriptPath].concat(args);
+    for (const modulePath of Object.keys(require.cache)) {
+      if (isReloaded(modulePath)) {
+        delete require.cache[modulePath];
+      }
+    }
+    try {
+      require(scriptPath);
+    } catch (err) {
+      request.fail(err);
+    }
+  });
+}
+
+let buffered = Buffer.alloc(0);
+const frames = [];
+let queue = Promise.resolve();
+
+realStdin.on("data", (chunk) => {
+  buffered = Buffer.concat([buffered, chunk]);
+  while (buffered.length >= 4) {
+    const size = buffered.readUInt32BE(0);
+    if (buffered.length < 4 + size) {
+      break;
+    }
+    frames.push(buffered.slice(4, 4 + size));
+    buffered = buffered.slice(4 + size);
+  }
+  while (frames.length >= 2) {
+    const header = frames.shift();
+    const input = frames.shift();
+    // requests are answered in order, one at a time
+    queue = queue
+      .then(() => runTool(JSON.parse(header.toString()).args || [], input))
+      .then(([response, output]) => respond(response, output));
+  }
+});
+realStdin.on("end", () => {
+  queue.then(() => realExit(0));
+});
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import shlex
+import subprocess
+import sys
+
+from workers import read_frame, write_frame
+
+
+def main():
+    """Stand-in worker that speaks the framed protocol from workers.py.
+
+    By default it echoes its input back. With --exec, it runs a command per
+    request, so any stdin/stdout tool can be put behind a WorkerPool.
+    """
+
+    parser = argparse.ArgumentParser(description="Stub worker for workers.py")
+    parser.add_argument(
+        "--exec", dest="exec_cmd", type=str, help="Command to run per request"
+    )
+    parser.add_argument(
+        "--crash-after",
+        type=int,
+        help="Exit without answering the request after this many requests",
+    )
+    args = parser.parse_args()
+
+    f_in = sys.stdin.buffer
+    f_out = sys.stdout.buffer
+    request_count = 0
+    while True:
+        header = read_frame(f_in)
+        input_bytes = read_frame(f_in) if header is not None else None
+        if input_bytes is None:
+            break
+        request_count += 1
+        if args.crash_after is not None and request_count > args.crash_after:
+            sys.exit(1)
+
+        request = json.loads(header)
+        response = {"ok": True}
+        output_bytes = input_bytes
+        if args.exec_cmd:
+            ps = subprocess.run(
+                shlex.split(args.exec_cmd) + request.get("args", []),
+                input=input_bytes,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+            )
+            output_bytes = ps.stdout
+            if ps.returncode != 0:
+                response = {"ok": False, "error": ps.stderr.decode(errors="replace")}
+
+        write_frame(f_out, json.dumps(response).encode())
+        write_frame(f_out, output_bytes)
+        f_out.flush()
+
+
+if __name__ == "__main__":
+    main()
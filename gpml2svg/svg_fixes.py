@@ -0,0 +1,31 @@
+# SVG fixes for gpml2svg/convert.py, and for svg2commons/commons_svg.py
+# through the svg2commons/svg_fixes.py link.
+# They work on both lxml and xml.etree.ElementTree trees.
+
+INHERIT_STYLE = "color:inherit;fill:inherit;fill-opacity:inherit;stroke:inherit;stroke-width:inherit"
+
+
+def set_inherited_stroke_widths(root):
+    """Replace stroke-width:inherit with the parent's stroke-width.
+
+    For every element below root with style INHERIT_STYLE, sets the
+    stroke-width in the style to that of the element's own parent (default 1).
+    Visits each element once.
+
+    Returns the number of elements changed.
+    """
+    changed = 0
+    for parent in root.iter():
+        stroke_width = None
+        for el in parent:
+            if el.get("style") != INHERIT_STYLE:
+                continue
+            if stroke_width is None:
+                stroke_width = parent.get("stroke-width", 1)
+            el.set(
+                "style",
+                f"color:inherit;fill:inherit;fill-opacity:inherit;stroke:inherit;stroke-width:{str(stroke_width)}",
+            )
+            changed += 1
+    return changed
+
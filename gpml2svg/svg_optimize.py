@@ -0,0 +1,769 @@
+import json
+import re
+
+from lxml import etree as ET
+
+
+SVG_NAMESPACE = "http://www.w3.org/2000/svg"
+XLINK_NAMESPACE = "http://www.w3.org/1999/xlink"
+
+# see https://github.com/svg/svgo/blob/v1.3.2/plugins/_collections.js
+EDITOR_NAMESPACES = [
+    "http://sodipodi.sourceforge.net/DTD/sodipodi-0.dtd",
+    "http://inkscape.sourceforge.net/DTD/sodipodi-0.dtd",
+    "http://www.inkscape.org/namespaces/inkscape",
+    "http://www.bohemiancoding.com/sketch/ns",
+    "http://ns.adobe.com/AdobeIllustrator/10.0/",
+    "http://ns.adobe.com/Graphs/1.0/",
+    "http://ns.adobe.com/AdobeSVGViewerExtensions/3.0/",
+    "http://ns.adobe.com/Variables/1.0/",
+    "http://ns.adobe.com/SaveForWeb/1.0/",
+    "http://ns.adobe.com/Extensibility/1.0/",
+    "http://ns.adobe.com/Flows/1.0/",
+    "http://ns.adobe.com/ImageReplacement/1.0/",
+    "http://ns.adobe.com/GenericCustomNamespace/1.0/",
+    "http://ns.adobe.com/XPath/1.0/",
+    "http://schemas.microsoft.com/visio/2003/SVGExtensions/",
+    "http://taptrix.com/vectorillustrator/svg_extensions",
+    "http://www.figma.com/figma/ns",
+    "http://purl.org/dc/elements/1.1/",
+    "http://creativecommons.org/ns#",
+    "http://www.w3.org/1999/02/22-rdf-syntax-ns#",
+    "http://www.serif.com/",
+    "http://www.vector.evaxdesign.sk",
+]
+
+CONTAINER_ELEMENTS = [
+    "a",
+    "defs",
+    "g",
+    "marker",
+    "mask",
+    "missing-glyph",
+    "pattern",
+    "svg",
+    "switch",
+    "symbol",
+]
+
+PRESENTATION_ATTRS = [
+    "alignment-baseline",
+    "baseline-shift",
+    "clip",
+    "clip-path",
+    "clip-rule",
+    "color",
+    "color-interpolation",
+    "color-interpolation-filters",
+    "color-profile",
+    "color-rendering",
+    "cursor",
+    "direction",
+    "display",
+    "dominant-baseline",
+    "enable-background",
+    "fill",
+    "fill-opacity",
+    "fill-rule",
+    "filter",
+    "flood-color",
+    "flood-opacity",
+    "font-family",
+    "font-size",
+    "font-size-adjust",
+    "font-stretch",
+    "font-style",
+    "font-variant",
+    "font-weight",
+    "glyph-orientation-horizontal",
+    "glyph-orientation-vertical",
+    "image-rendering",
+    "letter-spacing",
+    "lighting-color",
+    "marker-end",
+    "marker-mid",
+    "marker-start",
+    "mask",
+    "opacity",
+    "overflow",
+    "paint-order",
+    "pointer-events",
+    "shape-rendering",
+    "stop-color",
+    "stop-opacity",
+    "stroke",
+    "stroke-dasharray",
+    "stroke-dashoffset",
+    "stroke-linecap",
+    "stroke-linejoin",
+    "stroke-miterlimit",
+    "stroke-opacity",
+    "stroke-width",
+    "text-anchor",
+    "text-decoration",
+    "text-overflow",
+    "text-rendering",
+    "transform",
+    "unicode-bidi",
+    "vector-effect",
+    "visibility",
+    "word-spacing",
+    "writing-mode",
+]
+
+# attributes a group can pass down to a single child when collapsing it
+INHERITABLE_ATTRS = [
+    attr
+    for attr in PRESENTATION_ATTRS
+    if attr
+    not in [
+        "alignment-baseline",
+        "baseline-shift",
+        "clip",
+        "clip-path",
+        "display",
+        "dominant-baseline",
+        "filter",
+        "flood-color",
+        "flood-opacity",
+        "lighting-color",
+        "mask",
+        "opacity",
+        "overflow",
+        "stop-color",
+        "stop-opacity",
+        "text-decoration",
+        "transform",
+        "unicode-bidi",
+    ]
+]
+
+COLOR_ATTRS = ["color", "fill", "flood-color", "lighting-color", "stop-color", "stroke"]
+
+# CSS color names, see https://www.w3.org/TR/css-color-3/#svg-color
+COLOR_NAMES = {
+    "aliceblue": "#f0f8ff",
+    "antiquewhite": "#faebd7",
+    "aqua": "#0ff",
+    "aquamarine": "#7fffd4",
+    "azure": "#f0ffff",
+    "beige": "#f5f5dc",
+    "bisque": "#ffe4c4",
+    "black": "#000",
+    "blanchedalmond": "#ffebcd",
+    "blue": "#00f",
+    "blueviolet": "#8a2be2",
+    "brown": "#a52a2a",
+    "burlywood": "#deb887",
+    "cadetblue": "#5f9ea0",
+    "chartreuse": "#7fff00",
+    "chocolate": "#d2691e",
+    "coral": "#ff7f50",
+    "cornflowerblue": "#6495ed",
+    "cornsilk": "#fff8dc",
+    "crimson": "#dc143c",
+    "cyan": "#0ff",
+    "darkblue": "#00008b",
+    "darkcyan": "#008b8b",
+    "darkgoldenrod": "#b8860b",
+    "darkgray": "#a9a9a9",
+    "darkgreen": "#006400",
+    "darkgrey": "#a9a9a9",
+    "darkkhaki": "#bdb76b",
+    "darkmagenta": "#8b008b",
+    "darkolivegreen": "#556b2f",
+    "darkorange": "#ff8c00",
+    "darkorchid": "#9932cc",
+    "darkred": "#8b0000",
+    "darksalmon": "#e9967a",
+    "darkseagreen": "#8fbc8f",
+    "darkslateblue": "#483d8b",
+    "darkslategray": "#2f4f4f",
+    "darkslategrey": "#2f4f4f",
+    "darkturquoise": "#00ced1",
+    "darkviolet": "#9400d3",
+    "deeppink": "#ff1493",
+    "deepskyblue": "#00bfff",
+    "dimgray": "#696969",
+    "dimgrey": "#696969",
+    "dodgerblue": "#1e90ff",
+    "firebrick": "#b22222",
+    "floralwhite": "#fffaf0",
+    "forestgreen": "#228b22",
+    "fuchsia": "#f0f",
+    "gainsboro": "#dcdcdc",
+    "ghostwhite": "#f8f8ff",
+    "gold": "#ffd700",
+    "goldenrod": "#daa520",
+    "gray": "#808080",
+    "green": "#008000",
+    "greenyellow": "#adff2f",
+    "grey": "#808080",
+    "honeydew": "#f0fff0",
+    "hotpink": "#ff69b4",
+    "indianred": "#cd5c5c",
+    "indigo": "#4b0082",
+    "ivory": "#fffff0",
+    "khaki": "#f0e68c",
+    "lavender": "#e6e6fa",
+    "lavenderblush": "#fff0f5",
+    "lawngreen": "#7cfc00",
+    "lemonchiffon": "#fffacd",
+    "lightblue": "#add8e6",
+    "lightcoral": "#f08080",
+    "lightcyan": "#e0ffff",
+    "lightgoldenrodyellow": "#fafad2",
+    "lightgray": "#d3d3d3",
+    "lightgreen": "#90ee90",
+    "lightgrey": "#d3d3d3",
+    "lightpink": "#ffb6c1",
+    "lightsalmon": "#ffa07a",
+    "lightseagreen": "#20b2aa",
+    "lightskyblue": "#87cefa",
+    "lightslategray": "#789",
+    "lightslategrey": "#789",
+    "lightsteelblue": "#b0c4de",
+    "lightyellow": "#ffffe0",
+    "lime": "#0f0",
+    "limegreen": "#32cd32",
+    "linen": "#faf0e6",
+    "magenta": "#f0f",
+    "maroon": "#800000",
+    "mediumaquamarine": "#66cdaa",
+    "mediumblue": "#0000cd",
+    "mediumorchid": "#ba55d3",
+    "mediumpurple": "#9370db",
+    "mediumseagreen": "#3cb371",
+    "mediumslateblue": "#7b68ee",
+    "mediumspringgreen": "#00fa9a",
+    "mediumturquoise": "#48d1cc",
+    "mediumvioletred": "#c71585",
+    "midnightblue": "#191970",
+    "mintcream": "#f5fffa",
+    "mistyrose": "#ffe4e1",
+    "moccasin": "#ffe4b5",
+    "navajowhite": "#ffdead",
+    "navy": "#000080",
+    "oldlace": "#fdf5e6",
+    "olive": "#808000",
+    "olivedrab": "#6b8e23",
+    "orange": "#ffa500",
+    "orangered": "#ff4500",
+    "orchid": "#da70d6",
+    "palegoldenrod": "#eee8aa",
+    "palegreen": "#98fb98",
+    "paleturquoise": "#afeeee",
+    "palevioletred": "#db7093",
+    "papayawhip": "#ffefd5",
+    "peachpuff": "#ffdab9",
+    "peru": "#cd853f",
+    "pink": "#ffc0cb",
+    "plum": "#dda0dd",
+    "powderblue": "#b0e0e6",
+    "purple": "#800080",
+    "rebeccapurple": "#639",
+    "red": "#f00",
+    "rosybrown": "#bc8f8f",
+    "royalblue": "#4169e1",
+    "saddlebrown": "#8b4513",
+    "salmon": "#fa8072",
+    "sandybrown": "#f4a460",
+    "seagreen": "#2e8b57",
+    "seashell": "#fff5ee",
+    "sienna": "#a0522d",
+    "silver": "#c0c0c0",
+    "skyblue": "#87ceeb",
+    "slateblue": "#6a5acd",
+    "slategray": "#708090",
+    "slategrey": "#708090",
+    "snow": "#fffafa",
+    "springgreen": "#00ff7f",
+    "steelblue": "#4682b4",
+    "tan": "#d2b48c",
+    "teal": "#008080",
+    "thistle": "#d8bfd8",
+    "tomato": "#ff6347",
+    "turquoise": "#40e0d0",
+    "violet": "#ee82ee",
+    "wheat": "#f5deb3",
+    "white": "#fff",
+    "whitesmoke": "#f5f5f5",
+    "yellow": "#ff0",
+    "yellowgreen": "#9acd32",
+}
+# names that are shorter than their hex value, e.g., red for #f00
+SHORT_COLOR_NAMES = dict()
+for name, hex_color in COLOR_NAMES.items():
+    if len(name) < len(hex_color) and hex_color not in SHORT_COLOR_NAMES:
+        SHORT_COLOR_NAMES[hex_color] = name
+
+RGB_RE = re.compile(
+    r"^rgb\(\s*([0-9.]+%?)\s*,?\s*([0-9.]+%?)\s*,?\s*([0-9.]+%?)\s*\)$", re.I
+)
+LONG_HEX_RE = re.compile(r"^#([0-9a-fA-F])\1([0-9a-fA-F])\2([0-9a-fA-F])\3$")
+WHITESPACE_RE = re.compile(r"\s+")
+RASTER_HREF_RE = re.compile(
+    r"(\.|image/)(jpe?g|png|gif)$|^data:image/(jpe?g|png|gif)", re.I
+)
+
+# see https://github.com/svg/svgo/blob/v1.3.2/plugins/sortAttrs.js
+ATTR_ORDER = [
+    "id",
+    "width",
+    "height",
+    "x",
+    "x1",
+    "x2",
+    "y",
+    "y1",
+    "y2",
+    "cx",
+    "cy",
+    "r",
+    "fill",
+    "stroke",
+    "marker",
+    "d",
+    "points",
+]
+
+
+def localname(el):
+    return ET.QName(el).localname
+
+
+def is_svg_element(el, *names):
+    """Check whether el is an SVG element, optionally one of names."""
+    if not isinstance(el.tag, str):
+        return False
+    qname = ET.QName(el)
+    if qname.namespace not in [None, SVG_NAMESPACE]:
+        return False
+    return not names or qname.localname in names
+
+
+def remove_element(el):
+    """Remove el, keeping the tail text."""
+    parent = el.getparent()
+    if el.tail and el.tail.strip():
+        previous = el.getprevious()
+        if previous is not None:
+            previous.tail = (previous.tail or "") + el.tail
+        else:
+            parent.text = (parent.text or "") + el.tail
+    parent.remove(el)
+
+
+def remove_elements(root, *names):
+    removed = 0
+    for el in list(root.iter()):
+        if el is not root and is_svg_element(el, *names):
+            remove_element(el)
+            removed += 1
+    return removed
+
+
+def remove_comments(root):
+    removed = 0
+    for el in list(root.iter(ET.Comment)):
+        # like svgo, keep comments like <!--! license -->
+        if not (el.text or "").startswith("!"):
+            remove_element(el)
+            removed += 1
+    return removed
+
+
+def remove_metadata(root):
+    return remove_elements(root, "metadata")
+
+
+def remove_title(root):
+    return remove_elements(root, "title")
+
+
+def remove_desc(root):
+    return remove_elements(root, "desc")
+
+
+def remove_script_element(root):
+    return remove_elements(root, "script")
+
+
+def remove_style_element(root):
+    return remove_elements(root, "style")
+
+
+def remove_editors_ns_data(root):
+    changed = 0
+    for el in list(root.iter()):
+        if not isinstance(el.tag, str):
+            continue
+        if ET.QName(el).namespace in EDITOR_NAMESPACES:
+            remove_element(el)
+            changed += 1
+            continue
+        for attr in list(el.attrib):
+            if ET.QName(attr).namespace in EDITOR_NAMESPACES:
+                del el.attrib[attr]
+                changed += 1
+    return changed
+
+
+def cleanup_attrs(root):
+    changed = 0
+    for el in root.iter(tag=ET.Element):
+        for attr, value in el.attrib.items():
+            cleaned = WHITESPACE_RE.sub(" ", value).strip()
+            if cleaned != value:
+                el.set(attr, cleaned)
+                changed += 1
+    return changed
+
+
+def remove_empty_attrs(root):
+    changed = 0
+    for el in root.iter(tag=ET.Element):
+        for attr, value in list(el.attrib.items()):
+            if value == "" and attr not in [
+                "requiredFeatures",
+                "requiredExtensions",
+                "systemLanguage",
+            ]:
+                del el.attrib[attr]
+                changed += 1
+    return changed
+
+
+def is_zero(value):
+    try:
+        return float(re.sub(r"[a-z%]*$", "", value.strip())) == 0
+    except ValueError:
+        return False
+
+
+def remove_hidden_elems(root):
+    removed = 0
+    for el in list(root.iter()):
+        if el is root or not is_svg_element(el) or el.getparent() is None:
+            continue
+        hidden = el.get("display") == "none" or (
+            el.get("opacity") is not None and is_zero(el.get("opacity"))
+        )
+        if not hidden and is_svg_element(el, "rect", "image", "pattern"):
+            hidden = any(
+                el.get(attr) is not None and is_zero(el.get(attr))
+                for attr in ["width", "height"]
+            )
+        if not hidden and is_svg_element(el, "circle"):
+            hidden = el.get("r") is not None and is_zero(el.get("r"))
+        if not hidden and is_svg_element(el, "ellipse"):
+            hidden = any(
+                el.get(attr) is not None and is_zero(el.get(attr))
+                for attr in ["rx", "ry"]
+            )
+        if not hidden and is_svg_element(el, "path"):
+            hidden = el.get("d") is not None and el.get("d").strip() == ""
+        if not hidden and is_svg_element(el, "polyline", "polygon"):
+            hidden = el.get("points") is not None and el.get("points").strip() == ""
+        # hidden markers and the like can still be referenced, so only
+        # elements without an id are removed.
+        if hidden and el.get("id") is None:
+            remove_element(el)
+            removed += 1
+    return removed
+
+
+def remove_empty_text(root):
+    removed = 0
+    for el in list(root.iter()):
+        if is_svg_element(el, "text", "tspan") and len(el) == 0 and not el.text:
+            remove_element(el)
+            removed += 1
+        elif is_svg_element(el, "tref") and el.get(f"{{{XLINK_NAMESPACE}}}href") is None:
+            remove_element(el)
+            removed += 1
+    return removed
+
+
+def convert_color(value):
+    """Get the shortest equivalent of a color value, e.g., #f00 -> red."""
+    color = value.strip()
+    lowercase = color.lower()
+    if lowercase in COLOR_NAMES:
+        color = COLOR_NAMES[lowercase]
+    rgb_match = RGB_RE.match(color)
+    if rgb_match:
+        channels = list()
+        for channel in rgb_match.groups():
+            if channel.endswith("%"):
+                channel = float(channel[:-1]) * 2.55
+            channels.append(max(0, min(255, round(float(channel)))))
+        color = "#{:02x}{:02x}{:02x}".format(*channels)
+    if color.startswith("#"):
+        color = color.lower()
+        long_hex_match = LONG_HEX_RE.match(color)
+        if long_hex_match:
+            color = "#" + "".join(long_hex_match.groups())
+        color = SHORT_COLOR_NAMES.get(color, color)
+    return color
+
+
+def convert_colors(root):
+    changed = 0
+    for el in root.iter(tag=ET.Element):
+        for attr in COLOR_ATTRS:
+            value = el.get(attr)
+            if value is None:
+                continue
+            converted = convert_color(value)
+            if converted != value:
+                el.set(attr, converted)
+                changed += 1
+    return changed
+
+
+def parse_style(style):
+    declarations = list()
+    for declaration in style.split(";"):
+        if ":" not in declaration:
+            continue
+        [name, value] = declaration.split(":", 1)
+        declarations.append([name.strip(), value.strip()])
+    return declarations
+
+
+def convert_style_to_attrs(root):
+    changed = 0
+    for el in root.iter(tag=ET.Element):
+        style = el.get("style")
+        if style is None:
+            continue
+        remaining = list()
+        for [name, value] in parse_style(style):
+            if name in PRESENTATION_ATTRS and "!important" not in value:
+                # a style declaration wins over an attribute, so overwrite
+                el.set(name, value)
+            else:
+                remaining.append(f"{name}:{value}")
+        if len(remaining) == 0:
+            del el.attrib["style"]
+            changed += 1
+        elif ";".join(remaining) != style:
+            el.set("style", ";".join(remaining))
+            changed += 1
+    return changed
+
+
+def collapse_groups(root):
+    """Unwrap groups that don't do anything.
+
+    A g without attributes is replaced by its children. A g with only
+    inheritable presentation attributes and exactly one child element passes
+    them to the child, unless the child sets them itself.
+    """
+    changed = 0
+    for g in list(root.iter("{%s}g" % SVG_NAMESPACE, "g")):
+        parent = g.getparent()
+        if parent is None or (g.text and g.text.strip()):
+            continue
+        if len(g.attrib) > 0:
+            if len(g) != 1 or not isinstance(g[0].tag, str):
+                continue
+            child = g[0]
+            if not all(attr in INHERITABLE_ATTRS for attr in g.attrib):
+                continue
+            if any(attr in child.attrib for attr in g.attrib):
+                continue
+            for attr, value in g.attrib.items():
+                child.set(attr, value)
+            g.attrib.clear()
+        index = parent.index(g)
+        tail = g.tail
+        for offset, child in enumerate(list(g)):
+            parent.insert(index + offset, child)
+        if tail and tail.strip():
+            remove_element(g)
+        else:
+            parent.remove(g)
+        changed += 1
+    return changed
+
+
+def remove_empty_containers(root):
+    removed = 0
+    for el in reversed(list(root.iter())):
+        if (
+            el is not root
+            and is_svg_element(el, *CONTAINER_ELEMENTS)
+            and len(el) == 0
+            and not (el.text and el.text.strip())
+            and not is_svg_element(el, "svg")
+            and not (
+                is_svg_element(el, "pattern")
+                and el.get(f"{{{XLINK_NAMESPACE}}}href") is not None
+            )
+            and not (is_svg_element(el, "g") and el.get("filter") is not None)
+            and not (is_svg_element(el, "mask") and el.get("id") is not None)
+        ):
+            remove_element(el)
+            removed += 1
+    return removed
+
+
+def has_id(el):
+    return any(descendant.get("id") is not None for descendant in el.iter(ET.Element))
+
+
+def remove_useless_defs(root):
+    removed = 0
+    for defs in root.iter("{%s}defs" % SVG_NAMESPACE, "defs"):
+        for child in list(defs):
+            if not isinstance(child.tag, str) or is_svg_element(
+                child, "style", "script"
+            ):
+                continue
+            if not has_id(child):
+                remove_element(child)
+                removed += 1
+    return removed
+
+
+def remove_raster_images(root):
+    removed = 0
+    for el in list(root.iter("{%s}image" % SVG_NAMESPACE, "image")):
+        href = el.get(f"{{{XLINK_NAMESPACE}}}href") or el.get("href") or ""
+        if RASTER_HREF_RE.search(href):
+            remove_element(el)
+            removed += 1
+    return removed
+
+
+def get_attr_sort_key(attr):
+    qname = ET.QName(attr)
+    name = qname.localname
+    # attributes like marker-start sort with marker
+    base_name = name.split("-")[0]
+    if name in ATTR_ORDER:
+        return (ATTR_ORDER.index(name), name)
+    if base_name in ATTR_ORDER:
+        return (ATTR_ORDER.index(base_name), name)
+    return (len(ATTR_ORDER), f"{qname.namespace or ''}{name}")
+
+
+def sort_attrs(root):
+    changed = 0
+    for el in root.iter(tag=ET.Element):
+        items = el.items()
+        sorted_items = sorted(items, key=lambda item: get_attr_sort_key(item[0]))
+        if sorted_items != items:
+            el.attrib.clear()
+            for attr, value in sorted_items:
+                el.set(attr, value)
+            changed += 1
+    return changed
+
+
+def sort_defs_children(root):
+    changed = 0
+    for defs in root.iter("{%s}defs" % SVG_NAMESPACE, "defs"):
+        children = [child for child in defs if isinstance(child.tag, str)]
+        if len(children) != len(defs):
+            # leave defs with comments etc. alone
+            continue
+        frequencies = dict()
+        for child in children:
+            frequencies[child.tag] = frequencies.get(child.tag, 0) + 1
+        sorted_children = sorted(
+            children,
+            key=lambda child: (
+                -frequencies[child.tag],
+                -len(localname(child)),
+                localname(child),
+            ),
+        )
+        if sorted_children != children:
+            for child in sorted_children:
+                defs.append(child)
+            changed += 1
+    return changed
+
+
+def remove_unused_ns(root):
+    before = len(root.nsmap)
+    ET.cleanup_namespaces(root)
+    return before - len(root.nsmap)
+
+
+# svgo plugin name -> function(root) that returns how many changes it made
+PLUGINS = {
+    "removeComments": remove_comments,
+    "removeMetadata": remove_metadata,
+    "removeTitle": remove_title,
+    "removeDesc": remove_desc,
+    "removeScriptElement": remove_script_element,
+    "removeStyleElement": remove_style_element,
+    "removeEditorsNSData": remove_editors_ns_data,
+    "cleanupAttrs": cleanup_attrs,
+    "removeEmptyAttrs": remove_empty_attrs,
+    "removeHiddenElems": remove_hidden_elems,
+    "removeEmptyText": remove_empty_text,
+    "convertStyleToAttrs": convert_style_to_attrs,
+    "convertColors": convert_colors,
+    "removeRasterImages": remove_raster_images,
+    "removeUselessDefs": remove_useless_defs,
+    "collapseGroups": collapse_groups,
+    "removeEmptyContainers": remove_empty_containers,
+    "removeUnusedNS": remove_unused_ns,
+    "sortDefsChildren": sort_defs_children,
+    "sortAttrs": sort_attrs,
+}
+
+
+def get_enabled_plugins(config_f):
+    """Get the plugin names enabled in an svgo config file.
+
+    Accepts the svgo 1.x formats {"removeComments": true, ...} and
+    {"plugins": [{"removeComments": true}, "sortAttrs", ...]}.
+    """
+    with open(config_f, "r") as f_in:
+        config = json.load(f_in)
+    if "plugins" not in config:
+        return [name for name, enabled in config.items() if enabled is not False]
+    enabled = list()
+    for plugin in config["plugins"]:
+        if isinstance(plugin, str):
+            enabled.append(plugin)
+        else:
+            enabled += [name for name, value in plugin.items() if value is not False]
+    return enabled
+
+
+def get_skipped_plugins(config_f):
+    """Get the names of the plugins enabled in an svgo config that have no
+    Python version here, so optimize_svg skips them.
+    """
+    return sorted(set(get_enabled_plugins(config_f)) - set(PLUGINS))
+
+
+def optimize_svg(root, config_f, multipass=True):
+    """Optimize an SVG tree in place, like svgo.
+
+    Runs the plugins enabled in the svgo config that have a Python version
+    here, in PLUGINS order. The others, like convertPathData and
+    mergePaths, are skipped; use svgo for those.
+
+    Keyword arguments:
+    root -- root element of the SVG tree
+    config_f -- path of an svgo config, e.g., ./svgo-config.json
+    multipass -- keep running until nothing changes, like svgo --multipass
+
+    Returns the names of the enabled plugins that were skipped.
+    """
+    enabled = set(get_enabled_plugins(config_f))
+    plugins = [plugin for name, plugin in PLUGINS.items() if name in enabled]
+    # like svgo --multipass, which stops after at most 10 passes
+    for i in range(10 if multipass else 1):
+        changed = sum(plugin(root) for plugin in plugins)
+        if changed == 0:
+            break
+    return get_skipped_plugins(config_f)
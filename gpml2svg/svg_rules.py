@@ -0,0 +1,286 @@
+import re
+
+from lxml import etree as ET
+
+
+SVG = "{http://www.w3.org/2000/svg}"
+XLINK = "{http://www.w3.org/1999/xlink}"
+
+FONT_SIZE_RE = re.compile(r"^([0-9.]*)px$")
+# TRANSLATE_RE = re.compile(r"^translate[(]([0-9.]*),([0-9.]*)[)]$")
+TRANSLATE_RE = re.compile(r"^translate\(([0-9.]*),([0-9.]*)\)$")
+WIKIDATA_CLASS_RE = re.compile("Wikidata_Q[0-9]+")
+
+
+class Rule:
+    def __init__(self, fix, tag=None, attr=None, value=None, class_contains=None):
+        self.fix = fix
+        self.tag = tag
+        self.attr = attr
+        self.value = value
+        self.class_contains = class_contains
+
+    def matches(self, el):
+        if self.attr is not None:
+            attr_value = el.get(self.attr)
+            if attr_value is None or (
+                self.value is not None and attr_value != self.value
+            ):
+                return False
+        if self.class_contains is not None:
+            if self.class_contains not in el.get("class", ""):
+                return False
+        return True
+
+
+class RuleSet:
+    """Fixes for an SVG tree, applied in a single walk over the tree.
+
+    Each rule is registered with the element tag it is for (or None for any
+    tag), plus optional conditions on an attribute or the class. apply()
+    visits every element below the root once and runs only the rules
+    registered for that element's tag, so adding a rule doesn't add another
+    walk over the tree.
+    """
+
+    def __init__(self):
+        self.rules_by_tag = dict()
+        self.any_tag_rules = list()
+        self.rules_for_tag_cache = dict()
+
+    def rule(self, tag=None, attr=None, value=None, class_contains=None):
+        """Register a function fix(el, context) as a rule.
+
+        Keyword arguments:
+        tag -- e.g., "{http://www.w3.org/2000/svg}text" (default any tag)
+        attr -- only for elements with this attribute
+        value -- only when attr has this value
+        class_contains -- only for elements whose class contains this string
+        """
+
+        def register(fix):
+            rule = Rule(
+                fix, tag=tag, attr=attr, value=value, class_contains=class_contains
+            )
+            if tag is None:
+                self.any_tag_rules.append(rule)
+            else:
+                self.rules_by_tag.setdefault(tag, []).append(rule)
+            self.rules_for_tag_cache.clear()
+            return fix
+
+        return register
+
+    def rules_for_tag(self, tag):
+        if tag not in self.rules_for_tag_cache:
+            self.rules_for_tag_cache[tag] = (
+                self.rules_by_tag.get(tag, []) + self.any_tag_rules
+            )
+        return self.rules_for_tag_cache[tag]
+
+    def apply(self, root):
+        """Run the rules on every element below root.
+
+        Returns the context dict shared by the rules. Elements a rule puts in
+        context["remove"] are removed after the walk.
+        """
+        context = {"remove": list()}
+        rules_for_tag_cache = self.rules_for_tag_cache
+        for el in root.iterdescendants(tag=ET.Element):
+            rules = rules_for_tag_cache.get(el.tag)
+            if rules is None:
+                rules = self.rules_for_tag(el.tag)
+            for rule in rules:
+                if rule.matches(el):
+                    rule.fix(el, context)
+        for el in context["remove"]:
+            parent = el.getparent()
+            if parent is not None:
+                parent.remove(el)
+        return context
+
+
+def parent_is(el, tag, class_contains=None):
+    parent = el.getparent()
+    return (
+        parent is not None
+        and parent.tag == tag
+        and (class_contains is None or class_contains in parent.get("class", ""))
+    )
+
+
+def is_edge_child(el):
+    """Check whether el matches svg:g/svg:g[contains(@class,'Edge')]/el."""
+    return parent_is(el, f"{SVG}g", "Edge") and parent_is(el.getparent(), f"{SVG}g")
+
+
+JSON2SVG_RULES = RuleSet()
+
+
+# TODO: verify that all of the following cases are now correctly handled in pvjs
+@JSON2SVG_RULES.rule(tag="style")
+def check_style(el, context):
+    if not el.text == "":
+        raise Exception("Expected empty style sheets.")
+
+
+@JSON2SVG_RULES.rule(tag="pattern", attr="id", value="PatternQ47512")
+def check_pattern(el, context):
+    raise Exception("Unexpected pattern.")
+
+
+@JSON2SVG_RULES.rule(tag=f"{SVG}g")
+def check_nested_edge_g(el, context):
+    if is_edge_child(el) and not context.get("edge_warning_sent"):
+        print("TODO: update pvjs to avoid having nested g elements for edges.")
+        context["edge_warning_sent"] = True
+    # raise Exception("Unexpected nested g element for edge.")
+
+
+@JSON2SVG_RULES.rule(tag=f"{SVG}path", attr="style")
+def check_edge_path_style(el, context):
+    if is_edge_child(el):
+        raise Exception("Unexpected style attribute on path element for edge.")
+
+
+@JSON2SVG_RULES.rule(tag=f"{SVG}defs")
+def check_nested_svg_defs(el, context):
+    # /svg:svg/svg:defs/svg:g[@id='jic-defs']/svg:svg/svg:defs
+    ancestors = list(el.iterancestors())
+    if [ancestor.tag for ancestor in ancestors] == [
+        f"{SVG}svg",
+        f"{SVG}g",
+        f"{SVG}defs",
+        f"{SVG}svg",
+    ] and ancestors[1].get("id") == "jic-defs":
+        raise Exception("Unexpected nested svg for defs.")
+
+
+@JSON2SVG_RULES.rule(tag="defs")
+def check_nested_svg_defs_no_ns(el, context):
+    # .//defs/g[@id='jic-defs']/svg/defs
+    ancestors = list(el.iterancestors())[:3]
+    if [ancestor.tag for ancestor in ancestors] == [
+        "svg",
+        "g",
+        "defs",
+    ] and ancestors[1].get("id") == "jic-defs":
+        raise Exception("Unexpected nested svg for defs.")
+
+
+@JSON2SVG_RULES.rule(attr="filter", value="url(#kaavioblackto000000filter)")
+def remove_black_filter(el, context):
+    el.attrib.pop("filter", None)
+
+
+@JSON2SVG_RULES.rule(tag="image")
+def remove_image(el, context):
+    parent = el.getparent()
+    if parent is not None and parent.getparent() is not None:
+        context["remove"].append(el)
+
+
+# TODO: do the attributes "filter" "fill" "fill-opacity" "stroke" "stroke-dasharray" "stroke-width"
+# on the top-level g element apply to the g elements for edges?
+
+# TODO: do the attributes "color" "fill" "fill-opacity" "stroke" "stroke-dasharray" "stroke-width"
+# on the top-level g element apply to the path elements for edges?
+
+# TODO: Which of the following is correct?
+# To make the SVG file independent of Arial, change all occurrences of
+#   font-family: Arial to font-family: 'Liberation Sans', Arial, sans-serif
+#   https://commons.wikimedia.org/wiki/Help:SVG#fallback
+# vs.
+# Phab:T64987, Phab:T184369, Gnome #95; font-family="'font name'"
+#   (internally quoted font family name) does not work
+#   (File:Mathematical_implication_diagram-alt.svg, File:T184369.svg)
+#   https://commons.wikimedia.org/wiki/Commons:Commons_SVG_Checker?withJS=MediaWiki:CommonsSvgChecker.js
+
+# Liberation Sans is the open replacement for Arial, but its kerning
+# has some issues, at least as processed by librsvg.
+# An alternative that is also supported MW is DejaVu Sans. Using
+#   transform="scale(0.92,0.98)"
+# might yield better kerning and take up about the same amount of space.
+
+# Long-term, should we switch our default font from Arial to something prettier?
+# It would have to be a well-supported font.
+# This page <https://commons.wikimedia.org/wiki/Help:SVG#fallback> says:
+#     On Commons, librsvg has the fonts listed in:
+#     https://meta.wikimedia.org/wiki/SVG_fonts#Latin_(basic)_fonts_comparison
+#     ...
+#     In graphic illustrations metric exact text elements are often important
+#     and Arial can be seen as de-facto standard for such a feature.
+
+
+@JSON2SVG_RULES.rule(attr="font-family")
+def set_font_family(el, context):
+    if "Arial" in el.get("font-family"):
+        el.set("font-family", "'Liberation Sans', Arial, sans-serif")
+
+
+# TODO: do we need to specify fill=currentColor for any elements?
+
+
+@JSON2SVG_RULES.rule(tag=f"{SVG}marker")
+def fill_marker(el, context):
+    if any(ancestor.tag == f"{SVG}defs" for ancestor in el.iterancestors()):
+        for marker_el in el.iterdescendants(tag=ET.Element):
+            if marker_el.get("fill") is None:
+                marker_el.set("fill", "currentColor")
+
+
+@JSON2SVG_RULES.rule(tag=f"{SVG}text")
+def fix_text(el, context):
+    if el.get("stroke-width") == "0.05px":
+        el.attrib.pop("stroke-width", None)
+    el.attrib.pop("overflow", None)
+    el.attrib.pop("dominant-baseline", None)
+    el.attrib.pop("clip-path", None)
+
+    # We are pushing the text down based on font size.
+    # This is needed because librsvg doesn't support attribute "alignment-baseline".
+    font_size_full = el.attrib.get("font-size")
+    if font_size_full is None:
+        return
+
+    font_size = None
+    font_size_matches = FONT_SIZE_RE.search(font_size_full)
+    if font_size_matches:
+        font_size = float(font_size_matches.group(1))
+
+    if not font_size:
+        font_size = 5
+
+    x_translation = None
+    y_translation = None
+    transform_full = el.attrib.get("transform")
+    if transform_full:
+        translate_matches = TRANSLATE_RE.search(transform_full)
+        if translate_matches:
+            x_translation = float(translate_matches.group(1))
+            y_translation_uncorrected = float(translate_matches.group(2))
+
+    if not x_translation:
+        x_translation = 0
+        y_translation_uncorrected = 0
+
+    y_translation_corrected = font_size / 3 + y_translation_uncorrected
+    el.set("transform", f"translate({x_translation},{y_translation_corrected})")
+
+
+# Add link outs
+@JSON2SVG_RULES.rule(class_contains="DataNode")
+def add_link_out(el, context):
+    wikidata_classes = list(
+        filter(WIKIDATA_CLASS_RE.match, el.attrib.get("class").split(" "))
+    )
+    if len(wikidata_classes) > 0:
+        # if there are multiple, we just link out to the first
+        wikidata_id = wikidata_classes[0].replace("Wikidata_", "")
+        el.tag = f"{SVG}a"
+        # linkout_base = "https://www.wikidata.org/wiki/"
+        linkout_base = "https://scholia.toolforge.org/"
+        el.set(f"{XLINK}href", linkout_base + wikidata_id)
+
+        # make linkout open in new tab/window
+        el.set("target", "_blank")
@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+
+import argparse
+import base64
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+from os import path
+import sqlite3
+import sys
+import time
+
+import requests
+
+from batch import DEFAULT_THEMES, convert_batch, get_svg_path_out, parse_gpml_f
+from wikidata import USER_AGENT
+
+
+WP_WEBSERVICE_URL = "https://webservice.wikipathways.org"
+DEFAULT_SPECIES = "Homo sapiens"
+DEFAULT_CURATION_TAG = "Curation:AnalysisCollection"
+DOWNLOAD_CONCURRENCY = 4
+
+
+class SyncIndex:
+    """Which revision of each pathway was last converted.
+
+    Kept in an SQLite file next to the converted pathways, so that the next
+    sync only converts the pathways that got a new revision since.
+    """
+
+    def __init__(self, index_f):
+        """Keyword arguments:
+        index_f -- path of the SQLite file, e.g., ./sync_index.sqlite
+        """
+        index_dir = path.dirname(index_f)
+        if index_dir:
+            os.makedirs(index_dir, exist_ok=True)
+        self.conn = sqlite3.connect(index_f, timeout=60)
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS converted (
+                wp_id TEXT PRIMARY KEY,
+                revision TEXT NOT NULL,
+                converted_at REAL NOT NULL
+            )"""
+        )
+        self.conn.commit()
+
+    def get_revisions(self):
+        """Get a dict from WikiPathways ID to the last converted revision."""
+        return dict(self.conn.execute("SELECT wp_id, revision FROM converted"))
+
+    def set_converted(self, wp_id, revision):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO converted VALUES (?, ?, ?)",
+                (wp_id, str(revision), time.time()),
+            )
+
+
+def get_dir_revisions(dir_in):
+    """Get the newest revision of each pathway in a directory of GPML files.
+
+    The IDs and revisions come from the filenames, e.g.,
+    Hs_Some_pathway_WP4542_103412.gpml
+
+    Returns a dict from WikiPathways ID to a (revision, gpml_f) pair.
+    """
+    revisions = dict()
+    for base_in in os.listdir(dir_in):
+        if not base_in.endswith(".gpml"):
+            continue
+        gpml_f = f"{dir_in}/{base_in}"
+        wp_id, revision = parse_gpml_f(gpml_f)
+        if wp_id is None or not revision:
+            print(f"No WikiPathways ID and revision in filename '{gpml_f}'")
+            continue
+        if wp_id not in revisions or int(revision) > int(revisions[wp_id][0]):
+            revisions[wp_id] = (str(revision), gpml_f)
+    return revisions
+
+
+def get_tagged_revisions(
+    session,
+    base_url=WP_WEBSERVICE_URL,
+    tag=DEFAULT_CURATION_TAG,
+    species=DEFAULT_SPECIES,
+):
+    """Get the current revision of every pathway with a curation tag.
+
+    This is one request to the WikiPathways webservice, the same pathways
+    batchDownload.php would zip up.
+
+    Returns a dict from WikiPathways ID to revision.
+    """
+    response = session.get(
+        f"{base_url}/getCurationTagsByName",
+        params={"tagName": tag, "format": "json"},
+        timeout=60,
+    )
+    response.raise_for_status()
+    revisions = dict()
+    for curation_tag in response.json()["tags"]:
+        pathway = curation_tag["pathway"]
+        if species is None or pathway["species"] == species:
+            revisions[pathway["id"]] = str(pathway["revision"])
+    return revisions
+
+
+def download_gpml(session, wp_id, revision, dir_out, base_url=WP_WEBSERVICE_URL):
+    """Download one revision of a pathway as GPML.
+
+    Returns the path of the GPML file, e.g., ./WP4542_103412.gpml
+    """
+    response = session.get(
+        f"{base_url}/getPathwayAs",
+        params={
+            "fileType": "gpml",
+            "pwId": wp_id,
+            "revision": revision,
+            "format": "json",
+        },
+        timeout=60,
+    )
+    response.raise_for_status()
+    gpml_f = f"{dir_out}/{wp_id}_{revision}.gpml"
+    with open(gpml_f, "wb") as f_out:
+        f_out.write(base64.b64decode(response.json()["data"]))
+    return gpml_f
+
+
+def get_changed(revisions, index, dir_out, themes):
+    """Get the IDs of the pathways that need to be converted.
+
+    A pathway needs to be converted when its revision isn't the one last
+    converted, or when one of its SVGs is missing.
+
+    Keyword arguments:
+    revisions -- dict from WikiPathways ID to current revision
+    index -- SyncIndex
+    dir_out -- directory for the SVG files
+    themes -- list of themes, e.g., ["plain", "dark"]
+    """
+    converted_revisions = index.get_revisions()
+    changed = list()
+    for wp_id, revision in sorted(revisions.items()):
+        if converted_revisions.get(wp_id) != str(revision) or not all(
+            path.isfile(get_svg_path_out(dir_out, wp_id, theme)) for theme in themes
+        ):
+            changed.append(wp_id)
+    return changed
+
+
+def sync(
+    dir_out,
+    dir_in=None,
+    base_url=WP_WEBSERVICE_URL,
+    tag=DEFAULT_CURATION_TAG,
+    species=DEFAULT_SPECIES,
+    themes=None,
+    workers=None,
+    index_f=None,
+    summary_f=None,
+    report_f=None,
+    issues_f=None,
+    issues_tsv_f=None,
+    xref_prepass=True,
+):
+    """Convert the pathways that changed since the last sync.
+
+    Keyword arguments:
+    dir_out -- directory for the GPML and SVG files, kept between syncs
+    dir_in -- directory of GPML files named with revisions, e.g., from
+              batchDownload.php (default: ask the WikiPathways webservice)
+    base_url -- WikiPathways webservice (default webservice.wikipathways.org)
+    tag -- only pathways with this curation tag (default Curation:AnalysisCollection)
+    species -- only pathways for this species (default Homo sapiens)
+    themes -- list of themes (default plain and dark)
+    workers -- number of worker processes (default: number of CPUs)
+    index_f -- path of the sync index (default: {dir_out}/sync_index.sqlite)
+    summary_f -- path for the JSON summary (default: {dir_out}/summary.json)
+    report_f -- path for the run report (default: {dir_out}/report.jsonl)
+    issues_f -- path for the issues (default: {dir_out}/issues.jsonl)
+    issues_tsv_f -- path for the issues TSV (default: {dir_out}/issues.tsv)
+    xref_prepass -- look up the xrefs of all the changed pathways first (default True)
+    """
+    if themes is None:
+        themes = DEFAULT_THEMES
+    if index_f is None:
+        index_f = f"{dir_out}/sync_index.sqlite"
+    os.makedirs(dir_out, exist_ok=True)
+    index = SyncIndex(index_f)
+
+    session = requests.Session()
+    session.headers.update({"User-Agent": USER_AGENT})
+
+    if dir_in is not None:
+        revisions_and_fs = get_dir_revisions(dir_in)
+        revisions = {
+            wp_id: revision for wp_id, [revision, gpml_f] in revisions_and_fs.items()
+        }
+    else:
+        revisions = get_tagged_revisions(
+            session, base_url=base_url, tag=tag, species=species
+        )
+
+    changed = get_changed(revisions, index, dir_out, themes)
+    print(f"{len(changed)} of {len(revisions)} pathways changed since the last sync")
+
+    if dir_in is not None:
+        gpml_fs = [revisions_and_fs[wp_id][1] for wp_id in changed]
+    else:
+
+        def download(wp_id):
+            try:
+                return download_gpml(
+                    session, wp_id, revisions[wp_id], dir_out, base_url=base_url
+                )
+            except (requests.RequestException, KeyError, ValueError) as e:
+                # it will still count as changed in the next sync
+                print(f"Failed to download {wp_id}: {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=DOWNLOAD_CONCURRENCY) as executor:
+            gpml_fs = [gpml_f for gpml_f in executor.map(download, changed) if gpml_f]
+
+    # convert() skips SVGs that already exist, so the ones from the old
+    # revision have to go first.
+    for gpml_f in gpml_fs:
+        wp_id = parse_gpml_f(gpml_f)[0]
+        for theme in themes:
+            svg_f = get_svg_path_out(dir_out, wp_id, theme)
+            if path.isfile(svg_f):
+                os.remove(svg_f)
+
+    if summary_f is None:
+        summary_f = f"{dir_out}/summary.json"
+    summary = convert_batch(
+        gpml_fs,
+        dir_out,
+        themes=themes,
+        workers=workers,
+        summary_f=summary_f,
+        report_f=report_f,
+        issues_f=issues_f,
+        issues_tsv_f=issues_tsv_f,
+        xref_prepass=xref_prepass,
+    )
+    for result in summary["successes"]:
+        index.set_converted(result["wp_id"], revisions[result["wp_id"]])
+        remove_old_revisions(dir_out, result["wp_id"], result["gpml_f"])
+
+    downloaded_wp_ids = {parse_gpml_f(gpml_f)[0] for gpml_f in gpml_fs}
+    summary["changed"] = len(changed)
+    summary["unchanged"] = len(revisions) - len(changed)
+    summary["download_failures"] = [
+        wp_id for wp_id in changed if wp_id not in downloaded_wp_ids
+    ]
+    with open(summary_f, "w") as f_out:
+        json.dump(summary, f_out, indent=2)
+    return summary
+
+
+def remove_old_revisions(dir_out, wp_id, gpml_f):
+    """Remove the files for other revisions of a pathway, e.g., WP4542_103411.json
+
+    Keyword arguments:
+    dir_out -- directory for the GPML and SVG files
+    wp_id -- e.g., WP4542
+    gpml_f -- GPML file for the revision to keep, e.g., ./WP4542_103412.gpml
+    """
+    stub_keep = path.splitext(path.basename(gpml_f))[0]
+    for base_out in os.listdir(dir_out):
+        stub_out = base_out.split(".")[0]
+        if stub_out.startswith(f"{wp_id}_") and stub_out != stub_keep:
+            os.remove(f"{dir_out}/{base_out}")
+
+
+def main():
+    """main."""
+
+    parser = argparse.ArgumentParser(
+        description="Convert the WikiPathways pathways that changed since the last sync"
+    )
+    parser.add_argument("dir_out", help="directory for GPML, SVG and the sync index")
+    parser.add_argument(
+        "--dir-in",
+        type=str,
+        help="Directory of *_WP<id>_<revision>.gpml files to sync from, "
+        + "instead of the WikiPathways webservice",
+    )
+    parser.add_argument(
+        "--base-url",
+        type=str,
+        default=os.environ.get("WP_WEBSERVICE_URL", WP_WEBSERVICE_URL),
+        help=f"Default: {WP_WEBSERVICE_URL}. WikiPathways webservice to sync from.",
+    )
+    parser.add_argument(
+        "--tag",
+        type=str,
+        default=DEFAULT_CURATION_TAG,
+        help=f"Default: {DEFAULT_CURATION_TAG}. Only sync pathways with this tag.",
+    )
+    parser.add_argument(
+        "--species",
+        type=str,
+        default=DEFAULT_SPECIES,
+        help=f"Default: {DEFAULT_SPECIES}. Only sync pathways for this species.",
+    )
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        help="Default: number of CPUs. Number of pathways to convert at once.",
+    )
+    parser.add_argument(
+        "--theme",
+        action="append",
+        dest="themes",
+        help="Default: plain and dark. Can be specified more than once.",
+    )
+    parser.add_argument(
+        "--summary",
+        type=str,
+        help="Default: {dir_out}/summary.json",
+    )
+    parser.add_argument(
+        "--report",
+        type=str,
+        help="Default: {dir_out}/report.jsonl. Time and resources per stage per pathway.",
+    )
+    parser.add_argument(
+        "--issues",
+        type=str,
+        help="Default: {dir_out}/issues.jsonl. Issues found, e.g., xrefs with no Wikidata item.",
+    )
+    parser.add_argument(
+        "--issues-tsv",
+        type=str,
+        help="Default: {dir_out}/issues.tsv. Issues, one row per kind per pathway.",
+    )
+    parser.add_argument(
+        "--no-xref-prepass",
+        action="store_true",
+        help="Look up the xrefs of each pathway separately, not of all at once first",
+    )
+
+    parser.add_argument(
+        "--wd-index",
+        type=str,
+        help="Look up Wikidata IDs in this index, built with wd_index.py, "
+        + "instead of query.wikidata.org. Default: $WD_INDEX_F, if set.",
+    )
+
+    args = parser.parse_args()
+
+    if args.wd_index:
+        # the worker processes open it, see get_wd_index
+        os.environ["WD_INDEX_F"] = args.wd_index
+
+    summary = sync(
+        args.dir_out,
+        dir_in=args.dir_in,
+        base_url=args.base_url,
+        tag=args.tag,
+        species=args.species,
+        themes=args.themes,
+        workers=args.workers,
+        summary_f=args.summary,
+        report_f=args.report,
+        issues_f=args.issues,
+        issues_tsv_f=args.issues_tsv,
+        xref_prepass=not args.no_xref_prepass,
+    )
+    if summary["failed"] > 0 or len(summary["download_failures"]) > 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+
+import argparse
+import bz2
+import csv
+import gzip
+import hashlib
+from itertools import islice
+import json
+import os
+from os import path
+import sqlite3
+import threading
+import time
+
+from datasources import get_bridgedb2wd_props
+from wikidata import WD_ENTITY_IRI_BASE
+
+
+# Wikidata property for WikiPathways IDs, used to find the item for a pathway
+WP_ID_PROP = "P2410"
+WD_PROP_IRI_BASE = "http://www.wikidata.org/prop/direct/"
+# rows written per transaction while importing
+IMPORT_CHUNK_SIZE = 10000
+
+
+class WdIndex:
+    """Local, read-only index of Wikidata items by external ID.
+
+    Answers the same questions we otherwise ask query.wikidata.org, i.e.,
+    which items have wdt:P351 "1234", but from an SQLite file, with no
+    network. Build one with build_wd_index from a Wikidata JSON dump or a
+    TSV export.
+
+    Only the properties the index was built with can be found. The index
+    can be used from several threads at once.
+    """
+
+    def __init__(self, index_f):
+        """Keyword arguments:
+        index_f -- path of the SQLite file, e.g., ./wd_index.sqlite
+        """
+        if not path.isfile(index_f):
+            raise Exception(
+                f"No Wikidata index at {index_f}. Build one with wd_index.py."
+            )
+        self.index_f = index_f
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(
+            f"file:{index_f}?mode=ro", uri=True, check_same_thread=False
+        )
+        [self.version] = self.conn.execute(
+            "SELECT value FROM meta WHERE key = 'version'"
+        ).fetchone()
+
+    def get(self, prop, value):
+        """Get a sorted list of the Wikidata IDs with a property value, e.g.,
+        ["Q14865053"] for ("P351", "1017").
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT wd_id FROM claims WHERE prop = ? AND value = ? ORDER BY wd_id",
+                (prop, value),
+            ).fetchall()
+        return [wd_id for [wd_id] in rows]
+
+    def get_many(self, xrefs, wd_props_by_datasource):
+        """Get Wikidata IDs for xrefs, like XrefResolver.resolve.
+
+        Keyword arguments:
+        xrefs -- iterable of (datasource, identifier) pairs
+        wd_props_by_datasource -- e.g., {"Entrez Gene": "P351"}
+
+        Returns a dict from (datasource, identifier) to a sorted list of
+        Wikidata IDs. The list is empty when the index has no item.
+        """
+        return {
+            (datasource, identifier): self.get(
+                wd_props_by_datasource[datasource], identifier
+            )
+            for [datasource, identifier] in set(xrefs)
+        }
+
+    def get_pathway_id(self, wp_id):
+        """Get the Wikidata ID of a pathway, e.g., WP4542, or None if it has none."""
+        wd_ids = self.get(WP_ID_PROP, wp_id)
+        return wd_ids[0] if wd_ids else None
+
+
+def get_default_props():
+    """Get the properties to index: those of the BridgeDb datasources and P2410."""
+    return sorted(set(get_bridgedb2wd_props().values()) | {WP_ID_PROP})
+
+
+def strip_tsv_value(value):
+    """Get the bare value of a TSV cell, which can be in the format of the
+    Wikidata Query Service TSV export, e.g., <http://www.wikidata.org/entity/Q42>
+    or "1234".
+    """
+    value = value.strip()
+    if value.startswith("<") and value.endswith(">"):
+        value = value[1:-1]
+    elif value.startswith('"'):
+        # drop the quotes and any language tag or datatype after them
+        value = value[1 : value.rindex('"')]
+    for prefix in [WD_ENTITY_IRI_BASE, WD_PROP_IRI_BASE, "wd:", "wdt:"]:
+        if value.startswith(prefix):
+            return value[len(prefix) :]
+    return value
+
+
+def iter_tsv_claims(tsv_f, props):
+    """Get (property, value, Wikidata ID) triples from a TSV file.
+
+    Each row is an item, a property and a value, e.g., Q14865053 P351 1017.
+    Items and properties can also be IRIs or prefixed, as in an export of
+    SELECT ?item ?prop ?value from the Wikidata Query Service. Rows for
+    other properties are skipped, and so is a header row.
+    """
+    opener = get_opener(tsv_f)
+    with opener(tsv_f, "rt", newline="") as f_in:
+        for row in csv.reader(f_in, delimiter="\t", quoting=csv.QUOTE_NONE):
+            if len(row) < 3:
+                continue
+            [wd_id, prop, value] = [strip_tsv_value(cell) for cell in row[:3]]
+            if prop in props and wd_id.startswith("Q") and value:
+                yield (prop, value, wd_id)
+
+
+def get_truthy_values(statements):
+    """Get the values wdt: would have for a property, i.e., those of the
+    preferred statements, or else of the normal ones.
+    """
+    statements = [
+        statement
+        for statement in statements
+        if statement["mainsnak"].get("snaktype") == "value"
+        and statement.get("rank") != "deprecated"
+    ]
+    preferred = [
+        statement for statement in statements if statement.get("rank") == "preferred"
+    ]
+    values = list()
+    for statement in preferred or statements:
+        value = statement["mainsnak"]["datavalue"]["value"]
+        if isinstance(value, str):
+            values.append(value)
+    return values
+
+
+def iter_json_dump_claims(dump_f, props):
+    """Get (property, value, Wikidata ID) triples from a Wikidata JSON dump.
+
+    The dump, e.g., latest-all.json.gz from dumps.wikimedia.org, or a slice
+    of it, has one entity per line. Lines that can't have any of the
+    properties are skipped without being parsed, which is most of them.
+    """
+    prop_keys = [f'"{prop}"' for prop in props]
+    opener = get_opener(dump_f)
+    with opener(dump_f, "rt") as f_in:
+        for line in f_in:
+            if not any(prop_key in line for prop_key in prop_keys):
+                continue
+            line = line.strip().rstrip(",")
+            if not line.startswith("{"):
+                continue
+            entity = json.loads(line)
+            claims = entity.get("claims", dict())
+            for prop in props:
+                for value in get_truthy_values(claims.get(prop, [])):
+                    yield (prop, value, entity["id"])
+
+
+def get_opener(f):
+    """Get the function to open a file with, based on its compression."""
+    if f.endswith(".gz"):
+        return gzip.open
+    elif f.endswith(".bz2"):
+        return bz2.open
+    else:
+        return open
+
+
+def build_wd_index(index_f, tsv_fs=None, json_dump_fs=None, props=None):
+    """Build a local Wikidata index from TSV files and/or Wikidata JSON dumps.
+
+    The index is written next to index_f and then moved into place, so
+    conversions still using the old index aren't disturbed.
+
+    Keyword arguments:
+    index_f -- path of the SQLite file, e.g., ./wd_index.sqlite
+    tsv_fs -- TSV files of item, property and value, see iter_tsv_claims
+    json_dump_fs -- Wikidata JSON dumps or slices of them, see iter_json_dump_claims
+    props -- properties to index (default: those of the BridgeDb datasources and P2410)
+
+    Returns the number of claims in the index.
+    """
+    if props is None:
+        props = get_default_props()
+    props = sorted(set(props))
+    sources = [(tsv_f, iter_tsv_claims) for tsv_f in tsv_fs or []] + [
+        (dump_f, iter_json_dump_claims) for dump_f in json_dump_fs or []
+    ]
+    if not sources:
+        raise Exception("Specify at least one TSV file or JSON dump to index")
+
+    index_dir = path.dirname(index_f)
+    if index_dir:
+        os.makedirs(index_dir, exist_ok=True)
+    tmp_index_f = f"{index_f}.tmp"
+    if path.isfile(tmp_index_f):
+        os.remove(tmp_index_f)
+    conn = sqlite3.connect(tmp_index_f)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute(
+        """CREATE TABLE claims (
+            prop TEXT NOT NULL,
+            value TEXT NOT NULL,
+            wd_id TEXT NOT NULL,
+            PRIMARY KEY (prop, value, wd_id)
+        ) WITHOUT ROWID"""
+    )
+    conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    for [source_f, iter_claims] in sources:
+        print(f"Indexing {source_f}")
+        claims = iter_claims(source_f, props)
+        while True:
+            chunk = list(islice(claims, IMPORT_CHUNK_SIZE))
+            if not chunk:
+                break
+            with conn:
+                conn.executemany("INSERT OR IGNORE INTO claims VALUES (?, ?, ?)", chunk)
+
+    [claim_count] = conn.execute("SELECT COUNT(*) FROM claims").fetchone()
+    built_at = time.time()
+    version_str = json.dumps(
+        [built_at, props, [path.abspath(source_f) for [source_f, _] in sources]]
+    )
+    with conn:
+        conn.executemany(
+            "INSERT INTO meta VALUES (?, ?)",
+            [
+                ("version", hashlib.sha256(version_str.encode()).hexdigest()[:16]),
+                ("props", " ".join(props)),
+                ("built_at", str(built_at)),
+                ("claims", str(claim_count)),
+            ],
+        )
+    conn.execute("VACUUM")
+    conn.close()
+    os.replace(tmp_index_f, index_f)
+    print(f"Indexed {claim_count} claims for {len(props)} properties in {index_f}")
+    return claim_count
+
+
+_wd_index = None
+
+
+def get_wd_index():
+    """Get the local Wikidata index named by the WD_INDEX_F environment
+    variable, opening it if needed, or None if WD_INDEX_F isn't set.
+    """
+    global _wd_index
+    if _wd_index is None and os.environ.get("WD_INDEX_F"):
+        _wd_index = WdIndex(os.environ["WD_INDEX_F"])
+    return _wd_index
+
+
+def main():
+    """main."""
+
+    parser = argparse.ArgumentParser(
+        description="Build a local Wikidata index, to convert pathways with no network"
+    )
+    parser.add_argument("index_f", help="path of the index, e.g., wd_index.sqlite")
+    parser.add_argument(
+        "--tsv",
+        action="append",
+        dest="tsv_fs",
+        help="TSV file of item, property and value, e.g., from the Wikidata Query "
+        + "Service. Can be gzipped and specified more than once.",
+    )
+    parser.add_argument(
+        "--json-dump",
+        action="append",
+        dest="json_dump_fs",
+        help="Wikidata JSON dump or a slice of it, e.g., latest-all.json.gz. "
+        + "Can be specified more than once.",
+    )
+    parser.add_argument(
+        "--prop",
+        action="append",
+        dest="props",
+        help="Default: the properties of the BridgeDb datasources and P2410. "
+        + "Property to index. Can be specified more than once.",
+    )
+
+    args = parser.parse_args()
+
+    build_wd_index(
+        args.index_f,
+        tsv_fs=args.tsv_fs,
+        json_dump_fs=args.json_dump_fs,
+        props=args.props,
+    )
+
+
+if __name__ == "__main__":
+    main()
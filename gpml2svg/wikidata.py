@@ -0,0 +1,304 @@
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+WD_SPARQL_ENDPOINT = "https://query.wikidata.org/sparql"
+WD_ENTITY_IRI_BASE = "http://www.wikidata.org/entity/"
+# see https://meta.wikimedia.org/wiki/User-Agent_policy
+USER_AGENT = (
+    "wikipathways2wiki/0.0.0 (https://github.com/wikipathways/tool-wikipathways2wiki)"
+)
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+
+
+class WikidataSparql:
+    """Client for the Wikidata Query Service.
+
+    Keeps one HTTP session, so the connections are reused for every query
+    instead of being set up again for each pathway. query() returns the same
+    parsed JSON as pywikibot's SparqlQuery.query().
+
+    query() can be called from several threads at once. To be polite to the
+    endpoint, queries are started at least min_interval seconds apart, and
+    when the endpoint sends a Retry-After, every thread waits it out.
+    """
+
+    def __init__(
+        self,
+        endpoint=WD_SPARQL_ENDPOINT,
+        max_retries=3,
+        retry_wait=5,
+        pool_maxsize=10,
+        min_interval=0.2,
+    ):
+        """Keyword arguments:
+        endpoint -- SPARQL endpoint (default query.wikidata.org)
+        max_retries -- how many times to retry a failed query (default 3)
+        retry_wait -- seconds to wait before the first retry (default 5)
+        pool_maxsize -- max connections to keep open (default 10)
+        min_interval -- min seconds between starting two queries (default 0.2)
+        """
+        self.endpoint = endpoint
+        self.max_retries = max_retries
+        self.retry_wait = retry_wait
+        self.min_interval = min_interval
+        self.query_count = 0
+        self.query_seconds = 0.0
+        self.lock = threading.Lock()
+        self.next_query_at = 0.0
+        self.session = requests.Session()
+        self.session.headers.update(
+            {"Accept": "application/sparql-results+json", "User-Agent": USER_AGENT}
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def query(self, query, post=False):
+        """Run a SPARQL query and return the parsed JSON result.
+
+        Keyword arguments:
+        query -- SPARQL query
+        post -- send as POST, for queries too long for a GET URL (default False)
+        """
+        retry_wait = self.retry_wait
+        for attempt in range(self.max_retries + 1):
+            self.wait_turn()
+            start = time.time()
+            if post:
+                response = self.session.post(self.endpoint, data={"query": query})
+            else:
+                response = self.session.get(self.endpoint, params={"query": query})
+            with self.lock:
+                self.query_count += 1
+                self.query_seconds += time.time() - start
+            if (
+                response.status_code not in RETRY_STATUS_CODES
+                or attempt == self.max_retries
+            ):
+                break
+
+            retry_after = get_retry_after(response)
+            wait = retry_wait if retry_after is None else retry_after
+            print(
+                f"Wikidata query failed with status {response.status_code}. "
+                + f"Retrying in {wait}s."
+            )
+            if retry_after is not None:
+                # the endpoint asked us to back off, so hold back all threads
+                with self.lock:
+                    self.next_query_at = max(self.next_query_at, time.time() + wait)
+            else:
+                time.sleep(wait)
+            retry_wait *= 2
+
+        response.raise_for_status()
+        return response.json()
+
+    def wait_turn(self):
+        """Wait until this thread may start a query."""
+        with self.lock:
+            now = time.time()
+            query_at = max(now, self.next_query_at)
+            self.next_query_at = query_at + self.min_interval
+        if query_at > now:
+            time.sleep(query_at - now)
+
+
+def get_retry_after(response):
+    """Get seconds to wait from a Retry-After header, or None if there isn't one."""
+    retry_after = response.headers.get("Retry-After")
+    if not retry_after:
+        return None
+    try:
+        return max(0, int(retry_after))
+    except ValueError:
+        pass
+    try:
+        return max(0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def sparql_string(value):
+    """Quote a Python string as a SPARQL string literal."""
+    escaped = value.replace("\\", "\\\\").replace('"', '\\"')
+    escaped = escaped.replace("\n", "\\n").replace("\r", "\\r")
+    return f'"{escaped}"'
+
+
+class XrefResolver:
+    """Look up Wikidata items for xrefs, many xrefs per query.
+
+    Each batch is one query with a VALUES clause, sent as POST. The batch size
+    is adapted as we go: it is capped so the query stays under
+    max_query_length, it grows while queries come back well under
+    target_seconds and it shrinks when they are slower than that. The
+    resolver keeps its batch size between pathways.
+
+    Up to concurrency batches are in flight at once, so a pathway takes about
+    as long as its slowest query instead of the sum of all of them.
+    """
+
+    def __init__(
+        self,
+        wd_sparql,
+        batch_size=50,
+        min_batch_size=10,
+        max_batch_size=400,
+        max_query_length=50000,
+        target_seconds=5,
+        concurrency=4,
+    ):
+        """Keyword arguments:
+        wd_sparql -- WikidataSparql client
+        batch_size -- xrefs in the first batch (default 50)
+        min_batch_size -- never send fewer xrefs per batch, unless no more are left (default 10)
+        max_batch_size -- never send more xrefs per batch (default 400)
+        max_query_length -- max characters in a query (default 50000)
+        target_seconds -- query time to aim for (default 5)
+        concurrency -- max queries in flight at once (default 4)
+        """
+        self.wd_sparql = wd_sparql
+        self.batch_size = batch_size
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.max_query_length = max_query_length
+        self.target_seconds = target_seconds
+        self.query_count = 0
+        self.lock = threading.Lock()
+        # shared with callers that want to run other queries alongside, e.g.,
+        # the pathway ID lookup in gpml2json.
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    def get_query(self, values):
+        """Get the query for a batch of VALUES rows."""
+        values_str = "\n".join(values)
+        return f"""SELECT ?datasource ?identifier ?item WHERE {{
+VALUES (?datasource ?identifier ?prop) {{
+{values_str}
+}}
+?item ?prop ?identifier .
+}}"""
+
+    def get_batches(self, values):
+        """Chunk VALUES rows into batches of at most batch_size rows.
+
+        A batch is cut early when adding the next row would make the query
+        longer than max_query_length.
+        """
+        batch = []
+        batch_length = len(self.get_query([]))
+        for value in values:
+            if batch and (
+                len(batch) >= self.batch_size
+                or batch_length + len(value) + 1 > self.max_query_length
+            ):
+                yield batch
+                batch = []
+                batch_length = len(self.get_query([]))
+            batch.append(value)
+            batch_length += len(value) + 1
+        if batch:
+            yield batch
+
+    def adapt_batch_size(self, sent_count, seconds):
+        """Grow or shrink batch_size based on how long the last query took."""
+        with self.lock:
+            if seconds > self.target_seconds:
+                self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+            elif seconds < self.target_seconds / 2 and sent_count >= self.batch_size:
+                self.batch_size = min(self.max_batch_size, self.batch_size * 2)
+
+    def query_batch(self, batch):
+        """Query one batch of VALUES rows and return the result bindings."""
+        start = time.time()
+        xref_result = self.wd_sparql.query(self.get_query(batch), post=True)
+        self.adapt_batch_size(len(batch), time.time() - start)
+        return xref_result["results"]["bindings"]
+
+    def resolve(self, xrefs, wd_props_by_datasource):
+        """Get Wikidata IDs for xrefs.
+
+        Keyword arguments:
+        xrefs -- iterable of (datasource, identifier) pairs
+        wd_props_by_datasource -- e.g., {"Entrez Gene": "P351"}
+
+        Returns a dict from (datasource, identifier) to a sorted list of
+        Wikidata IDs. The list is empty when Wikidata has no item.
+        """
+        wd_ids_by_xref = dict()
+        values = []
+        for [datasource, identifier] in sorted(set(xrefs)):
+            wd_ids_by_xref[(datasource, identifier)] = set()
+            wd_prop = wd_props_by_datasource[datasource]
+            values.append(
+                f"({sparql_string(datasource)} {sparql_string(identifier)} wdt:{wd_prop})"
+            )
+
+        if not values:
+            return dict()
+
+        # all the batches of this call are sent at once, so a new batch_size
+        # applies from the next call on.
+        batch_futures = [
+            self.executor.submit(self.query_batch, batch)
+            for batch in self.get_batches(values)
+        ]
+        query_count = len(batch_futures)
+        for batch_future in batch_futures:
+            for binding in batch_future.result():
+                xref = (binding["datasource"]["value"], binding["identifier"]["value"])
+                wd_id = binding["item"]["value"].replace(WD_ENTITY_IRI_BASE, "")
+                if xref in wd_ids_by_xref:
+                    wd_ids_by_xref[xref].add(wd_id)
+
+        with self.lock:
+            self.query_count += query_count
+        print(
+            f"Resolved {len(wd_ids_by_xref)} xrefs with {query_count} Wikidata "
+            + f"queries (next batch size: {self.batch_size})"
+        )
+        return {xref: sorted(wd_ids) for xref, wd_ids in wd_ids_by_xref.items()}
+
+
+_wd_sparql = None
+
+
+def get_wd_sparql():
+    """Get the Wikidata SPARQL client for this process, creating it if needed."""
+    global _wd_sparql
+    if _wd_sparql is None:
+        _wd_sparql = WikidataSparql()
+    return _wd_sparql
+
+
+def get_wd_sparql_stats():
+    """Get (query count, seconds spent in queries) for this process's client.
+
+    Doesn't create the client, so it's (0, 0.0) until the first query.
+    """
+    if _wd_sparql is None:
+        return (0, 0.0)
+    return (_wd_sparql.query_count, _wd_sparql.query_seconds)
+
+
+_xref_resolvers = dict()
+
+
+def get_xref_resolver(wd_sparql=None):
+    """Get the xref resolver for a client, creating it if needed.
+
+    Keyword arguments:
+    wd_sparql -- WikidataSparql client (default: shared client)
+    """
+    if wd_sparql is None:
+        wd_sparql = get_wd_sparql()
+    if wd_sparql not in _xref_resolvers:
+        _xref_resolvers[wd_sparql] = XrefResolver(wd_sparql)
+    return _xref_resolvers[wd_sparql]
@@ -0,0 +1,263 @@
+import atexit
+import json
+import os
+from os import path
+import queue
+import shlex
+import shutil
+import struct
+import subprocess
+import sys
+import threading
+
+
+# Each frame is a 4-byte big-endian length followed by that many bytes.
+# A request is two frames: a JSON header like {"args": [...]} and the input
+# bytes. A response is also two frames: a JSON header like {"ok": true} or
+# {"ok": false, "error": "..."} and the output bytes.
+FRAME_HEADER = struct.Struct(">I")
+
+WORKER_POOL_SIZE = int(os.environ.get("WORKER_POOL_SIZE", "2"))
+
+NODE_WORKER_F = path.join(path.dirname(path.realpath(__file__)), "node_worker.js")
+# Node tools that run in node_worker.js workers by default
+NODE_TOOLS = ["gpml2pvjson", "bridgedb", "pvjs"]
+
+
+class WorkerCrashed(Exception):
+    pass
+
+
+def write_frame(f, payload):
+    f.write(FRAME_HEADER.pack(len(payload)))
+    f.write(payload)
+
+
+def read_exactly(f, size):
+    chunks = list()
+    remaining = size
+    while remaining > 0:
+        chunk = f.read(remaining)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+def read_frame(f):
+    """Read one frame, or return None if the stream ended."""
+    header = read_exactly(f, FRAME_HEADER.size)
+    if header is None:
+        return None
+    [size] = FRAME_HEADER.unpack(header)
+    return read_exactly(f, size)
+
+
+class Worker:
+    """One long-lived worker process that speaks the framed protocol."""
+
+    def __init__(self, worker_cmd):
+        self.worker_cmd = worker_cmd
+        self.ps = None
+        self.start()
+
+    def start(self):
+        self.ps = subprocess.Popen(
+            shlex.split(self.worker_cmd),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            shell=False,
+        )
+
+    def stop(self):
+        if self.ps is not None and self.ps.poll() is None:
+            self.ps.stdin.close()
+            try:
+                self.ps.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.ps.kill()
+                self.ps.wait()
+
+    def restart(self):
+        if self.ps is not None and self.ps.poll() is None:
+            self.ps.kill()
+            self.ps.wait()
+        self.start()
+
+    def call(self, args, input_bytes):
+        """Send one request and return the output bytes."""
+        if self.ps.poll() is not None:
+            # it exited since the last request
+            self.start()
+        try:
+            write_frame(self.ps.stdin, json.dumps({"args": args}).encode())
+            write_frame(self.ps.stdin, input_bytes)
+            self.ps.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            raise WorkerCrashed(f"{self.worker_cmd}: {e}")
+
+        header = read_frame(self.ps.stdout)
+        output_bytes = read_frame(self.ps.stdout) if header is not None else None
+        if output_bytes is None:
+            try:
+                returncode = self.ps.wait(timeout=1)
+            except subprocess.TimeoutExpired:
+                returncode = None
+            raise WorkerCrashed(f"{self.worker_cmd} exited with {returncode}")
+
+        response = json.loads(header)
+        if not response.get("ok"):
+            raise Exception(f"{self.worker_cmd} failed: {response.get('error')}")
+        return output_bytes
+
+
+class WorkerPool:
+    """A few long-lived workers for one tool.
+
+    A request goes to the next idle worker. If the worker dies, it is
+    restarted for the next request, but the request that crashed it fails
+    rather than being sent again.
+    """
+
+    def __init__(self, worker_cmd, size=WORKER_POOL_SIZE):
+        self.worker_cmd = worker_cmd
+        self.workers = [Worker(worker_cmd) for i in range(size)]
+        self.idle_workers = queue.Queue()
+        for worker in self.workers:
+            self.idle_workers.put(worker)
+
+    def call(self, args, input_bytes):
+        worker = self.idle_workers.get()
+        try:
+            return worker.call(args, input_bytes)
+        except WorkerCrashed as e:
+            print(f"Worker crashed ({e}). Restarting it.")
+            worker.restart()
+            raise
+        finally:
+            self.idle_workers.put(worker)
+
+    def stop(self):
+        for worker in self.workers:
+            worker.stop()
+
+
+class Tool:
+    """Run a command-line tool that reads stdin and writes stdout.
+
+    When worker_cmd is set, e.g., through the PATHVISIO_WORKER environment
+    variable, requests go to a pool of long-lived workers running that
+    command, which has to speak the framed protocol above, like
+    PathVisioWorker.java or node_worker.js. Otherwise a new process is
+    started for each request.
+    """
+
+    def __init__(self, cmd, worker_cmd=None, pool_size=WORKER_POOL_SIZE):
+        """Keyword arguments:
+        cmd -- command to start per request, e.g., pvjs
+        worker_cmd -- command for a long-lived worker (default: no workers)
+        pool_size -- number of long-lived workers (default 2)
+        """
+        self.cmd = cmd
+        self.worker_cmd = worker_cmd
+        self.pool_size = pool_size
+        self.pool = None
+        self.lock = threading.Lock()
+        self._version = None
+
+    def version(self):
+        """Get the version of the tool, e.g., for build cache keys.
+
+        This is what `cmd --version` prints or, if that fails, the path and
+        modification time of the executable.
+        """
+        if self._version is None:
+            try:
+                ps = subprocess.run(
+                    shlex.split(self.cmd) + ["--version"],
+                    stdin=subprocess.DEVNULL,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.DEVNULL,
+                    timeout=60,
+                )
+                version = ps.stdout.decode().strip() if ps.returncode == 0 else ""
+            except (OSError, subprocess.TimeoutExpired):
+                version = ""
+            if not version:
+                executable = shutil.which(shlex.split(self.cmd)[0])
+                if executable is None:
+                    version = "unknown"
+                else:
+                    executable = path.realpath(executable)
+                    version = f"{executable} {path.getmtime(executable)}"
+            self._version = version
+        return self._version
+
+    def run(self, args, input_bytes):
+        """Run the tool with args on input_bytes and return its stdout."""
+        if self.worker_cmd:
+            with self.lock:
+                if self.pool is None:
+                    self.pool = WorkerPool(self.worker_cmd, size=self.pool_size)
+            return self.pool.call(args, input_bytes)
+
+        ps = subprocess.run(
+            shlex.split(self.cmd) + args,
+            input=input_bytes,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            shell=False,
+        )
+        stderr = ps.stderr.decode(errors="replace")
+        if ps.returncode != 0:
+            raise Exception(f"{self.cmd} failed with {ps.returncode}: {stderr}")
+        # as before, what the tool logs still shows up
+        sys.stderr.write(stderr)
+        return ps.stdout
+
+    def stop(self):
+        if self.pool is not None:
+            self.pool.stop()
+            self.pool = None
+
+
+_tools = dict()
+
+
+def get_node_worker_cmd(cmd):
+    """Get the command for node_worker.js workers running a Node tool, or
+    None if cmd isn't a Node script, e.g., a stand-in, or Node is missing.
+    """
+    node = shutil.which("node")
+    executable = shutil.which(cmd)
+    if node is None or executable is None:
+        return None
+    with open(path.realpath(executable), "rb") as f_in:
+        first_line = f_in.readline()
+    if not (first_line.startswith(b"#!") and b"node" in first_line):
+        return None
+    return " ".join(shlex.quote(arg) for arg in [node, NODE_WORKER_F, executable])
+
+
+def get_tool(cmd):
+    """Get the Tool for a command, e.g., pvjs, creating it if needed.
+
+    The worker command is read from an environment variable named after
+    the command, e.g., PATHVISIO_WORKER. An empty one turns workers off.
+    gpml2pvjson, bridgedb and pvjs run in node_worker.js workers unless
+    their variable is set.
+    """
+    if cmd not in _tools:
+        env_name = cmd.upper().replace("-", "_") + "_WORKER"
+        worker_cmd = os.environ.get(env_name)
+        if worker_cmd is None and cmd in NODE_TOOLS:
+            worker_cmd = get_node_worker_cmd(cmd)
+        _tools[cmd] = Tool(cmd, worker_cmd=worker_cmd)
+    return _tools[cmd]
+
+
+@atexit.register
+def stop_tools():
+    for tool in _tools.values():
+        tool.stop()
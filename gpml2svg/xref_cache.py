@@ -0,0 +1,138 @@
+import os
+from os import path
+import sqlite3
+import threading
+import time
+
+
+DEFAULT_XREF_CACHE_F = path.join(
+    path.expanduser("~"), ".cache", "wikipathways2wiki", "wd_xrefs.sqlite"
+)
+# Wikidata items for well-known identifiers rarely change, but new items
+# get added, so a miss is trusted for less time than a hit.
+DEFAULT_TTL = 30 * 24 * 60 * 60
+DEFAULT_NEGATIVE_TTL = 2 * 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 500000
+
+
+class XrefCache:
+    """On-disk cache of xref to Wikidata item lookups.
+
+    Keyed by (datasource, identifier), e.g., ("Entrez Gene", "1234"). The value
+    is a list of Wikidata IDs, e.g., ["Q14865053"]. An empty list means we
+    asked Wikidata and it had no item for that xref.
+
+    The cache can be used from several threads at once.
+    """
+
+    def __init__(
+        self,
+        cache_f=DEFAULT_XREF_CACHE_F,
+        ttl=DEFAULT_TTL,
+        negative_ttl=DEFAULT_NEGATIVE_TTL,
+        max_entries=DEFAULT_MAX_ENTRIES,
+    ):
+        """Keyword arguments:
+        cache_f -- path of the SQLite file (default ~/.cache/wikipathways2wiki/wd_xrefs.sqlite)
+        ttl -- seconds to keep a found xref (default 30 days)
+        negative_ttl -- seconds to keep a not-found xref (default 2 days)
+        max_entries -- max xrefs to keep; the oldest are evicted first (default 500000)
+        """
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+
+        cache_dir = path.dirname(cache_f)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        # several batch workers can share the same cache file
+        self.conn = sqlite3.connect(cache_f, timeout=60, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS xrefs (
+                datasource TEXT NOT NULL,
+                identifier TEXT NOT NULL,
+                wd_ids TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                PRIMARY KEY (datasource, identifier)
+            )"""
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS xrefs_fetched_at ON xrefs (fetched_at)"
+        )
+        self.conn.commit()
+
+    def get_many(self, xrefs):
+        """Get cached Wikidata IDs for xrefs that are cached and not expired.
+
+        Keyword arguments:
+        xrefs -- iterable of (datasource, identifier) pairs
+
+        Returns a dict from (datasource, identifier) to a list of Wikidata IDs.
+        Xrefs missing from the dict need to be looked up.
+        """
+        now = time.time()
+        wd_ids_by_xref = dict()
+        for [datasource, identifier] in set(xrefs):
+            with self.lock:
+                row = self.conn.execute(
+                    "SELECT wd_ids, fetched_at FROM xrefs WHERE datasource = ? AND identifier = ?",
+                    (datasource, identifier),
+                ).fetchone()
+            if row is None:
+                continue
+            [wd_ids_str, fetched_at] = row
+            wd_ids = wd_ids_str.split()
+            ttl = self.ttl if wd_ids else self.negative_ttl
+            if now - fetched_at < ttl:
+                wd_ids_by_xref[(datasource, identifier)] = wd_ids
+        return wd_ids_by_xref
+
+    def set_many(self, wd_ids_by_xref):
+        """Cache Wikidata IDs for xrefs.
+
+        Keyword arguments:
+        wd_ids_by_xref -- dict from (datasource, identifier) to a list of
+                          Wikidata IDs, which is empty if none were found
+        """
+        if not wd_ids_by_xref:
+            return
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO xrefs VALUES (?, ?, ?, ?)",
+                [
+                    (datasource, identifier, " ".join(sorted(set(wd_ids))), now)
+                    for [datasource, identifier], wd_ids in wd_ids_by_xref.items()
+                ],
+            )
+        self.evict()
+
+    def evict(self):
+        """Remove expired xrefs, then the oldest ones if over max_entries."""
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute(
+                "DELETE FROM xrefs WHERE fetched_at < ? OR (wd_ids = '' AND fetched_at < ?)",
+                (now - self.ttl, now - self.negative_ttl),
+            )
+            [count] = self.conn.execute("SELECT COUNT(*) FROM xrefs").fetchone()
+            if count > self.max_entries:
+                self.conn.execute(
+                    """DELETE FROM xrefs WHERE rowid IN (
+                        SELECT rowid FROM xrefs ORDER BY fetched_at LIMIT ?
+                    )""",
+                    (count - self.max_entries,),
+                )
+
+
+_xref_cache = None
+
+
+def get_xref_cache():
+    """Get the xref cache for this process, creating it if needed."""
+    global _xref_cache
+    if _xref_cache is None:
+        _xref_cache = XrefCache()
+    return _xref_cache
@@ -0,0 +1,25 @@
+# SVG fixes for uploading SVGs from gpml2svg to Wikimedia Commons.
+# svg_fixes.py here links to gpml2svg/svg_fixes.py, so both share one
+# stroke-width pass and send2commons.py still only needs its own directory.
+
+from svg_fixes import set_inherited_stroke_widths
+
+
+SVG_NS = {"svg": "http://www.w3.org/2000/svg", "xlink": "http://www.w3.org/1999/xlink"}
+
+
+def fix_svg_for_commons(root):
+    """Fix up an SVG from gpml2svg for upload to Wikimedia Commons.
+
+    Sets the inherited stroke widths, drops the kaavio black filter and
+    removes the images. Works on xml.etree.ElementTree and lxml trees.
+    """
+    set_inherited_stroke_widths(root)
+
+    for el in root.findall(".//*[@filter='url(#kaavioblackto000000filter)']", SVG_NS):
+        el.attrib.pop("filter", None)
+
+    for image_parent in root.findall(".//*svg:image/..", SVG_NS):
+        images = image_parent.findall("svg:image", SVG_NS)
+        for image in images:
+            image_parent.remove(image)
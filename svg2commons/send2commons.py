@@ -2,21 +2,134 @@
 
 # python3 send2commons.py WP4150 Q50400662 "23:18, 15 August 2019" "signaling pathways,kidney diseases"
 # python3 send2commons.py WP4542 Q66104607 "23:55, 14 June 2019" "Signaling pathways,Immune response,Leukocyte disorders,T cells,Cancers"
+#
+# To upload many pathways in one run, put one JSON object per line in a
+# manifest file and pass it with --manifest:
+#
+# {"wpid": "WP4542", "qid": "Q66104607", "date": "23:55, 14 June 2019", "categories": "Signaling pathways,Immune response"}
+#
+# python3 send2commons.py --manifest pathways.jsonl
 
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import hashlib
+from itertools import islice
+import os
+import sqlite3
 import sys
+import time
 
 import json
 import shlex, subprocess
 
 import pywikibot
+import requests
 from pywikibot.specialbots import UploadRobot
 
 import xml.etree.ElementTree as ET
 
+from commons_svg import fix_svg_for_commons
+
+
+PATHWAY_JSON_DIR = "/data/project/wikipathways2wiki/www/js/public"
+SVGO = "/data/project/wikipathways2wiki/.npm-global/bin/svgo"
+# set to a local mock of the MediaWiki API for testing
+COMMONS_API_URL = os.environ.get(
+    "COMMONS_API_URL", "https://commons.wikimedia.org/w/api.php"
+)
+# seconds to wait between uploads, to stay within Commons rate limits
+UPLOAD_INTERVAL = 10
+# max titles per MediaWiki API query
+SHA1_QUERY_BATCH_SIZE = 50
+COMMONS_LEDGER_F = os.environ.get(
+    "COMMONS_LEDGER_F",
+    os.path.join(
+        os.path.expanduser("~"), ".cache", "wikipathways2wiki", "commons_ledger.sqlite"
+    ),
+)
+
+
+class CommonsLedger:
+    """What we last uploaded to each Commons title.
+
+    Keeps the SHA1 of the file and of the description page text, so a
+    repeat run only sends what changed.
+    """
+
+    def __init__(self, ledger_f=COMMONS_LEDGER_F):
+        """Keyword arguments:
+        ledger_f -- path of the SQLite file (default ~/.cache/wikipathways2wiki/commons_ledger.sqlite)
+        """
+        ledger_dir = os.path.dirname(ledger_f)
+        if ledger_dir:
+            os.makedirs(ledger_dir, exist_ok=True)
+        self.conn = sqlite3.connect(ledger_f, timeout=60)
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS uploads (
+                pagetitle TEXT PRIMARY KEY,
+                file_sha1 TEXT NOT NULL,
+                description_sha1 TEXT NOT NULL,
+                uploaded_at REAL NOT NULL
+            )"""
+        )
+        self.conn.commit()
+
+    def get(self, pagetitle):
+        """Get the (file_sha1, description_sha1) last sent, or None."""
+        return self.conn.execute(
+            "SELECT file_sha1, description_sha1 FROM uploads WHERE pagetitle = ?",
+            (pagetitle,),
+        ).fetchone()
+
+    def set(self, pagetitle, file_sha1, description_sha1):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO uploads VALUES (?, ?, ?, ?)",
+                (pagetitle, file_sha1, description_sha1, time.time()),
+            )
+
+
+_commons_ledger = None
+
+
+def get_commons_ledger():
+    """Get the Commons ledger for this process, creating it if needed."""
+    global _commons_ledger
+    if _commons_ledger is None:
+        _commons_ledger = CommonsLedger()
+    return _commons_ledger
+
 
 def complete_desc_and_upload(
-    filename, pagetitle, desc, date, categories, source, author, wpid, qid
+    filename,
+    pagetitle,
+    desc,
+    date,
+    categories,
+    source,
+    author,
+    wpid,
+    qid,
+    target_site=None,
+    ledger=None,
+    commons_sha1=None,
+    throttle=None,
 ):
+    """Upload the file with its description page, unless they're unchanged.
+
+    The ledger says what was last sent for pagetitle. If only the
+    description changed, just the description page is edited. A file that's
+    already on Commons but not in the ledger is only recorded in it.
+
+    Keyword arguments:
+    target_site -- pywikibot site to upload to (default Commons)
+    ledger -- CommonsLedger (default: shared ledger)
+    commons_sha1 -- SHA1 of the current file on Commons, if known
+    throttle -- function called before anything is sent, e.g., to wait
+
+    Returns "uploaded", "description_updated" or "unchanged". Raises if the
+    upload fails, and then the ledger isn't updated.
+    """
     description = (
         u"""
 == [https://tools.wmflabs.org/pathway-viewer?id="""
@@ -65,7 +178,38 @@ Link above goes to an interactive viewer that allows pan and zoom.
     verifyDescription = (
         False
     )  # set to False to skip double-checking/editing description => change to bot-mode
-    targetSite = pywikibot.getSite("commons", "commons")
+    targetSite = target_site or pywikibot.getSite("commons", "commons")
+
+    if ledger is None:
+        ledger = get_commons_ledger()
+    file_sha1 = get_sha1(filename)
+    description_sha1 = hashlib.sha1(description.encode("utf-8")).hexdigest()
+    last_sent = ledger.get(pagetitle)
+    file_unchanged = commons_sha1 == file_sha1 or (
+        last_sent is not None and last_sent[0] == file_sha1
+    )
+    description_unchanged = last_sent is not None and last_sent[1] == description_sha1
+
+    if last_sent is None and commons_sha1 == file_sha1:
+        # e.g., on the first run with an empty ledger. The file on Commons is
+        # ours, so we take it that its description is too, rather than edit
+        # the description of every file already on Commons.
+        print("{} is already on Commons. Recording it.".format(pagetitle))
+        ledger.set(pagetitle, file_sha1, description_sha1)
+        return "unchanged"
+
+    if file_unchanged and description_unchanged:
+        print("{} is unchanged. Skipping upload.".format(pagetitle))
+        return "unchanged"
+
+    if throttle is not None:
+        throttle()
+
+    if file_unchanged:
+        print("Only the description of {} changed. Editing it.".format(pagetitle))
+        update_description(targetSite, pagetitle, description)
+        ledger.set(pagetitle, file_sha1, description_sha1)
+        return "description_updated"
 
     bot = UploadRobot(
         url,
@@ -75,19 +219,31 @@ Link above goes to an interactive viewer that allows pan and zoom.
         verifyDescription=verifyDescription,
         targetSite=targetSite,
     )
-    bot.run()
+    # run() doesn't say whether the upload went through, e.g., when it was
+    # aborted on a warning, but upload_file returns None unless it did
+    if not bot.upload_file(filename):
+        raise Exception("Failed to upload {} to Commons".format(pagetitle))
+    # uploading a new version of a file leaves its description page as it
+    # was. Without a ledger entry we can't tell a new version from a new file,
+    # so the description is put either way, which is a null edit for a new file.
+    if not description_unchanged:
+        update_description(targetSite, pagetitle, description)
+    ledger.set(pagetitle, file_sha1, description_sha1)
+    return "uploaded"
 
 
-def main(args):
-    wpid = args[0]
-    qid = args[1]
-    date = args[2]
-    additional_categories = [x.strip() for x in args[3].split(",")]
+def update_description(target_site, pagetitle, description):
+    page = pywikibot.FilePage(target_site, "File:" + pagetitle)
+    page.put(description, summary="Update description from WikiPathways")
+
 
+def prepare_upload(wpid, qid, date, additional_categories):
+    """Post-process the SVG for a pathway and put together its description.
+
+    Returns a dict with the keyword arguments for complete_desc_and_upload.
+    """
     pathway_content = dict()
-    with open(
-        "/data/project/wikipathways2wiki/www/js/public/{}.json".format(wpid)
-    ) as pathway_f:
+    with open("{}/{}.json".format(PATHWAY_JSON_DIR, wpid)) as pathway_f:
         pathway_content = json.load(pathway_f)
     pathway_name = pathway_content["pathway"]["name"]
     organism = pathway_content["pathway"]["organism"]
@@ -103,7 +259,6 @@ def main(args):
     filename = "{}.svg".format(wpid)
     pagetitle = "{} ({}).svg".format(pathway_name, organism)
     desc = description
-    date = "23:18, 15 August 2019"
     source = "Published as {0}, revision {1}, at https://www.wikipathways.org/index.php/Pathway:{0}?oldid={1}".format(
         wpid, pathwayVersion
     )
@@ -118,59 +273,240 @@ def main(args):
     for additional_category in additional_categories:
         categories += "[[Category:{}]]".format(additional_category)
 
-    ns = {"svg": "http://www.w3.org/2000/svg", "xlink": "http://www.w3.org/1999/xlink"}
-
     ET.register_namespace("", "http://www.w3.org/2000/svg")
 
     tree = ET.parse(filename)
-    root = tree.getroot()
+    fix_svg_for_commons(tree.getroot())
+
+    processed_filename = filename + ".processed.svg"
+    tree.write(processed_filename)
 
-    style_selector = (
-        "[@style='color:inherit;fill:inherit;fill-opacity:inherit;stroke:inherit;stroke-width:inherit']"
+    args = shlex.split(
+        "{} --multipass --config svgo-config.json {}".format(SVGO, processed_filename)
     )
-    for el_parent in root.findall(".//*{}/..".format(style_selector), ns):
-        stroke_width = el_parent.attrib.get("stroke-width", 1)
-        for el in root.findall(".//*{}".format(style_selector), ns):
-            el.set(
-                "style",
-                "color:inherit;fill:inherit;fill-opacity:inherit;stroke:inherit;stroke-width:{}".format(
-                    str(stroke_width)
-                ),
-            )
+    subprocess.run(args)
 
-    for el in root.findall(".//*[@filter='url(#kaavioblackto000000filter)']", ns):
-        el.attrib.pop("filter", None)
+    return {
+        "filename": processed_filename,
+        "pagetitle": pagetitle,
+        "desc": desc,
+        "date": date,
+        "categories": categories,
+        "source": source,
+        "author": author,
+        "wpid": wpid,
+        "qid": qid,
+    }
 
-    for image_parent in root.findall(".//*svg:image/..", ns):
-        images = image_parent.findall("svg:image", ns)
-        for image in images:
-            image_parent.remove(image)
 
-    processed_filename = filename + ".processed.svg"
-    tree.write(processed_filename)
+def prepare_manifest_entry(entry):
+    """prepare_upload for one manifest entry, catching errors.
 
-    args = shlex.split(
-        "/data/project/wikipathways2wiki/.npm-global/bin/svgo --multipass --config svgo-config.json {}".format(
-            processed_filename
+    Returns a (entry, upload, error) tuple, where upload is None on error.
+    """
+    categories = entry.get("categories", "")
+    if isinstance(categories, str):
+        categories = [x.strip() for x in categories.split(",") if x.strip()]
+    try:
+        upload = prepare_upload(entry["wpid"], entry["qid"], entry["date"], categories)
+        return (entry, upload, None)
+    except Exception as e:
+        return (entry, None, str(e))
+
+
+def get_sha1(filename):
+    with open(filename, "rb") as f_in:
+        return hashlib.sha1(f_in.read()).hexdigest()
+
+
+def get_commons_sha1s(session, pagetitles, api_url=COMMONS_API_URL):
+    """Get the SHA1 of the current revision of each file on Commons.
+
+    Keyword arguments:
+    session -- requests.Session
+    pagetitles -- file names without "File:", e.g., ["Some pathway (Homo sapiens).svg"]
+    api_url -- MediaWiki API (default Commons)
+
+    Returns a dict from pagetitle to SHA1. Files not on Commons are left out.
+    """
+    sha1s = dict()
+    for i in range(0, len(pagetitles), SHA1_QUERY_BATCH_SIZE):
+        titles = [
+            "File:" + pagetitle
+            for pagetitle in pagetitles[i : i + SHA1_QUERY_BATCH_SIZE]
+        ]
+        response = session.get(
+            api_url,
+            params={
+                "action": "query",
+                "prop": "imageinfo",
+                "iiprop": "sha1",
+                "titles": "|".join(titles),
+                "format": "json",
+            },
+            timeout=60,
+        )
+        response.raise_for_status()
+        query = response.json().get("query", {})
+        # the API may change titles, e.g., "_" to " ", so map them back
+        requested_titles = {title: title for title in titles}
+        for normalized in query.get("normalized", []):
+            requested_titles[normalized["to"]] = normalized["from"]
+        for page in query.get("pages", {}).values():
+            imageinfo = page.get("imageinfo")
+            if "missing" in page or not imageinfo:
+                continue
+            title = requested_titles.get(page["title"], page["title"])
+            sha1s[title[len("File:") :]] = imageinfo[0]["sha1"]
+    return sha1s
+
+
+def upload_batch(entries, workers=None, upload_interval=UPLOAD_INTERVAL):
+    """Upload the SVGs for many pathways with one Commons session.
+
+    The SVGs are prepared in parallel, while the uploads go one at a time,
+    in the order the SVGs are ready, at most one per upload_interval
+    seconds. A pathway whose SVG can't be prepared counts as failed, and the
+    others still go. SVGs that are the same as the
+    current revision on Commons are skipped.
+
+    Keyword arguments:
+    entries -- list of dicts with wpid, qid, date and categories
+    workers -- number of processes preparing SVGs (default: number of CPUs)
+    upload_interval -- min seconds between uploads (default 10)
+
+    Returns a dict with lists of uploaded, description_updated, unchanged
+    and failed WPIDs.
+    """
+    summary = {
+        "uploaded": list(),
+        "description_updated": list(),
+        "unchanged": list(),
+        "failed": list(),
+    }
+    session = requests.Session()
+    target_site = pywikibot.getSite("commons", "commons")
+    target_site.login()
+    last_upload_at = None
+
+    def throttle():
+        nonlocal last_upload_at
+        if last_upload_at is not None:
+            wait = upload_interval - (time.time() - last_upload_at)
+            if wait > 0:
+                time.sleep(wait)
+        last_upload_at = time.time()
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # SVGs are prepared in the background, while we upload each one as
+        # soon as it's ready
+        entries_by_future = {
+            executor.submit(prepare_manifest_entry, entry): entry for entry in entries
+        }
+
+        def iter_prepared():
+            for future in as_completed(entries_by_future):
+                entry = entries_by_future[future]
+                try:
+                    yield future.result()
+                except Exception as e:
+                    # the worker process itself died, e.g., killed for using
+                    # too much memory.
+                    yield (entry, None, "{}: {}".format(type(e).__name__, e))
+
+        prepared = iter_prepared()
+        while True:
+            batch = list(islice(prepared, SHA1_QUERY_BATCH_SIZE))
+            if len(batch) == 0:
+                break
+
+            uploads = [upload for [entry, upload, error] in batch if upload]
+            try:
+                commons_sha1s = get_commons_sha1s(
+                    session, [upload["pagetitle"] for upload in uploads]
+                )
+            except (requests.RequestException, ValueError) as e:
+                print("Failed to get SHA1s from Commons ({}). Uploading all.".format(e))
+                commons_sha1s = dict()
+
+            for [entry, upload, error] in batch:
+                wpid = entry.get("wpid")
+                if upload is None:
+                    print("Failed to prepare {}: {}".format(wpid, error))
+                    summary["failed"].append(wpid)
+                    continue
+                try:
+                    status = complete_desc_and_upload(
+                        **upload,
+                        target_site=target_site,
+                        commons_sha1=commons_sha1s.get(upload["pagetitle"]),
+                        throttle=throttle,
+                    )
+                    summary[status].append(wpid)
+                except Exception as e:
+                    print("Failed to upload {}: {}".format(wpid, e))
+                    summary["failed"].append(wpid)
+
+    print(
+        "Uploaded {}, updated description of {}, skipped {} unchanged, failed {}".format(
+            len(summary["uploaded"]),
+            len(summary["description_updated"]),
+            len(summary["unchanged"]),
+            len(summary["failed"]),
         )
     )
-    subprocess.run(args)
+    return summary
+
+
+def main(args):
+    wpid = args[0]
+    qid = args[1]
+    date = args[2]
+    additional_categories = [x.strip() for x in args[3].split(",")]
+
+    complete_desc_and_upload(**prepare_upload(wpid, qid, date, additional_categories))
+
+
+def batch_main(args):
+    parser = argparse.ArgumentParser(
+        description="Upload the SVGs for the pathways in a manifest to Commons"
+    )
+    parser.add_argument(
+        "--manifest",
+        required=True,
+        help="JSON Lines file, one {wpid, qid, date, categories} object per line",
+    )
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        help="Default: number of CPUs. Number of SVGs to prepare at once.",
+    )
+    parser.add_argument(
+        "--upload-interval",
+        type=float,
+        default=UPLOAD_INTERVAL,
+        help="Default: {}. Min seconds between uploads.".format(UPLOAD_INTERVAL),
+    )
+    parsed_args = parser.parse_args(args)
+
+    with open(parsed_args.manifest) as manifest_f:
+        entries = [json.loads(line) for line in manifest_f if line.strip()]
 
-    complete_desc_and_upload(
-        filename=processed_filename,
-        pagetitle=pagetitle,
-        desc=desc,
-        date=date,
-        categories=categories,
-        source=source,
-        author=author,
-        wpid=wpid,
-        qid=qid,
+    summary = upload_batch(
+        entries,
+        workers=parsed_args.workers,
+        upload_interval=parsed_args.upload_interval,
     )
+    if len(summary["failed"]) > 0:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
     try:
-        main(sys.argv[1:])
+        if "--manifest" in sys.argv[1:]:
+            batch_main(sys.argv[1:])
+        else:
+            main(sys.argv[1:])
     finally:
         pywikibot.stopme()
@@ -0,0 +1 @@
+../gpml2svg/svg_fixes.py
\ No newline at end of file